@@ -1,20 +1,171 @@
 import os
 import glob
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import islice
 import numpy as np
 import pandas as pd
 from datetime import datetime, date
-import xmltodict
 import warnings
 warnings.filterwarnings('ignore')
 
-from utils import prepare_char_insertion, prepare_numeric_insertion, get_mysql_conn, get_cust_phone, to_upper, get_mysql_engine, get_prospect
+from utils import get_cust_phones, AsOf_Lookup, Column_Builder, marketing_nameplates, prospect_keys, finwire_quarter, stage_finwire_file, \
+    iter_customer_mgmt, iter_file_chunks, iter_trade_lifecycles, sort_merge_join, CSV_Transformer, Delimited_Reader, \
+    TRADE_SCHEMA, TRADE_HISTORY_SCHEMA, CASH_TRANSACTION_SCHEMA, WATCH_HISTORY_SCHEMA, CUSTOMER_CDC_SCHEMA, ACCOUNT_CDC_SCHEMA, \
+    TRADE_CDC_SCHEMA, CASH_TRANSACTION_CDC_SCHEMA, WATCH_HISTORY_CDC_SCHEMA, to_load_data_row, CUSTOMER_MGMT_FIELDS, get_executor, \
+    Stage_Scheduler, Stage_Journal, file_fingerprint, count_lines
 
 
 
 class TPCDI_Loader():
-    BASE_MYSQL_CMD = ""
-
-    def __init__(self, sf, db_name, config, batch_number, overwrite=False):
+    # Load stages of the historical batch: stage -> (tables it reads, tables it writes).
+    # Tables created in __init__ are not written by any stage, and stages are listed in their preferred start order.
+    STAGES = {
+        "load_current_batch_date": ([], ["batch_date"]),
+        "load_dim_date": ([], ["DimDate"]),
+        "load_dim_time": ([], ["DimTime"]),
+        "load_industry": ([], ["Industry"]),
+        "load_status_type": ([], ["StatusType"]),
+        "load_tax_rate": ([], ["TaxRate"]),
+        "load_trade_type": ([], ["TradeType"]),
+        "load_audit": ([], ["Audit"]),
+        "init_di_messages": ([], ["DImessages"]),
+        "load_staging_customer": ([], ["S_Customer"]),
+        "load_staging_finwire": ([], ["S_Company", "S_Security", "S_Financial"]),
+        "load_staging_prospect": ([], ["S_Prospect"]),
+        "load_staging_broker": ([], ["S_Broker"]),
+        "load_staging_fact_holding": ([], ["s_fact_holding"]),
+        "load_staging_daily_market": ([], ["S_DailyMarketHistory"]),
+        "load_target_dim_company": (["S_Company", "Industry", "StatusType"], ["DimCompany"]),
+        "load_target_financial": (["S_Financial", "DimCompany"], ["Financial"]),
+        "load_target_dim_security": (["S_Security", "StatusType", "DimCompany"], ["DimSecurity"]),
+        "load_prospect": (["S_Prospect", "batch_date", "DImessages"], ["Prospect"]),
+        "load_broker": (["S_Broker", "DimDate"], ["DimBroker"]),
+        "load_target_dim_customer": (["S_Customer", "TaxRate", "Prospect", "DImessages"], ["DimCustomer"]),
+        "load_target_dim_account": (["S_Customer", "DimBroker", "DimCustomer"], ["DimAccount"]),
+        "load_target_dim_trade": (["StatusType", "TradeType", "DimSecurity", "DimAccount", "DimDate", "DimTime"],
+                                  ["DimTrade"]),
+        "load_target_fact_cash_balance": (["DimAccount", "DimDate"], ["FactCashBalances"]),
+        "load_target_fact_holding": (["s_fact_holding", "DimTrade"], ["FactHoldings"]),
+        "load_target_fact_watches": (["DimCustomer", "DimSecurity", "DimDate"], ["FactWatches"]),
+    }
+
+    # Load stages of the incremental batches, applying the changes captured in BatchN to the warehouse already loaded.
+    # Every table they write exists, the scratch tables holding the changes are private to the stage using them.
+    INCREMENTAL_STAGES = {
+        "load_current_batch_date": ([], ["batch_date"]),
+        "load_audit": ([], ["Audit"]),
+        "load_incremental_prospect": (["batch_date"], ["Prospect"]),
+        "load_incremental_dim_customer": (["Prospect"], ["DimCustomer"]),
+        "load_incremental_dim_account": (["DimCustomer"], ["DimAccount"]),
+        "load_incremental_dim_trade": (["DimAccount"], ["DimTrade"]),
+        "load_incremental_fact_cash_balance": (["DimAccount"], ["FactCashBalances"]),
+        "load_incremental_fact_holding": (["DimTrade"], ["FactHoldings"]),
+        "load_incremental_fact_watches": (["DimCustomer"], ["FactWatches"]),
+    }
+
+    # Flat files read by the stages, as patterns relative to the batch directory. They are fingerprinted in the
+    # stage journal, so a resumed load reruns the stages whose files changed.
+    STAGE_FILES = {
+        "load_current_batch_date": ["BatchDate.txt"],
+        "load_dim_date": ["Date.txt"],
+        "load_dim_time": ["Time.txt"],
+        "load_industry": ["Industry.txt"],
+        "load_status_type": ["StatusType.txt"],
+        "load_tax_rate": ["TaxRate.txt"],
+        "load_trade_type": ["TradeType.txt"],
+        "load_audit": ["*_audit.csv"],
+        "load_staging_customer": ["CustomerMgmt.xml"],
+        "load_staging_finwire": ["FINWIRE*"],
+        "load_staging_prospect": ["Prospect.csv"],
+        "load_staging_broker": ["HR.csv"],
+        "load_staging_fact_holding": ["HoldingHistory.txt"],
+        "load_staging_daily_market": ["DailyMarket.txt"],
+        "load_target_dim_customer": ["BatchDate.txt"],
+        "load_target_dim_trade": ["Trade.txt", "TradeHistory.txt"],
+        "load_target_fact_cash_balance": ["CashTransaction.txt"],
+        "load_target_fact_watches": ["WatchHistory.txt"],
+        "load_incremental_prospect": ["Prospect.csv"],
+        "load_incremental_dim_customer": ["BatchDate.txt", "Customer.txt"],
+        "load_incremental_dim_account": ["BatchDate.txt", "Account.txt"],
+        "load_incremental_dim_trade": ["Trade.txt"],
+        "load_incremental_fact_cash_balance": ["CashTransaction.txt"],
+        "load_incremental_fact_holding": ["HoldingHistory.txt"],
+        "load_incremental_fact_watches": ["WatchHistory.txt"],
+    }
+
+    # Undo of an unfinished stage for the rows it adds to tables it does not create, as (table, statement) pairs:
+    # rows of the batch are deleted and the versions or watches it closed reopened. The other incremental stages
+    # (prospects, trades and holdings) merge their changes, rerunning them is enough.
+    STAGE_ROLLBACK = {
+        "load_audit": [("Audit", "DELETE FROM Audit WHERE BatchID = %(batch)s;")],
+        "load_prospect": [
+            ("DImessages", "DELETE FROM DImessages WHERE BatchID = %(batch)s AND MessageSource = 'Prospect';")],
+        "load_target_dim_customer": [
+            ("DImessages", "DELETE FROM DImessages WHERE BatchID = %(batch)s AND MessageSource = 'DimCustomer';")],
+        "load_incremental_prospect": [
+            ("DImessages", "DELETE FROM DImessages WHERE BatchID = %(batch)s AND MessageSource = 'Prospect';")],
+        "load_incremental_dim_customer": [
+            ("DimCustomer", "DELETE FROM DimCustomer WHERE BatchID = %(batch)s;"),
+            ("DimCustomer", "UPDATE DimCustomer SET IsCurrent = TRUE, EndDate = '9999-12-31' WHERE EndDate = '%(date)s';"),
+            ("DImessages", "DELETE FROM DImessages WHERE BatchID = %(batch)s AND MessageSource = 'DimCustomer';")],
+        "load_incremental_dim_account": [
+            ("DimAccount", "DELETE FROM DimAccount WHERE BatchID = %(batch)s;"),
+            ("DimAccount", "UPDATE DimAccount SET IsCurrent = TRUE, EndDate = '9999-12-31' WHERE EndDate = '%(date)s';")],
+        "load_incremental_fact_cash_balance": [
+            ("FactCashBalances", "DELETE FROM FactCashBalances WHERE BatchID = %(batch)s;")],
+        # The watches the batch closed are kept in FactWatches_Undo with their previous BatchID: they are reopened,
+        # the other rows of the batch are the watches it placed
+        "load_incremental_fact_watches": [
+            ("FactWatches_Undo", "DELETE FROM FactWatches WHERE BatchID = %(batch)s AND NOT EXISTS ("
+                                 "SELECT 1 FROM FactWatches_Undo U WHERE U.BatchID = %(batch)s "
+                                 "AND U.SK_CustomerID = FactWatches.SK_CustomerID "
+                                 "AND U.SK_SecurityID = FactWatches.SK_SecurityID "
+                                 "AND U.SK_DateID_DatePlaced = FactWatches.SK_DateID_DatePlaced);"),
+            ("FactWatches_Undo", "UPDATE FactWatches W JOIN FactWatches_Undo U ON U.SK_CustomerID = W.SK_CustomerID "
+                                 "AND U.SK_SecurityID = W.SK_SecurityID "
+                                 "AND U.SK_DateID_DatePlaced = W.SK_DateID_DatePlaced "
+                                 "SET W.SK_DateID_DateRemoved = NULL, W.BatchID = U.PriorBatchID "
+                                 "WHERE U.BatchID = %(batch)s;"),
+            ("FactWatches_Undo", "DELETE FROM FactWatches_Undo WHERE BatchID = %(batch)s;")],
+    }
+
+    # Status of the customer and account versions by the ST_ID of the flat files. The historical load names the
+    # statuses the CustomerMgmt actions set with the same values, so DimCustomer and DimAccount use one vocabulary.
+    ACTIVE, INACTIVE = "ACTIVE", "INACTIVE"
+    STATUS_NAMES = {"ACTV": ACTIVE, "INAC": INACTIVE}
+
+    # Tables with a BatchID column, a stage writing them owns the rows of its batch only: later batches add their rows
+    # and tag the rows they change with their own BatchID
+    BATCH_TABLES = ["Audit", "Prospect", "DimBroker", "DimCompany", "DimSecurity", "DimCustomer", "DimAccount", "DimTrade",
+                    "FactCashBalances", "FactHoldings", "FactWatches"]
+
+    # DImessages is created by init_di_messages and filled by the stages below, each one owns its MessageSource
+    STAGE_MESSAGES = {
+        "load_prospect": "Prospect",
+        "load_target_dim_customer": "DimCustomer",
+        "load_incremental_prospect": "Prospect",
+        "load_incremental_dim_customer": "DimCustomer",
+    }
+
+    # Secondary indexes on the join keys read by downstream stages: table -> indexed column lists.
+    # They are built once the stage writing the table has finished, so bulk loads do not have to maintain them.
+    INDEXES = {
+        "DimDate": [["DateValue"]],
+        "DimTime": [["TimeValue"]],
+        "Industry": [["IN_ID"]],
+        "StatusType": [["ST_ID"]],
+        "TradeType": [["TT_ID"]],
+        "DimCompany": [["Name"]],
+        "DimSecurity": [["Symbol"]],
+        "DimCustomer": [["CustomerID"]],
+        "DimAccount": [["AccountID"]],
+    }
+
+    def __init__(self, sf, db_name, config, batch_number, overwrite=False, pool_size=4, workers=1, resume=False,
+                 metrics=None, engine='mysql'):
         """
     Initialize staging database.
 
@@ -22,54 +173,238 @@ class TPCDI_Loader():
         sf (str): Scale factor to be used in benchmark.
         db_name (str): Name of database schema to which the data will be loaded.    
         config (config list): Config object retrieved from calling ConfigParser().read().
-        batch_number (int): Batch number that going to be processed
+        batch_number (int): Batch number that going to be processed, batch 1 is the historical load creating the
+            database and the next ones are incremental updates of it.
+        pool_size (int): Maximum number of idle database connections kept by the executor.
+        workers (int): Number of processes used to parse flat files.
+        resume (bool): Keep the database of an interrupted load of the batch, see resume().
+        metrics (Stage_Metrics): Receives the measurements of every stage, None to skip measuring.
+        engine (str): Database engine the warehouse is loaded into, 'mysql' for a server or 'sqlite' for an
+            embedded database file (see get_executor).
     """
 
         self.sf = sf
         self.db_name = db_name
         self.batch_number = batch_number
         self.config = config
+        self.workers = workers
+        self.metrics = metrics
         self.batch_dir = "staging/" + self.sf + "/Batch" + str(self.batch_number) + "/"
+        self.plan = TPCDI_Loader.STAGES if self.batch_number == 1 else TPCDI_Loader.INCREMENTAL_STAGES
 
-        # Construct base mysql command (set host, port, and user)
-        TPCDI_Loader.BASE_MYSQL_CMD = "mysql -h " + config['MEMSQL_SERVER']['memsql_host'] + " -u" + \
-                                      config['MEMSQL_SERVER']['memsql_user'] + " -p" + \
-                                      config['MEMSQL_SERVER']['memsql_pswd'] + " -P" + \
-                                      config['MEMSQL_SERVER']['memsql_port']
+        # Connections on the database shared by every load step. The historical batch creates the database,
+        # dropping the existing one when overwrite param is set to True
+        self.executor = get_executor(engine, self.db_name, config, pool_size=pool_size)
+        self.executor.setup_database(create=(self.batch_number == 1), overwrite=overwrite, exists_ok=resume)
 
-        # Drop database if it is exist and overwrite param is set to True
-        if overwrite:
-            drop_db_query = "DROP DATABASE IF EXISTS " + self.db_name
-            drop_db_cmd = TPCDI_Loader.BASE_MYSQL_CMD + " -e '" + drop_db_query + "'"
-            os.system(drop_db_cmd)
+        if self.batch_number == 1:
+            # Insert create batch date table
+            batch_date_ddl = "CREATE TABLE IF NOT EXISTS batch_date(batch_number NUMERIC(3), batch_date DATE);"
+            self.executor.execute(batch_date_ddl)
 
-        db_creation_ddl = "CREATE DATABASE " + self.db_name
+        # Completed stages of the batch, recorded as they finish
+        self.journal = Stage_Journal(self.executor, self.batch_number)
+        self.journal.create()
 
-        # Construct MySQL client bash command and then execute it
-        db_creation_cmd = TPCDI_Loader.BASE_MYSQL_CMD + " -e '" + db_creation_ddl + "'"
-        os.system(db_creation_cmd)
+    def stages(self):
+        """
+    Stages of this loader in the form expected by Stage_Scheduler.
+    """
+        return {name: (partial(self.run_stage, name), inputs, outputs)
+                for name, (inputs, outputs) in self.plan.items()}
 
-        # Insert create batch date table
-        batch_date_ddl = "CREATE TABLE batch_date(batch_number NUMERIC(3), batch_date DATE);"
-        batch_date_creation_cmd = TPCDI_Loader.BASE_MYSQL_CMD + " -D " + self.db_name + " -e \"" + batch_date_ddl + "\""
-        os.system(batch_date_creation_cmd)
+    def run_stage(self, name):
+        """
+    Run one load stage, then index the tables it created and record it in the journal. Incremental stages only write
+    tables that are already indexed.
 
-        # Enable infile load
-        batch_date_ddl = "SET GLOBAL local_infile=1;"
-        batch_date_creation_cmd = TPCDI_Loader.BASE_MYSQL_CMD + " -e \"" + batch_date_ddl + "\""
-        os.system(batch_date_creation_cmd)
+    With metrics, the stage is measured: wall time, CPU time of the thread running it (worker processes and the
+    database server are left out), rows read (lines of its flat files and rows of its input tables), rows written
+    (net rows added to its output tables), bytes read from its flat files and rows written per second.
+    """
+        inputs, outputs = self.plan[name]
+        if self.metrics is not None:
+            rows_before = self.journal.count_rows(inputs + outputs)
+        start, cpu_start = time.time(), time.thread_time()
+
+        getattr(self, name)()
+        if self.batch_number == 1:
+            self.build_indexes(outputs)
+
+        wall_time, cpu_time = time.time() - start, time.thread_time() - cpu_start
+        self.journal.record(name, self.stage_fingerprint(name), self.owned_row_counts(name))
+
+        if self.metrics is not None:
+            row_counts = self.journal.count_rows(outputs)
+            files = self.stage_files(name)
+            rows_written = sum((row_counts[table] or 0) - (rows_before[table] or 0) for table in outputs)
+            self.metrics.record(name, batch=self.batch_number, wall_time=wall_time, cpu_time=cpu_time,
+                                rows_read=count_lines(files) + sum(rows_before[table] or 0 for table in inputs),
+                                rows_written=rows_written, bytes_read=sum(os.path.getsize(path) for path in files),
+                                rows_per_second=rows_written / wall_time if wall_time > 0 else None)
+
+    def stage_files(self, name):
+        """
+    Paths of the flat files a stage reads.
+    """
+        return [path for pattern in TPCDI_Loader.STAGE_FILES.get(name, [])
+                for path in sorted(glob.glob(self.batch_dir + pattern))]
 
-        # Enable infile load
-        sql_model_ddl = "SET GLOBAL sql_mode = 'NO_ENGINE_SUBSTITUTION';"
-        batch_date_creation_cmd = TPCDI_Loader.BASE_MYSQL_CMD + " -e \"" + sql_model_ddl + "\""
-        os.system(batch_date_creation_cmd)
+    def stage_fingerprint(self, name):
+        """
+    Fingerprint of the flat files a stage reads.
+    """
+        return file_fingerprint(self.stage_files(name))
 
-    def load_current_batch_date(self):
+    def owned_row_counts(self, name):
+        """
+    Row counts of the rows a stage owns in the tables it writes, as journaled: the rows of the batch in BATCH_TABLES
+    and the messages of the stage in DImessages, so the rows other stages and later batches add are left out.
+    """
+        tables = list(self.plan[name][1])
+        conditions = {table: "BatchID = %i" % self.batch_number for table in tables if table in TPCDI_Loader.BATCH_TABLES}
+        if name in TPCDI_Loader.STAGE_MESSAGES:
+            tables.append("DImessages")
+            conditions["DImessages"] = "BatchID = %i AND MessageSource = '%s'" % (
+                self.batch_number, TPCDI_Loader.STAGE_MESSAGES[name])
+        elif "DImessages" in tables:
+            # The stage creating DImessages owns none of the messages written by the others
+            conditions["DImessages"] = "MessageSource NOT IN (%s)" % ", ".join(
+                "'%s'" % source for source in sorted(set(TPCDI_Loader.STAGE_MESSAGES.values())))
+        return self.journal.count_rows(tables, conditions)
+
+    def resume(self):
+        """
+    Prepare the resumption of an interrupted load of the batch. Stages the journal records with the same input files
+    and owned row counts (see owned_row_counts) as now are complete, every other stage and the stages reading its
+    tables are reset: the tables a historical stage creates are dropped, and the rows an incremental stage added are
+    rolled back. A batch is never reset once a later batch has started, all its stages are complete.
+    Returns the names of the complete stages, to be skipped.
+    """
+        if self.journal.later_batches():
+            return set(self.plan)
+
+        entries = self.journal.entries()
+        complete = set()
+        for name in self.plan:
+            if name not in entries:
+                continue
+            row_counts = self.owned_row_counts(name)
+            if None not in row_counts.values() and entries[name] == (self.stage_fingerprint(name), row_counts):
+                complete.add(name)
+
+        # A stage reading the tables of a stage that reruns has to rerun as well
+        dependencies = Stage_Scheduler(self.stages()).dependencies()
+        stale = {name for name in complete if dependencies[name] - complete}
+        while stale:
+            complete -= stale
+            stale = {name for name in complete if dependencies[name] - complete}
+
+        rerun = [name for name in self.plan if name not in complete]
+        self.journal.forget(rerun)
+        for name in rerun:
+            self.reset_stage(name)
+        return complete
+
+    def reset_stage(self, name):
+        """
+    Remove what an unfinished stage may have written, so it can run again.
+    """
+        if self.batch_number == 1:
+            # Historical stages create the tables they write, but for batch_date which is created with the database
+            tables = [table for table in self.plan[name][1] if table != "batch_date"]
+            if tables:
+                self.executor.execute("DROP TABLE IF EXISTS " + ", ".join(tables) + ";")
+
+        rollback = TPCDI_Loader.STAGE_ROLLBACK.get(name, [])
+        if rollback:
+            existing = {table.lower() for table in self.journal.existing_tables()}
+            values = {"batch": self.batch_number, "date": self.current_batch_date()}
+            statements = [statement % values for table, statement in rollback if table.lower() in existing]
+            if statements:
+                self.executor.execute("\n".join(statements))
+
+    def build_indexes(self, tables):
+        """
+    Create the secondary indexes declared in INDEXES for the given tables, reporting the time it took.
+    """
+        index_ddl = "".join("CREATE INDEX idx_%s_%s ON %s (%s);\n" % (table, "_".join(columns), table, ", ".join(columns))
+                            for table in tables for columns in TPCDI_Loader.INDEXES.get(table, []))
+        if not index_ddl:
+            return
+
+        start = time.time()
+        self.executor.execute(index_ddl)
+        print("+----- indexes of %s built in: %s" % (", ".join(tables), time.time() - start))
+
+    def current_batch_date(self):
+        """
+    Date of the batch being processed, as written in its BatchDate.txt ('YYYY-MM-DD').
+    """
         with open(self.batch_dir + "BatchDate.txt", "r") as batch_date_file:
-            batch_date_loading_query = "INSERT INTO batch_date VALUES (%i, STR_TO_DATE('%s','%s'));" % (
-                self.batch_number, batch_date_file.read().strip(), "%Y-%m-%d")
-            batch_date_loading_cmd = TPCDI_Loader.BASE_MYSQL_CMD + " -D " + self.db_name + " -e \"" + batch_date_loading_query + "\""
-            os.system(batch_date_loading_cmd)
+            return batch_date_file.read().strip()
+
+    def next_surrogate_key(self, table, column):
+        """
+    First surrogate key not used yet by the versions of a dimension, new versions are numbered from it.
+    """
+        query = "SELECT COALESCE(MAX(%s) + 1, 0) AS NextKey FROM %s" % (column, table)
+        return int(self.executor.read_frame(query)["NextKey"][0])
+
+    def close_versions(self, table, key, ids, end_date):
+        """
+    End the current version of the given natural keys of a type 2 dimension on end_date. The keys are bulk loaded
+    into a scratch table, so all versions are closed by a single joined update.
+
+    Args:
+        table (str): Dimension table.
+        key (str): Natural key column of the dimension.
+        ids (iterable): Natural keys whose current version is closed, keys without one are ignored.
+        end_date (str): EndDate of the closed versions ('YYYY-MM-DD').
+    """
+        scratch = "S_Closed_" + table
+        self.executor.execute("DROP TABLE IF EXISTS %s; CREATE TABLE %s (%s BIGINT NOT NULL PRIMARY KEY);" % (
+            scratch, scratch, key))
+        self.executor.load_frame(pd.DataFrame({key: pd.unique(np.asarray(ids, dtype=np.int64))}), scratch)
+        self.executor.execute("""
+        UPDATE %s T JOIN %s C ON T.%s = C.%s
+        SET T.IsCurrent = FALSE, T.EndDate = '%s'
+        WHERE T.IsCurrent;
+        DROP TABLE %s;
+        """ % (table, scratch, key, key, end_date, scratch))
+
+    def end_superseded_versions(self, table, surrogate_key, key):
+        """
+    End every version of a type 2 dimension on the EffectiveDate of the next version of its natural key. The next
+    dates are found in pandas and bulk loaded into a scratch table, so all versions are ended by a single joined update.
+
+    Args:
+        table (str): Dimension table.
+        surrogate_key (str): Surrogate key column of the dimension.
+        key (str): Natural key column of the dimension.
+    """
+        versions = self.executor.read_frame("SELECT %s, %s, EffectiveDate FROM %s" % (surrogate_key, key, table))
+        versions = versions.sort_values([key, "EffectiveDate", surrogate_key])
+        versions["EndDate"] = versions.groupby(key)["EffectiveDate"].shift(-1)
+        superseded = versions.dropna(subset=["EndDate"])
+        superseded = pd.DataFrame({surrogate_key: superseded[surrogate_key].astype(np.int64),
+                                   "EndDate": pd.to_datetime(superseded["EndDate"]).dt.strftime("%Y-%m-%d")})
+
+        scratch = "S_Superseded_" + table
+        self.executor.execute("DROP TABLE IF EXISTS %s; CREATE TABLE %s (%s BIGINT NOT NULL PRIMARY KEY, EndDate DATE);" % (
+            scratch, scratch, surrogate_key))
+        self.executor.load_frame(superseded, scratch)
+        self.executor.execute("""
+        UPDATE %s T JOIN %s C ON T.%s = C.%s
+        SET T.EndDate = C.EndDate, T.IsCurrent = FALSE;
+        DROP TABLE %s;
+        """ % (table, scratch, surrogate_key, surrogate_key, scratch))
+
+    def load_current_batch_date(self):
+        batch_date_loading_query = "DELETE FROM batch_date WHERE batch_number = %i;" % self.batch_number
+        batch_date_loading_query += "INSERT INTO batch_date VALUES (%i, STR_TO_DATE('%s','%s'));" % (
+            self.batch_number, self.current_batch_date(), "%Y-%m-%d")
+        self.executor.execute(batch_date_loading_query)
 
     def load_dim_date(self):
         """
@@ -102,16 +437,9 @@ class TPCDI_Loader():
     );
     """
 
-        # Create query to load text data into dimDate table
-        dimDate_load_query = "LOAD DATA LOCAL INFILE 'staging/" + self.sf + "/Batch1/Date.txt' INTO TABLE DimDate COLUMNS TERMINATED BY '|';"
-
-        # Construct mysql client bash command to execute ddl and data loading query
-        dimDate_ddl_cmd = TPCDI_Loader.BASE_MYSQL_CMD + " -D " + self.db_name + " -e \"" + dimDate_ddl + "\""
-        dimDate_load_cmd = TPCDI_Loader.BASE_MYSQL_CMD + " --local-infile=1 -D " + self.db_name + " -e \"" + dimDate_load_query + "\""
-
-        # Execute the command
-        os.system(dimDate_ddl_cmd)
-        os.system(dimDate_load_cmd)
+        # Execute the ddl and data loading query
+        self.executor.execute(dimDate_ddl)
+        self.executor.load_file(self.batch_dir + "Date.txt", "DimDate")
 
     def init_di_messages(self):
         """
@@ -123,7 +451,7 @@ class TPCDI_Loader():
     USE """ + self.db_name + """;
 
     CREATE TABLE DImessages (
-      MessageDateAndTime TIMESTAMP NOT NULL,
+      MessageDateAndTime TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
 			BatchID NUMERIC(5) NOT NULL,
 			MessageSource CHAR(30),
 			MessageText CHAR(50) NOT NULL,
@@ -132,8 +460,7 @@ class TPCDI_Loader():
     );
     """
 
-        diMessages_ddl_cmd = TPCDI_Loader.BASE_MYSQL_CMD + " -D " + self.db_name + " -e \"" + diMessages_ddl + "\""
-        os.system(diMessages_ddl_cmd)
+        self.executor.execute(diMessages_ddl)
 
     def load_dim_time(self):
         """
@@ -158,16 +485,9 @@ class TPCDI_Loader():
     );
     """
 
-        # Create query to load text data into dimTime table
-        dimTime_load_query = "LOAD DATA LOCAL INFILE 'staging/" + self.sf + "/Batch1/Time.txt' INTO TABLE DimTime COLUMNS TERMINATED BY '|';"
-
-        # Construct mysql client bash command to execute ddl and data loading query
-        dimTime_ddl_cmd = TPCDI_Loader.BASE_MYSQL_CMD + " -D " + self.db_name + " -e \"" + dimTime_ddl + "\""
-        dimTime_load_cmd = TPCDI_Loader.BASE_MYSQL_CMD + " --local-infile=1 -D " + self.db_name + " -e \"" + dimTime_load_query + "\""
-
-        # Execute the command
-        os.system(dimTime_ddl_cmd)
-        os.system(dimTime_load_cmd)
+        # Execute the ddl and data loading query
+        self.executor.execute(dimTime_ddl)
+        self.executor.load_file(self.batch_dir + "Time.txt", "DimTime")
 
     def load_industry(self):
         """
@@ -185,16 +505,9 @@ class TPCDI_Loader():
     );
     """
 
-        # Create query to load text data into industry table
-        industry_load_query = "LOAD DATA LOCAL INFILE 'staging/" + self.sf + "/Batch1/Industry.txt' INTO TABLE Industry COLUMNS TERMINATED BY '|';"
-
-        # Construct mysql client bash command to execute ddl and data loading query
-        industry_ddl_cmd = TPCDI_Loader.BASE_MYSQL_CMD + " -D " + self.db_name + " -e \"" + industry_ddl + "\""
-        industry_load_cmd = TPCDI_Loader.BASE_MYSQL_CMD + " --local-infile=1 -D " + self.db_name + " -e \"" + industry_load_query + "\""
-
-        # Execute the command
-        os.system(industry_ddl_cmd)
-        os.system(industry_load_cmd)
+        # Execute the ddl and data loading query
+        self.executor.execute(industry_ddl)
+        self.executor.load_file(self.batch_dir + "Industry.txt", "Industry")
 
     def load_status_type(self):
         """
@@ -211,16 +524,9 @@ class TPCDI_Loader():
     );
     """
 
-        # Create query to load text data into statusType table
-        statusType_load_query = "LOAD DATA LOCAL INFILE 'staging/" + self.sf + "/Batch1/StatusType.txt' INTO TABLE StatusType COLUMNS TERMINATED BY '|';"
-
-        # Construct mysql client bash command to execute ddl and data loading query
-        statusType_ddl_cmd = TPCDI_Loader.BASE_MYSQL_CMD + " -D " + self.db_name + " -e \"" + statusType_ddl + "\""
-        statusType_load_cmd = TPCDI_Loader.BASE_MYSQL_CMD + " --local-infile=1 -D " + self.db_name + " -e \"" + statusType_load_query + "\""
-
-        # Execute the command
-        os.system(statusType_ddl_cmd)
-        os.system(statusType_load_cmd)
+        # Execute the ddl and data loading query
+        self.executor.execute(statusType_ddl)
+        self.executor.load_file(self.batch_dir + "StatusType.txt", "StatusType")
 
     def load_tax_rate(self):
         """
@@ -238,16 +544,9 @@ class TPCDI_Loader():
     );
     """
 
-        # Create query to load text data into taxRate table
-        taxRate_load_query = "LOAD DATA LOCAL INFILE 'staging/" + self.sf + "/Batch1/TaxRate.txt' INTO TABLE TaxRate COLUMNS TERMINATED BY '|';"
-
-        # Construct mysql client bash command to execute ddl and data loading query
-        taxRate_ddl_cmd = TPCDI_Loader.BASE_MYSQL_CMD + " -D " + self.db_name + " -e \"" + taxRate_ddl + "\""
-        taxRate_load_cmd = TPCDI_Loader.BASE_MYSQL_CMD + " --local-infile=1 -D " + self.db_name + " -e \"" + taxRate_load_query + "\""
-
-        # Execute the command
-        os.system(taxRate_ddl_cmd)
-        os.system(taxRate_load_cmd)
+        # Execute the ddl and data loading query
+        self.executor.execute(taxRate_ddl)
+        self.executor.load_file(self.batch_dir + "TaxRate.txt", "TaxRate")
 
     def load_trade_type(self):
         """
@@ -266,16 +565,9 @@ class TPCDI_Loader():
     );
     """
 
-        # Create query to load text data into tradeType table
-        tradeType_load_query = "LOAD DATA LOCAL INFILE 'staging/" + self.sf + "/Batch1/TradeType.txt' INTO TABLE TradeType COLUMNS TERMINATED BY '|';"
-
-        # Construct mysql client bash command to execute ddl and data loading query
-        tradeType_ddl_cmd = TPCDI_Loader.BASE_MYSQL_CMD + " -D " + self.db_name + " -e \"" + tradeType_ddl + "\""
-        tradeType_load_cmd = TPCDI_Loader.BASE_MYSQL_CMD + " --local-infile=1 -D " + self.db_name + " -e \"" + tradeType_load_query + "\""
-
-        # Execute the command
-        os.system(tradeType_ddl_cmd)
-        os.system(tradeType_load_cmd)
+        # Execute the ddl and data loading query
+        self.executor.execute(tradeType_ddl)
+        self.executor.load_file(self.batch_dir + "TradeType.txt", "TradeType")
 
     def load_staging_customer(self):
         """
@@ -326,181 +618,13 @@ class TPCDI_Loader():
     );
     """
 
-        # Construct mysql client bash command to execute ddl and data loading query
-        customer_ddl_cmd = TPCDI_Loader.BASE_MYSQL_CMD + " -D " + self.db_name + " -e \"" + customer_ddl + "\""
+        # Execute the ddl and data loading query
+        self.executor.execute(customer_ddl)
 
-        # Execute the command
-        os.system(customer_ddl_cmd)
-
-        s_customer_base_query = "INSERT INTO S_Customer VALUES "
-        s_customer_values = []
-        max_packet = 150
-
-        with open("staging/" + self.sf + "/Batch1/CustomerMgmt.xml") as fd:
-            doc = xmltodict.parse(fd.read())
-            actions = doc['TPCDI:Actions']['TPCDI:Action']
-            for action in actions:
-                ActionType = prepare_char_insertion(action['@ActionType'])
-                ActionTS = prepare_char_insertion(action['@ActionTS'])
-                C_ID = prepare_numeric_insertion(action['Customer']['@C_ID'])
-                C_TAX_ID = C_GNDR = C_L_NAME = C_F_NAME = C_M_NAME = C_ADLINE1 = C_ADLINE2 = C_ZIPCODE = C_CITY = C_STATE_PROV = C_CTRY = "''"
-                C_TIER = -1
-                try:
-                    C_TAX_ID = prepare_char_insertion(action['Customer']['@C_TAX_ID'])
-                except:
-                    pass
-                try:
-                    C_GNDR = prepare_char_insertion(action['Customer']['@C_GNDR'])
-                except:
-                    pass
-                try:
-                    C_TIER = prepare_numeric_insertion(action['Customer']['@C_TIER'])
-                except:
-                    pass
-                try:
-                    C_DOB = prepare_char_insertion(action['Customer']['@C_DOB'])
-                except:
-                    pass
-                try:
-                    C_L_NAME = prepare_char_insertion(action['Customer']['Name']['C_L_NAME'])
-                except:
-                    pass
-                try:
-                    C_F_NAME = prepare_char_insertion(action['Customer']['Name']['C_F_NAME'])
-                except:
-                    pass
-                try:
-                    C_M_NAME = prepare_char_insertion(action['Customer']['Name']['C_M_NAME'])
-                except:
-                    pass
-                try:
-                    C_ADLINE1 = prepare_char_insertion(action['Customer']['Address']['C_ADLINE1'])
-                except:
-                    pass
-                try:
-                    C_ADLINE2 = prepare_char_insertion(action['Customer']['Address']['C_ADLINE2'])
-                except:
-                    pass
-                try:
-                    C_ZIPCODE = prepare_char_insertion(action['Customer']['Address']['C_ADLINE2'])
-                except:
-                    pass
-                try:
-                    C_CITY = prepare_char_insertion(action['Customer']['Address']['C_CITY'])
-                except:
-                    pass
-                try:
-                    C_STATE_PROV = prepare_char_insertion(action['Customer']['Address']['C_STATE_PROV'])
-                except:
-                    pass
-                try:
-                    C_CTRY = prepare_char_insertion(action['Customer']['Address']['C_CTRY'])
-                except:
-                    pass
-                C_PRIM_EMAIL = C_ALT_EMAIL = C_PHONE_1_C_CTRY_CODE = C_PHONE_1_C_AREA_CODE = C_PHONE_1_C_LOCAL = C_PHONE_2_C_CTRY_CODE = C_PHONE_2_C_AREA_CODE = C_PHONE_2_C_LOCAL = C_PHONE_3_C_CTRY_CODE = C_PHONE_3_C_AREA_CODE = C_PHONE_3_C_LOCAL = C_PHONE_1_C_EXT = C_PHONE_2_C_EXT = C_PHONE_3_C_EXT = "NULL"
-                try:
-                    C_PRIM_EMAIL = prepare_char_insertion(action['Customer']['ContactInfo']['C_PRIM_EMAIL'])
-                except:
-                    pass
-                try:
-                    C_ALT_EMAIL = prepare_char_insertion(action['Customer']['ContactInfo']['C_ALT_EMAIL'])
-                except:
-                    pass
-                try:
-                    C_PHONE_1_C_EXT = prepare_char_insertion(action['Customer']['ContactInfo']['C_PHONE_1']['C_EXT'])
-                except:
-                    pass
-                try:
-                    C_PHONE_1_C_LOCAL = prepare_char_insertion(
-                        action['Customer']['ContactInfo']['C_PHONE_1']['C_LOCAL'])
-                except:
-                    pass
-                try:
-                    C_PHONE_1_C_AREA_CODE = prepare_char_insertion(
-                        action['Customer']['ContactInfo']['C_PHONE_1']['C_AREA_CODE'])
-                except:
-                    pass
-                try:
-                    C_PHONE_1_C_CTRY_CODE = prepare_char_insertion(
-                        action['Customer']['ContactInfo']['C_PHONE_1']['C_CTRY_CODE'])
-                except:
-                    pass
-                try:
-                    C_PHONE_2_C_EXT = prepare_char_insertion(action['Customer']['ContactInfo']['C_PHONE_2']['C_EXT'])
-                except:
-                    pass
-                try:
-                    C_PHONE_2_C_LOCAL = prepare_char_insertion(
-                        action['Customer']['ContactInfo']['C_PHONE_2']['C_LOCAL'])
-                except:
-                    pass
-                try:
-                    C_PHONE_2_C_AREA_CODE = prepare_char_insertion(
-                        action['Customer']['ContactInfo']['C_PHONE_2']['C_AREA_CODE'])
-                except:
-                    pass
-                try:
-                    C_PHONE_2_C_CTRY_CODE = prepare_char_insertion(
-                        action['Customer']['ContactInfo']['C_PHONE_2']['C_CTRY_CODE'])
-                except:
-                    pass
-                try:
-                    C_PHONE_3_C_EXT = prepare_char_insertion(action['Customer']['ContactInfo']['C_PHONE_3']['C_EXT'])
-                except:
-                    pass
-                try:
-                    C_PHONE_3_C_LOCAL = prepare_char_insertion(
-                        action['Customer']['ContactInfo']['C_PHONE_3']['C_LOCAL'])
-                except:
-                    pass
-                try:
-                    C_PHONE_3_C_AREA_CODE = prepare_char_insertion(
-                        action['Customer']['ContactInfo']['C_PHONE_3']['C_AREA_CODE'])
-                except:
-                    pass
-                try:
-                    C_PHONE_3_C_CTRY_CODE = prepare_char_insertion(
-                        action['Customer']['ContactInfo']['C_PHONE_3']['C_CTRY_CODE'])
-                except:
-                    pass
-                C_LCL_TX_ID = C_NAT_TX_ID = "NULL"
-                try:
-                    C_LCL_TX_ID = prepare_char_insertion(action['Customer']['TaxInfo']['C_LCL_TX_ID'])
-                    C_NAT_TX_ID = prepare_char_insertion(action['Customer']['TaxInfo']['C_NAT_TX_ID'])
-                except:
-                    pass
-                CA_ID = 0
-                try:
-                    CA_ID = prepare_numeric_insertion(action['Customer']['Account']['@CA_ID'])
-                except:
-                    pass
-                CA_TAX_ST = "NULL"
-                try:
-                    CA_TAX_ST = prepare_numeric_insertion(action['Customer']['Account']['@CA_TAX_ST'])
-                except:
-                    pass
-                CA_B_ID = "NULL"
-                try:
-                    CA_B_ID = prepare_numeric_insertion(action['Customer']['Account']['CA_B_ID'])
-                except:
-                    pass
-                CA_NAME = "NULL"
-                try:
-                    CA_NAME = prepare_char_insertion(action['Customer']['Account']['CA_NAME'])
-                except:
-                    pass
-
-                s_customer_values.append(
-                    f"({ActionType}, {ActionTS}, {C_ID}, {C_TAX_ID}, {C_GNDR}, {C_TIER}, {C_DOB}, {C_L_NAME}, {C_F_NAME}, {C_M_NAME}, {C_ADLINE1}, {C_ADLINE2}, {C_ZIPCODE}, {C_CITY}, {C_STATE_PROV}, {C_CTRY}, {C_PRIM_EMAIL}, {C_ALT_EMAIL}, {C_PHONE_1_C_CTRY_CODE}, {C_PHONE_1_C_AREA_CODE}, {C_PHONE_1_C_LOCAL}, {C_PHONE_1_C_EXT}, {C_PHONE_2_C_CTRY_CODE}, {C_PHONE_2_C_AREA_CODE}, {C_PHONE_2_C_LOCAL}, {C_PHONE_2_C_EXT}, {C_PHONE_3_C_CTRY_CODE}, {C_PHONE_3_C_AREA_CODE}, {C_PHONE_3_C_LOCAL}, {C_PHONE_3_C_EXT}, {C_LCL_TX_ID}, {C_NAT_TX_ID}, {CA_ID}, {CA_TAX_ST}, {CA_B_ID}, {CA_NAME})")
-                if len(s_customer_values) >= max_packet:
-                    # Create query to load text data into tradeType table
-                    s_customer_load_query = s_customer_base_query + ','.join(s_customer_values)
-                    s_customer_values = []
-                    # Construct mysql client bash command to execute ddl and data loading query
-                    s_customer_load_cmd = TPCDI_Loader.BASE_MYSQL_CMD + " -D " + self.db_name + " -e \"" + s_customer_load_query + "\""
-
-                    # Execute the command
-                    os.system(s_customer_load_cmd)
+        # Rows are streamed to the server while the document is still being parsed, one action at a time
+        columns = [column for column, _, _, _ in CUSTOMER_MGMT_FIELDS]
+        rows = iter_customer_mgmt("staging/" + self.sf + "/Batch1/CustomerMgmt.xml")
+        self.executor.load_stream((to_load_data_row(row) for row in rows), "S_Customer", columns=columns)
 
     def load_staging_broker(self):
         """
@@ -524,16 +648,9 @@ class TPCDI_Loader():
     );
     """
 
-        # Create query to load text data into broker table
-        broker_load_query = "LOAD DATA LOCAL INFILE 'staging/" + self.sf + "/Batch1/HR.csv' INTO TABLE S_Broker COLUMNS TERMINATED BY ',';"
-
-        # Construct mysql client bash command to execute ddl and data loading query
-        broker_ddl_cmd = TPCDI_Loader.BASE_MYSQL_CMD + " -D " + self.db_name + " -e \"" + broker_ddl + "\""
-        broker_load_cmd = TPCDI_Loader.BASE_MYSQL_CMD + " --local-infile=1 -D " + self.db_name + " -e \"" + broker_load_query + "\""
-
-        # Execute the command
-        os.system(broker_ddl_cmd)
-        os.system(broker_load_cmd)
+        # Execute the ddl and data loading query
+        self.executor.execute(broker_ddl)
+        self.executor.load_file(self.batch_dir + "HR.csv", "S_Broker", delimiter=',')
 
     def load_broker(self):
         """
@@ -562,9 +679,8 @@ class TPCDI_Loader():
     """
 
         # Create query to load text data into broker table
-        dim_broker_ddl_cmd = TPCDI_Loader.BASE_MYSQL_CMD + " -D " + self.db_name + " -e \"" + dim_broker_ddl + "\""
         # Execute the command
-        os.system(dim_broker_ddl_cmd)
+        self.executor.execute(dim_broker_ddl)
 
         load_dim_broker_query = """
       INSERT INTO DimBroker (BrokerID,ManagerID,FirstName,LastName,MiddleInitial,Branch,Office,Phone,IsCurrent,BatchID,EffectiveDate,EndDate)
@@ -572,64 +688,7 @@ class TPCDI_Loader():
       FROM S_Broker SB
       WHERE SB.EmployeeJobCode = 314;
     """
-        load_dim_broker_cmd = dim_broker_ddl_cmd = TPCDI_Loader.BASE_MYSQL_CMD + " -D " + self.db_name + " -e \"" + load_dim_broker_query + "\""
-        os.system(load_dim_broker_cmd)
-
-    def load_staging_cash_balances(self):
-        """
-    Create S_Cash_Balances table in the staging database and then load rows in CashTransaction.txt into it.
-    """
-
-        # Create ddl to store cash balances
-        cash_balances_ddl = """
-    USE """ + self.db_name + """;
-
-    CREATE TABLE S_Cash_Balances(
-      CT_CA_ID INTEGER NOT NULL,
-      CT_DTS DATE NOT NULL,
-      CT_AMT CHAR(20) NOT NULL,
-      CT_NAME CHAR(100) NOT NULL
-    );
-    """
-
-        # Create query to load text data into prospect table
-        cash_balances_load_query = "LOAD DATA LOCAL INFILE 'staging/" + self.sf + "/Batch1/CashTransaction.txt' INTO TABLE S_Cash_Balances COLUMNS TERMINATED BY '|';"
-
-        # Construct mysql client bash command to execute ddl and data loading query
-        cash_balances_ddl_cmd = TPCDI_Loader.BASE_MYSQL_CMD + " -D " + self.db_name + " -e \"" + cash_balances_ddl + "\""
-        cash_balances_load_cmd = TPCDI_Loader.BASE_MYSQL_CMD + " --local-infile=1 -D " + self.db_name + " -e \"" + cash_balances_load_query + "\""
-
-        # Execute the command
-        os.system(cash_balances_ddl_cmd)
-        os.system(cash_balances_load_cmd)
-
-    def load_staging_watches(self):
-        """
-    Create S_Watches table in the staging database and then load rows in WatchHistory.txt into it.
-    """
-
-        # Create ddl to store watches
-        watches_ddl = """
-    USE """ + self.db_name + """;
-
-    CREATE TABLE S_Watches(
-      W_C_ID INTEGER NOT NULL,
-      W_S_SYMB CHAR(15) NOT NULL,
-      W_DTS DATE NOT NULL,
-      W_ACTION CHAR(4) NOT NULL
-    );
-    """
-
-        # Create query to load text data into prospect table
-        watches_load_query = "LOAD DATA LOCAL INFILE 'staging/" + self.sf + "/Batch1/WatchHistory.txt' INTO TABLE S_Watches COLUMNS TERMINATED BY '|';"
-
-        # Construct mysql client bash command to execute ddl and data loading query
-        watches_ddl_cmd = TPCDI_Loader.BASE_MYSQL_CMD + " -D " + self.db_name + " -e \"" + watches_ddl + "\""
-        watches_load_cmd = TPCDI_Loader.BASE_MYSQL_CMD + " --local-infile=1 -D " + self.db_name + " -e \"" + watches_load_query + "\""
-
-        # Execute the command
-        os.system(watches_ddl_cmd)
-        os.system(watches_load_cmd)
+        self.executor.execute(load_dim_broker_query)
 
     def load_staging_prospect(self):
         """
@@ -666,116 +725,9 @@ class TPCDI_Loader():
     );
     """
 
-        # Create query to load text data into prospect table
-        prospect_load_query = "LOAD DATA LOCAL INFILE 'staging/" + self.sf + "/Batch1/Prospect.csv' INTO TABLE S_Prospect COLUMNS TERMINATED BY ',';"
-
-        # Construct mysql client bash command to execute ddl and data loading query
-        prospect_ddl_cmd = TPCDI_Loader.BASE_MYSQL_CMD + " -D " + self.db_name + " -e \"" + prospect_ddl + "\""
-        prospect_load_cmd = TPCDI_Loader.BASE_MYSQL_CMD + " --local-infile=1 -D " + self.db_name + " -e \"" + prospect_load_query + "\""
-
-        # Execute the command
-        os.system(prospect_ddl_cmd)
-        os.system(prospect_load_cmd)
-
-    def load_staging_trade(self):
-        """
-        Create S_Trade table in the staging database and then load rows in HR.csv into it.
-        """
-        # Create ddl to store broker
-        trade_ddl = """
-        USE """ + self.db_name + """;
-        CREATE TABLE S_Trade(
-            T_ID INTEGER NOT NULL,
-            T_DTS DATETIME NOT NULL,
-            T_ST_ID CHAR(4) NOT NULL,
-            T_TT_ID CHAR(3) NOT NULL,
-            T_IS_CASH BOOLEAN,
-            T_S_SYMB CHAR(15) NOT NULL,
-            T_QTY INTEGER DEFAULT NULL,
-            T_BID_PRICE DECIMAL DEFAULT NULL,
-            T_CA_ID INTEGER NOT NULL,
-            T_EXEC_NAME CHAR(49) NOT NULL,
-            T_TRADE_PRICE DECIMAL NULL DEFAULT NULL,
-            T_CHRG DECIMAL NULL DEFAULT NULL,
-            T_COMM DECIMAL NULL DEFAULT NULL,
-            T_TAX DECIMAL NULL DEFAULT NULL            
-        );
-        """
-        # Create query to load text data into broker table
-        trade_load_query = "LOAD DATA LOCAL INFILE 'staging/" + self.sf + "/Batch1/Trade.txt' INTO TABLE S_Trade COLUMNS TERMINATED BY '|';"
-
-        # Construct mysql client bash command to execute ddl and data loading query
-        trade_ddl_cmd = TPCDI_Loader.BASE_MYSQL_CMD + " -D " + self.db_name + " -e \"" + trade_ddl + "\""
-        trade_load_cmd = TPCDI_Loader.BASE_MYSQL_CMD + " --local-infile=1 -D " + self.db_name + " -e \"" + trade_load_query + "\""
-
-        # Execute the command
-        os.system(trade_ddl_cmd)
-        os.system(trade_load_cmd)
-
-    def load_staging_trade_history(self):
-        """
-        Create S_Trade_History table in the staging database and then load rows in HR.csv into it.
-        """
-        # Create ddl to store broker
-        trade_history_ddl = """
-        USE """ + self.db_name + """;
-        CREATE TABLE S_Trade_History(
-            TH_T_ID INTEGER NOT NULL,
-            TH_DTS DATETIME NOT NULL,
-            TH_ST_ID CHAR(4) NOT NULL            
-        );
-        """
-        # Create query to load text data into broker table
-        trade_history_load_query = "LOAD DATA LOCAL INFILE 'staging/" + self.sf + "/Batch1/TradeHistory.txt' INTO TABLE S_Trade_History COLUMNS TERMINATED BY '|';"
-
-        # Construct mysql client bash command to execute ddl and data loading query
-        trade_history_ddl_cmd = TPCDI_Loader.BASE_MYSQL_CMD + " -D " + self.db_name + " -e \"" + trade_history_ddl + "\""
-        trade_history_load_cmd = TPCDI_Loader.BASE_MYSQL_CMD + " --local-infile=1 -D " + self.db_name + " -e \"" + trade_history_load_query + "\""
-
-        # Execute the command
-        os.system(trade_history_ddl_cmd)
-        os.system(trade_history_load_cmd)
-
-    def load_staging_trade_joined(self):
-        """
-        Create S_Trade_Joined table in the staging database and then load rows in HR.csv into it.
-        """
-        trade_joined_ddl = """
-        USE """ + self.db_name + """;
-        CREATE TABLE S_Trade_Joined(
-            T_ID INTEGER NOT NULL,
-            T_DTS DATETIME NOT NULL,
-            T_ST_ID CHAR(4) NOT NULL,
-            T_TT_ID CHAR(3) NOT NULL,
-            T_IS_CASH BOOLEAN,
-            T_S_SYMB CHAR(15) NOT NULL,
-            T_QTY INTEGER DEFAULT NULL,
-            T_BID_PRICE DECIMAL DEFAULT NULL,
-            T_CA_ID INTEGER NOT NULL,
-            T_EXEC_NAME CHAR(49) NOT NULL,
-            T_TRADE_PRICE DECIMAL NULL DEFAULT NULL,
-            T_CHRG DECIMAL NULL DEFAULT NULL,
-            T_COMM DECIMAL NULL DEFAULT NULL,
-            T_TAX DECIMAL NULL DEFAULT NULL,
-            TH_T_ID INTEGER NOT NULL,
-            TH_DTS DATETIME NOT NULL,
-            TH_ST_ID CHAR(4) NOT NULL,
-            PRIMARY KEY(T_ID, TH_ST_ID)
-        );
-        """
-
-        trade_joined_insert_query = """
-        insert into S_Trade_Joined
-        select * from S_Trade inner join S_Trade_History on S_Trade.t_id = th_t_id;
-        """
-
-        # Construct mysql client bash command to execute ddl and data loading query
-        trade_joined_ddl_cmd = TPCDI_Loader.BASE_MYSQL_CMD + " -D " + self.db_name + " -e \"" + trade_joined_ddl + "\""
-        trade_joined_insert_query_cmd = TPCDI_Loader.BASE_MYSQL_CMD + " -D " + self.db_name + " -e \"" + trade_joined_insert_query + "\""
-
-        # Execute the command
-        os.system(trade_joined_ddl_cmd)
-        os.system(trade_joined_insert_query_cmd)
+        # Execute the ddl and data loading query
+        self.executor.execute(prospect_ddl)
+        self.executor.load_file(self.batch_dir + "Prospect.csv", "S_Prospect", delimiter=',')
 
     def load_prospect(self):
         """
@@ -818,46 +770,11 @@ class TPCDI_Loader():
     """
 
         # Create query to load text data into prospect table
-        prospect_ddl_cmd = TPCDI_Loader.BASE_MYSQL_CMD + " -D " + self.db_name + " -e \"" + prospect_ddl + "\""
         # Execute the command
-        os.system(prospect_ddl_cmd)
-
-        # Create function to get marketing_nameplate
-        marketing_nameplate_function_definition_ddl = """
-    DROP FUNCTION IF EXISTS get_marketing_template;
-    DELIMITER //
-    CREATE FUNCTION get_marketing_template(net_worth NUMERIC, income NUMERIC,
-        number_credit_cards NUMERIC, number_children NUMERIC, age NUMERIC,
-        credit_rating NUMERIC, number_cars NUMERIC) RETURNS  CHAR(100) DETERMINISTIC
-      BEGIN
-      DECLARE marketing_template CHAR(100);
-    set marketing_template = '';
-        IF (net_worth>1000000 OR income>200000) THEN
-          set marketing_template =  CONCAT(marketing_template, '+HighValue');
-        END IF;
-        IF (number_credit_cards>5 OR number_children>3) THEN
-          set marketing_template =  CONCAT(marketing_template, '+Expenses');
-        END IF;
-        IF (age>45) THEN
-          set marketing_template = CONCAT(marketing_template, '+Boomer');
-        END IF;
-        IF (credit_rating<600 or income <5000 or net_worth < 100000) THEN
-          set marketing_template =  CONCAT(marketing_template, '+MoneyAlert');
-        END IF;
-        IF (number_cars>3 or number_credit_cards>7) THEN
-          set marketing_template =  CONCAT(marketing_template, '+Spender');
-        END IF;
-        IF (age>25 or net_worth>1000000) THEN
-          set marketing_template =  CONCAT(marketing_template, '+Inherited');
-        END IF;
-        RETURN RIGHT(marketing_template,character_length(marketing_template)-1);
-      END //
-    DELIMITER ;
-    """
-        marketing_nameplate_function_definition_cmd = TPCDI_Loader.BASE_MYSQL_CMD + " -D " + self.db_name + " -e \"" + marketing_nameplate_function_definition_ddl + "\""
-        print("create function using command")
-        print(marketing_nameplate_function_definition_cmd)
-        os.system(marketing_nameplate_function_definition_cmd)
+        self.executor.execute(prospect_ddl)
+
+        # Marketing nameplates of the staged prospects, computed in pandas
+        self.stage_prospect_nameplates()
 
         load_prospect_query = """
     INSERT INTO Prospect
@@ -865,26 +782,94 @@ class TPCDI_Loader():
           (SELECT b_d.batch_date FROM batch_date b_d WHERE b_d.batch_number=%s) SK_UpdateDateID, %s, FALSE, SP.LAST_NAME,
           SP.FIRST_NAME, SP.MIDDLE_INITIAL, SP.GENDER, SP.ADDRESS_LINE_1, SP.ADDRESS_LINE_2, SP.POSTAL_CODE, SP.CITY,
           SP.STATE, SP.COUNTRY, SP.PHONE, SP.INCOME, SP.NUMBER_CARS,SP.NUMBER_CHILDREM, SP.MARITAL_STATUS, SP.AGE,
-          SP.CREDIT_RATING, SP.OWN_OR_RENT_FLAG, SP.EMPLOYER,SP.NUMBER_CREDIT_CARDS, SP.NET_WORTH, (SELECT get_marketing_template(SP.NET_WORTH, SP.INCOME, SP.NUMBER_CREDIT_CARDS, SP.NUMBER_CHILDREM, SP.AGE,
-                      SP.CREDIT_RATING, SP.NUMBER_CARS) ) MarketingNameplate
-    FROM S_Prospect SP;
+          SP.CREDIT_RATING, SP.OWN_OR_RENT_FLAG, SP.EMPLOYER,SP.NUMBER_CREDIT_CARDS, SP.NET_WORTH, N.MarketingNameplate
+    FROM S_Prospect SP
+    JOIN S_Prospect_Nameplate N ON N.AGENCY_ID = SP.AGENCY_ID;
 
     INSERT INTO DImessages
 	    SELECT current_timestamp(),%s,'Prospect', 'Inserted rows', 'Status', (SELECT COUNT(*) FROM Prospect);
+
+    DROP TABLE S_Prospect_Nameplate;
     """ % (str(self.batch_number), str(self.batch_number), str(self.batch_number), str(self.batch_number))
-        load_prospect_cmd = prospect_ddl_cmd = TPCDI_Loader.BASE_MYSQL_CMD + " -D " + self.db_name + " -e \"" + load_prospect_query + "\""
-        os.system(load_prospect_cmd)
+        self.executor.execute(load_prospect_query)
+
+    def stage_prospect_nameplates(self):
+        """
+    Compute the MarketingNameplate of every prospect staged in S_Prospect with marketing_nameplates and bulk load them
+    into S_Prospect_Nameplate, joined by the statements filling Prospect.
+    """
+        prospects = self.executor.read_frame(
+            "SELECT AGENCY_ID, NET_WORTH, INCOME, NUMBER_CHILDREM, NUMBER_CREDIT_CARDS, AGE, CREDIT_RATING, NUMBER_CARS "
+            "FROM S_Prospect")
+        nameplates = pd.DataFrame({"AGENCY_ID": prospects["AGENCY_ID"], "MarketingNameplate": marketing_nameplates(
+            prospects["NET_WORTH"], prospects["INCOME"], prospects["NUMBER_CHILDREM"], prospects["NUMBER_CREDIT_CARDS"],
+            prospects["AGE"], prospects["CREDIT_RATING"], prospects["NUMBER_CARS"])}).drop_duplicates("AGENCY_ID", keep="last")
+
+        self.executor.execute("""
+    DROP TABLE IF EXISTS S_Prospect_Nameplate;
+    CREATE TABLE S_Prospect_Nameplate (
+      AGENCY_ID CHAR(30) NOT NULL PRIMARY KEY,
+      MarketingNameplate CHAR(100)
+    );
+    """)
+        self.executor.load_frame(nameplates, "S_Prospect_Nameplate")
+
+    def load_incremental_prospect(self):
+        """
+    Apply the full Prospect.csv of the batch to Prospect: known prospects are updated in place, SK_UpdateDateID only
+    moving when one of their attributes changed, and new prospects are appended.
+    """
+        self.executor.execute("DELETE FROM S_Prospect;")
+        self.executor.load_file(self.batch_dir + "Prospect.csv", "S_Prospect", delimiter=',')
+        self.stage_prospect_nameplates()
+
+        batch_date = "(SELECT b_d.batch_date FROM batch_date b_d WHERE b_d.batch_number=%s)" % str(self.batch_number)
+        attributes = [("LastName", "LAST_NAME"), ("FirstName", "FIRST_NAME"), ("MiddleInitial", "MIDDLE_INITIAL"),
+                      ("Gender", "GENDER"), ("AddressLine1", "ADDRESS_LINE_1"), ("AddressLine2", "ADDRESS_LINE_2"),
+                      ("PostalCode", "POSTAL_CODE"), ("City", "CITY"), ("State", "STATE"), ("Country", "COUNTRY"),
+                      ("Phone", "PHONE"), ("Income", "INCOME"), ("NumberCars", "NUMBER_CARS"),
+                      ("NumberChildren", "NUMBER_CHILDREM"), ("MaritalStatus", "MARITAL_STATUS"), ("Age", "AGE"),
+                      ("CreditRating", "CREDIT_RATING"), ("OwnOrRentFlag", "OWN_OR_RENT_FLAG"), ("Employer", "EMPLOYER"),
+                      ("NumberCreditCards", "NUMBER_CREDIT_CARDS"), ("NetWorth", "NET_WORTH")]
+
+        # Assignments of a multiple table update run in no particular order, so changes are detected first
+        update_prospect_query = """
+    UPDATE Prospect P JOIN S_Prospect SP ON P.AgencyID = SP.AGENCY_ID
+    SET P.SK_UpdateDateID = %s
+    WHERE NOT (%s);
+
+    UPDATE Prospect P JOIN S_Prospect SP ON P.AgencyID = SP.AGENCY_ID JOIN S_Prospect_Nameplate N ON N.AGENCY_ID = SP.AGENCY_ID
+    SET P.SK_RecordDateID = %s, P.BatchID = %s, %s, P.MarketingNameplate = N.MarketingNameplate;
+
+    INSERT INTO Prospect
+    SELECT SP.AGENCY_ID, %s SK_RecordDateID, %s SK_UpdateDateID, %s, FALSE, SP.LAST_NAME,
+          SP.FIRST_NAME, SP.MIDDLE_INITIAL, SP.GENDER, SP.ADDRESS_LINE_1, SP.ADDRESS_LINE_2, SP.POSTAL_CODE, SP.CITY,
+          SP.STATE, SP.COUNTRY, SP.PHONE, SP.INCOME, SP.NUMBER_CARS,SP.NUMBER_CHILDREM, SP.MARITAL_STATUS, SP.AGE,
+          SP.CREDIT_RATING, SP.OWN_OR_RENT_FLAG, SP.EMPLOYER,SP.NUMBER_CREDIT_CARDS, SP.NET_WORTH, N.MarketingNameplate
+    FROM S_Prospect SP
+    JOIN S_Prospect_Nameplate N ON N.AGENCY_ID = SP.AGENCY_ID
+    LEFT JOIN Prospect P ON P.AgencyID = SP.AGENCY_ID
+    WHERE P.AgencyID IS NULL;
+
+    INSERT INTO DImessages
+	    SELECT current_timestamp(),%s,'Prospect', 'Inserted rows', 'Status', (SELECT COUNT(*) FROM Prospect);
+
+    DROP TABLE S_Prospect_Nameplate;
+    """ % (batch_date, " AND ".join("P.%s <=> SP.%s" % pair for pair in attributes),
+           batch_date, str(self.batch_number), ", ".join("P.%s = SP.%s" % pair for pair in attributes),
+           batch_date, batch_date, str(self.batch_number), str(self.batch_number))
+        self.executor.execute(update_prospect_query)
 
     def load_audit(self):
         """
-    Create Audit table in the staging database and then load rows in files with "_audit.csv" ending into it.
+    Create Audit table in the staging database and then load rows in the batch files with "_audit.csv" ending into it.
     """
 
         # Create ddl to store audit
         audit_ddl = """
     USE """ + self.db_name + """;
 
-    CREATE TABLE Audit (
+    CREATE TABLE IF NOT EXISTS Audit (
       DataSet CHAR(20) NOT Null,
 			BatchID NUMERIC(5),
 			AT_Date DATE,
@@ -894,18 +879,11 @@ class TPCDI_Loader():
     );
     """
 
-        audit_ddl_cmd = TPCDI_Loader.BASE_MYSQL_CMD + " -D " + self.db_name + " -e \"" + audit_ddl + "\""
-        os.system(audit_ddl_cmd)
+        self.executor.execute(audit_ddl)
 
         for filepath in glob.iglob(
-                "staging/" + self.sf + "/Batch1/*_audit.csv"):  # Create query to load text data into tradeType table
-            audit_load_query = "LOAD DATA LOCAL INFILE '" + filepath + "' INTO TABLE Audit COLUMNS TERMINATED BY ',' IGNORE 1 LINES;"
-
-            # Construct mysql client bash command to execute ddl and data loading query
-            audit_load_cmd = TPCDI_Loader.BASE_MYSQL_CMD + " --local-infile=1 -D " + self.db_name + " -e \"" + audit_load_query + "\""
-
-            # Execute the command
-            os.system(audit_load_cmd)
+                self.batch_dir + "*_audit.csv"):  # Create query to load text data into tradeType table
+            self.executor.load_file(filepath, "Audit", delimiter=',', ignore_lines=1)
 
     def load_staging_finwire(self):
         """
@@ -971,112 +949,24 @@ class TPCDI_Loader():
     );
     """
 
-        finwire_ddl_cmd = TPCDI_Loader.BASE_MYSQL_CMD + " -D " + self.db_name + " -e \"" + finwire_ddl + "\""
-        os.system(finwire_ddl_cmd)
+        self.executor.execute(finwire_ddl)
 
+        # Every quarter file is decoded into one flat file per record type, in parallel processes when workers > 1
         base_path = "staging/" + self.sf + "/Batch1/"
-        s_company_base_query = "INSERT INTO S_Company VALUES "
-        s_security_base_query = "INSERT INTO S_Security VALUES "
-        s_financial_base_query = "INSERT INTO S_Financial VALUES"
-        s_company_values = []
-        s_security_values = []
-        s_financial_values = []
-        max_packet = 150
-        for fname in os.listdir(base_path):
-            if ("FINWIRE" in fname and "audit" not in fname):
-                with open(base_path + fname, 'r',  errors='ignore') as finwire_file:
-                    for line in finwire_file:
-                        pts = line[:15]  # 0
-                        rec_type = line[15:18]  # 1
-
-                        if rec_type == "CMP":
-                            company_name = line[18:78]  # 2
-                            cik = line[78:88]  # 3
-                            status = line[88:92]  # 4
-                            industry_id = line[92:94]  # 5
-                            sp_rating = line[94:98]  # 6
-                            founding_date = line[98:106]  # 7
-                            addr_line_1 = line[106:186]  # 8
-                            addr_line_2 = line[186:266]  # 9
-                            postal_code = line[266:278]  # 10
-                            city = line[278:303]  # 10
-                            state_province = line[303:323]  # 11
-                            country = line[323:347]  # 12
-                            ceo_name = line[347:393]  # 13
-                            description = line[393:]  # 14
-
-                            s_company_values.append(
-                                "('%s','%s','%s','%s','%s','%s','%s','%s','%s','%s','%s','%s','%s','%s','%s','%s')" % (
-                                    pts, rec_type, company_name, cik, status, industry_id, sp_rating, founding_date,
-                                    addr_line_1, addr_line_2, postal_code, city, state_province, country, ceo_name,
-                                    description))
-
-                            if len(s_company_values) >= max_packet:
-                                # Create query to load text data into tradeType table
-                                s_company_load_query = s_company_base_query + ','.join(s_company_values)
-                                s_company_values = []
-                                # Construct mysql client bash command to execute ddl and data loading query
-                                s_company_load_cmd = TPCDI_Loader.BASE_MYSQL_CMD + " -D " + self.db_name + " -e \"" + s_company_load_query + "\""
-
-                                # Execute the command
-                                os.system(s_company_load_cmd)
-                        elif rec_type == "SEC":
-                            symbol = line[18:33]
-                            issue_type = line[33:39]
-                            status = line[39:43]
-                            name = line[43:113]
-                            ex_id = line[113:119]
-                            sh_out = line[119:132]
-                            first_trade_date = line[132:140]
-                            first_trade_exchange = line[140:148]
-                            dividen = line[148:160]
-                            company_name = line[160:]
-
-                            s_security_values.append("('%s','%s','%s','%s','%s','%s','%s','%s','%s','%s','%s','%s')" % (
-                                pts, rec_type, symbol, issue_type, status, name, ex_id, sh_out, first_trade_date,
-                                first_trade_exchange, dividen, company_name))
-
-                            if len(s_security_values) >= max_packet:
-                                # Create query to load text data into tradeType table
-                                s_security_load_query = s_security_base_query + ','.join(s_security_values)
-                                s_security_values = []
-                                # Construct mysql client bash command to execute ddl and data loading query
-                                s_security_load_cmd = TPCDI_Loader.BASE_MYSQL_CMD + " -D " + self.db_name + " -e \"" + s_security_load_query + "\""
-
-                                # Execute the command
-                                os.system(s_security_load_cmd)
-                        elif rec_type == "FIN":
-                            year = line[18:22]
-                            quarter = line[22:23]
-                            qtr_start_date = line[23:31]
-                            posting_date = line[31:39]
-                            revenue = line[39:56]
-                            earnings = line[56:73]
-                            eps = line[73:85]
-                            diluted_eps = line[85:97]
-                            margin = line[97:109]
-                            inventory = line[109:126]
-                            assets = line[126:143]
-                            liabilities = line[143:160]
-                            sh_out = line[160:173]
-                            diluted_sh_out = line[173:186]
-                            co_name_or_cik = line[186:]
-
-                            s_financial_values.append(
-                                "('%s','%s','%s','%s','%s','%s','%s','%s','%s','%s','%s','%s','%s','%s','%s','%s','%s')" % (
-                                    pts, rec_type, year, quarter, qtr_start_date, posting_date, revenue, earnings, eps,
-                                    diluted_eps, margin, inventory, assets, liabilities, sh_out, diluted_sh_out,
-                                    co_name_or_cik))
-
-                            if len(s_financial_values) >= max_packet:
-                                # Create query to load text data into tradeType table
-                                s_financial_load_query = s_financial_base_query + ','.join(s_financial_values)
-                                s_financial_values = []
-                                # Construct mysql client bash command to execute ddl and data loading query
-                                s_financial_load_cmd = TPCDI_Loader.BASE_MYSQL_CMD + " -D " + self.db_name + " -e \"" + s_financial_load_query + "\""
-
-                                # Execute the command
-                                os.system(s_financial_load_cmd)
+        fnames = sorted([fname for fname in os.listdir(base_path) if "FINWIRE" in fname and "audit" not in fname],
+                        key=finwire_quarter)
+        tables = {"CMP": "S_Company", "SEC": "S_Security", "FIN": "S_Financial"}
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            paths = [base_path + fname for fname in fnames]
+            if self.workers > 1:
+                with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                    outputs = list(pool.map(stage_finwire_file, paths, [tmpdirname] * len(paths)))
+            else:
+                outputs = [stage_finwire_file(path, tmpdirname) for path in paths]
+
+            # Quarters are streamed in chronological order, so each table receives its records in PTS order
+            for rec_type, table in tables.items():
+                self.executor.load_stream(iter_file_chunks([output[rec_type] for output in outputs]), table)
 
     def load_target_dim_company(self):
         """
@@ -1122,168 +1012,162 @@ class TPCDI_Loader():
       JOIN StatusType S ON C.STATUS = S.ST_ID;
     """
 
-        # Handle type 2 slowly changing dimension on company
-        dim_company_sdc_query = """
-    CREATE TABLE sdc_dimcompany
-      LIKE DimCompany;
-    ALTER TABLE sdc_dimcompany
-      ADD COLUMN RN NUMERIC;
-    INSERT INTO sdc_dimcompany
-    SELECT *, ROW_NUMBER() OVER(ORDER BY CompanyID, EffectiveDate) RN
-    FROM DimCompany;
-
-    WITH candidate AS (
-    SELECT s1.SK_CompanyID,
-          s2.EffectiveDate EndDate
-    FROM sdc_dimcompany s1
-          JOIN sdc_dimcompany s2 ON (s1.RN = (s2.RN - 1) AND s1.CompanyID = s2.CompanyID))
-    UPDATE DimCompany,candidate SET DimCompany.EndDate = candidate.EndDate, DimCompany.IsCurrent=FALSE WHERE DimCompany.SK_CompanyID = candidate.SK_CompanyID;
-    DROP TABLE sdc_dimcompany;
-    """
-
-        # Construct mysql client bash command to execute ddl and data loading query
-        dim_company_ddl_cmd = TPCDI_Loader.BASE_MYSQL_CMD + " -D " + self.db_name + " -e \"" + dim_company_ddl + "\""
-        dim_company_load_cmd = TPCDI_Loader.BASE_MYSQL_CMD + " --local-infile=1 -D " + self.db_name + " -e \"" + dim_company_load_query + "\""
-        dim_company_sdc_cmd = TPCDI_Loader.BASE_MYSQL_CMD + " --local-infile=1 -D " + self.db_name + " -e \"" + dim_company_sdc_query + "\""
 
-        # Execute the command
-        os.system(dim_company_ddl_cmd)
-        os.system(dim_company_load_cmd)
-        os.system(dim_company_sdc_cmd)
+        # Execute the ddl and data loading query
+        self.executor.execute(dim_company_ddl)
+        self.executor.execute(dim_company_load_query)
+
+        # Handle type 2 slowly changing dimension on company
+        self.end_superseded_versions("DimCompany", "SK_CompanyID", "CompanyID")
 
     def transform_s_customer(self, tax_rate):
+        """
+    Build the DimCustomer versions out of the customer actions in S_Customer, as a type 2 slowly changing dimension.
+    Actions are sorted per customer, attributes an update leaves out are forward filled from the previous version
+    (an empty value clears the attribute) and EffectiveDate, EndDate and IsCurrent come from the neighbouring versions.
+    """
 
         NULL = ""
+        # Marks attributes an update explicitly empties, so forward filling does not bring the old value back
+        CLEARED = "\0cleared"
 
-        conn = get_mysql_conn(self.db_name, self.config)
         query = "SELECT * FROM S_Customer"
-        s_customer = pd.read_sql(query, conn)
-        conn.close()
-
-        df_customers = pd.DataFrame(
-            columns=["CustomerID", "TaxID", "Status", "LastName", "FirstName", "MiddleInitial", "Gender", "Tier", "DOB",
-                     "AddressLine1", "AddressLine2", "PostalCode", "City", "StateProv", "Country", "Phone1", "Phone2",
-                     "Phone3", "Email1", "Email2", "NationalTaxRateDesc", "NationalTaxRate", "LocalTaxRateDesc",
-                     "LocalTaxRate", "AgencyID", "CreditRating", "NetWorth", "MarketingNameplate", "IsCurrent",
-                     "BatchID",
-                     "EffectiveDate", "EndDate"])
-
-        df_messages = pd.DataFrame(columns=["BatchID", "MessageSource", "MessageText", "MessageType", "MessageData"])
-
-        updates = {}
-
-        for index, row in s_customer.iterrows():
-            action_type = row["ActionType"]
-            if action_type in ["NEW", "UPDCUST"]:
-                nrow = {
-                    "CustomerID": row['C_ID'],
-                    "EffectiveDate": row["ActionTS"][:10],
-                    "TaxID": row['C_TAX_ID'],
-
-                    "LastName": row["C_L_NAME"],
-                    "FirstName": row["C_F_NAME"],
-                    "MiddleInitial": row["C_M_NAME"],
-
-                    "Gender": row['C_GNDR'],
-                    "Tier": row['C_TIER'],
-                    "DOB": row['C_DOB'],
-
-                    "AddressLine1": row["C_ADLINE1"],
-                    "AddressLine2": row["C_ADLINE2"],
-                    "PostalCode": row["C_ZIPCODE"],
-                    "City": row["C_CITY"],
-                    "StateProv": row["C_STATE_PROV"],
-                    "Country": row["C_CTRY"],
-
-                    "Phone1": get_cust_phone(1, row),
-                    "Phone2": get_cust_phone(2, row),
-                    "Phone3": get_cust_phone(3, row),
-                    "Email1": row["C_PRIM_EMAIL"],
-                    "Email2": row["C_ALT_EMAIL"],
-                }
-
-                if nrow["Gender"] is not None and nrow["Gender"] != NULL:
-                    nrow["Gender"] = nrow["Gender"].upper()
-                    if nrow["Gender"] not in ["F", "M"]:
-                        nrow["Gender"] = "U"
-
-                nat_tax_id = row["C_NAT_TX_ID"]
-                if nat_tax_id:
-                    nrow["NationalTaxRateDesc"] = tax_rate[tax_rate.TX_ID == nat_tax_id]["TX_NAME"].iloc[0]
-                    nrow["NationalTaxRate"] = tax_rate[tax_rate.TX_ID == nat_tax_id]["TX_RATE"].iloc[0]
-
-                lcl_tax_id = row["C_LCL_TX_ID"]
-                if lcl_tax_id:
-                    nrow["LocalTaxRateDesc"] = tax_rate[tax_rate.TX_ID == nat_tax_id]["TX_NAME"].iloc[0]
-                    nrow["LocalTaxRate"] = tax_rate[tax_rate.TX_ID == nat_tax_id]["TX_RATE"].iloc[0]
-
-                if action_type == "NEW":
-                    nrow["Status"] = "ACTIVE"
-                    nrow["IsCurrent"] = True
-                    nrow["BatchID"] = 1
-                    nrow["EndDate"] = "9999-12-31"
-                    df_new = pd.DataFrame(nrow, index=[0])
-                    df_new.fillna(np.nan, inplace=True)
-                    df_customers = df_customers.append(nrow, ignore_index=True)
-
-                elif action_type == "UPDCUST":
-                    if nrow["CustomerID"] not in updates:
-                        updates[nrow["CustomerID"]] = []
-                    updates[nrow["CustomerID"]].append(nrow)
-
-                if "Tier" in nrow and nrow["Tier"] is not None and nrow["Tier"] != NULL:
-                    if nrow["Tier"] not in ["1", "2", "3"]:
-                        df_messages = df_messages.append({
-                            "BatchID": 1,
-                            "MessageSource": "DimCustomer",
-                            "MessageType": "Alert",
-                            "MessageText": "Invalid customer tier",
-                            "MessageData": "C_ID = " + str(nrow["CustomerID"]) + ", C_TIER = " + str(nrow["Tier"])
-                        }, ignore_index=True)
-
-                if "DOB" in nrow and nrow["DOB"] is not None and nrow["DOB"] != NULL:
-                    ds = open(self.batch_dir + "BatchDate.txt").read()[:-1]
-                    batch_date = datetime.strptime(ds, "%Y-%m-%d").date()
-                    min_date = date(batch_date.year - 100, batch_date.month, batch_date.day)
-                    dob = nrow["DOB"]
-
-                    if dob < min_date or dob > batch_date:
-                        df_messages = df_messages.append({
-                            "BatchID": 1,
-                            "MessageSource": "DimCustomer",
-                            "MessageType": "Alert",
-                            "MessageText": "DOB out of range",
-                            "MessageData": "C_ID = " + str(nrow["CustomerID"]) + ", C_DOB = " + str(nrow["DOB"])
-                        }, ignore_index=True)
-
-            elif action_type == "INACT":
-                customer_id = row['C_ID']
-                action_ts = row["ActionTS"][:10]
-
-                if customer_id not in updates:
-                    updates[customer_id] = []
-                updates[customer_id].append(
-                    {"CustomerID": customer_id, "EffectiveDate": action_ts, "Status": "INACTIVE"})
-
-        for c_id, upds in updates.items():
-            for upda in upds:
-                action_ts = upda["EffectiveDate"]
-                old_index = df_customers[(df_customers.CustomerID == c_id) & df_customers.IsCurrent].index.values[0]
-                new_row = df_customers.loc[old_index, :].copy()
-
-                df_customers.loc[old_index, "IsCurrent"] = False
-                df_customers.loc[old_index, "EndDate"] = action_ts
-
-                for attrib, value in upda.items():
-                    if value is not None:
-                        if value == "":
-                            new_row[attrib] = np.nan
-                        else:
-                            new_row[attrib] = value
-
-                df_customers = df_customers.append(new_row, ignore_index=True)
+        s_customer = self.executor.read_frame(query)
+
+        actions = s_customer[s_customer["ActionType"].isin(["NEW", "UPDCUST", "INACT"])].reset_index(drop=True)
+        is_new = (actions["ActionType"] == "NEW").values
+        is_inact = (actions["ActionType"] == "INACT").values
+        has_attributes = ~is_inact
+
+        tax_names = dict(zip(tax_rate["TX_ID"], tax_rate["TX_NAME"]))
+        tax_rates = dict(zip(tax_rate["TX_ID"], tax_rate["TX_RATE"]))
+        nat_tax_id = actions["C_NAT_TX_ID"].where(actions["C_NAT_TX_ID"].fillna(NULL) != NULL)
+        lcl_tax_id = actions["C_LCL_TX_ID"].where(actions["C_LCL_TX_ID"].fillna(NULL) != NULL)
+
+        gender = actions["C_GNDR"].str.upper()
+        gender = gender.where(gender.isna() | (gender == NULL) | gender.isin(["F", "M"]), "U")
+
+        # One row per action, an INACT only carries its status
+        versions = pd.DataFrame({
+            "CustomerID": actions["C_ID"],
+            "TaxID": actions["C_TAX_ID"],
+            "Status": np.where(is_new, TPCDI_Loader.ACTIVE, np.where(is_inact, TPCDI_Loader.INACTIVE, None)),
+            "LastName": actions["C_L_NAME"],
+            "FirstName": actions["C_F_NAME"],
+            "MiddleInitial": actions["C_M_NAME"],
+            "Gender": gender,
+            "Tier": actions["C_TIER"],
+            "DOB": actions["C_DOB"],
+            "AddressLine1": actions["C_ADLINE1"],
+            "AddressLine2": actions["C_ADLINE2"],
+            "PostalCode": actions["C_ZIPCODE"],
+            "City": actions["C_CITY"],
+            "StateProv": actions["C_STATE_PROV"],
+            "Country": actions["C_CTRY"],
+            "Phone1": get_cust_phones(1, actions),
+            "Phone2": get_cust_phones(2, actions),
+            "Phone3": get_cust_phones(3, actions),
+            "Email1": actions["C_PRIM_EMAIL"],
+            "Email2": actions["C_ALT_EMAIL"],
+            "NationalTaxRateDesc": nat_tax_id.map(tax_names),
+            "NationalTaxRate": nat_tax_id.map(tax_rates),
+            "LocalTaxRateDesc": lcl_tax_id.map(tax_names),
+            "LocalTaxRate": lcl_tax_id.map(tax_rates),
+            "BatchID": np.where(is_new, 1, np.nan),
+            "EffectiveDate": actions["ActionTS"].str[:10],
+            "Position": np.arange(len(actions)),
+            "IsNew": is_new,
+        })
+        attributes = [column for column in versions.columns
+                      if column not in ("CustomerID", "Status", "BatchID", "EffectiveDate", "Position", "IsNew")]
+        versions.loc[~has_attributes, attributes] = np.nan
+        for column in attributes:
+            if versions[column].dtype == object:
+                versions[column] = versions[column].mask(versions[column] == NULL, CLEARED)
+
+        # Version chain of every customer, actions preceding the customer creation have nothing to update
+        versions.sort_values(["CustomerID", "Position"], kind="stable", inplace=True)
+        customer = versions.groupby("CustomerID", sort=False)
+        versions = versions[customer["IsNew"].cummax().values]
+        customer = versions.groupby("CustomerID", sort=False)
+        carried = attributes + ["Status", "BatchID"]
+        versions[carried] = customer[carried].ffill()
+        versions[attributes] = versions[attributes].replace(CLEARED, np.nan)
+        versions["BatchID"] = versions["BatchID"].astype(int)
+
+        next_effective_date = customer["EffectiveDate"].shift(-1)
+        versions["IsCurrent"] = next_effective_date.isna()
+        versions["EndDate"] = next_effective_date.fillna("9999-12-31")
+
+        # Surrogate keys: creations in action order, then the versions of every updated customer in order of its first update
+        first_update = versions["Position"].where(~versions["IsNew"]).groupby(versions["CustomerID"]).transform("min")
+        versions["Order"] = versions["Position"].where(versions["IsNew"], first_update)
+        versions.sort_values(["IsNew", "Order", "Position"], ascending=[False, True, True], kind="stable", inplace=True)
+
+        df_customers = versions[["CustomerID", "TaxID", "Status", "LastName", "FirstName", "MiddleInitial", "Gender", "Tier", "DOB",
+                                 "AddressLine1", "AddressLine2", "PostalCode", "City", "StateProv", "Country", "Phone1", "Phone2",
+                                 "Phone3", "Email1", "Email2", "NationalTaxRateDesc", "NationalTaxRate", "LocalTaxRateDesc",
+                                 "LocalTaxRate", "IsCurrent", "BatchID", "EffectiveDate", "EndDate"]].reset_index(drop=True)
+        for column in ["AgencyID", "CreditRating", "NetWorth", "MarketingNameplate"]:
+            df_customers.insert(df_customers.columns.get_loc("IsCurrent"), column, np.nan)
+
+        # Alerts on the customer data of NEW and UPDCUST actions, in action order
+        df_messages = self.customer_alerts(actions[has_attributes])
+
         return df_customers, df_messages
 
+    def customer_alerts(self, customers):
+        """
+    DImessages alerts on the invalid tiers and the birth dates out of range of the given customer rows, in row order.
+
+    Args:
+        customers (DataFrame): Customer rows with their C_ID, C_TIER and C_DOB.
+    """
+        batch_date = datetime.strptime(self.current_batch_date(), "%Y-%m-%d").date()
+        min_date = date(batch_date.year - 100, batch_date.month, batch_date.day)
+        customers = customers.reset_index(drop=True)
+
+        tier = pd.to_numeric(customers["C_TIER"], errors="coerce")
+        invalid_tier = tier.notna() & ~tier.isin([1, 2, 3])
+        dob = pd.to_datetime(customers["C_DOB"], errors="coerce")
+        invalid_dob = dob.notna() & ((dob < pd.Timestamp(min_date)) | (dob > pd.Timestamp(batch_date)))
+
+        tier_messages = pd.DataFrame({
+            "MessageText": "Invalid customer tier",
+            "MessageData": "C_ID = " + customers["C_ID"].astype(str) + ", C_TIER = " + customers["C_TIER"].astype(str),
+            "Position": np.arange(len(customers)), "Check": 0})[invalid_tier]
+        dob_messages = pd.DataFrame({
+            "MessageText": "DOB out of range",
+            "MessageData": "C_ID = " + customers["C_ID"].astype(str) + ", C_DOB = " + customers["C_DOB"].astype(str),
+            "Position": np.arange(len(customers)), "Check": 1})[invalid_dob]
+        df_messages = pd.concat([tier_messages, dob_messages]).sort_values(["Position", "Check"])
+        return pd.DataFrame({
+            "BatchID": self.batch_number,
+            "MessageSource": "DimCustomer",
+            "MessageText": df_messages["MessageText"],
+            "MessageType": "Alert",
+            "MessageData": df_messages["MessageData"]}).reset_index(drop=True)
+
+    def match_prospects(self, df_customers):
+        """
+    Fill AgencyID, CreditRating, NetWorth and MarketingNameplate of the current customer versions from the prospect
+    with the same name and address.
+    """
+        key_columns = ["LastName", "FirstName", "AddressLine1", "AddressLine2", "PostalCode"]
+        prospect = self.executor.read_frame(
+            "SELECT %s, AgencyID, CreditRating, NetWorth, MarketingNameplate FROM Prospect" % ", ".join(key_columns))
+        prospect.index = prospect_keys(prospect, key_columns)
+        # Several prospects can share a name and address, a customer is matched with the last one
+        prospect = prospect[~prospect.index.duplicated(keep="last")]
+
+        # Prospect of every customer version by key, only the current versions take its attributes
+        matched = prospect.reindex(prospect_keys(df_customers, key_columns))
+        current = df_customers["IsCurrent"].astype(bool).to_numpy()
+        for column in ["AgencyID", "CreditRating", "NetWorth", "MarketingNameplate"]:
+            df_customers[column] = matched[column].to_numpy(dtype=object)
+            df_customers.loc[~current, column] = np.nan
+        return df_customers
+
     def load_target_dim_customer(self):
         dim_customer_ddl = """
         
@@ -1325,51 +1209,78 @@ class TPCDI_Loader():
             EndDate DATE NOT NULL
         );
         """
-        dim_customer_ddl_cmd = TPCDI_Loader.BASE_MYSQL_CMD + " -D " + self.db_name + " -e \"" + dim_customer_ddl + "\""
 
         # Execute the command
-        os.system(dim_customer_ddl_cmd)
+        self.executor.execute(dim_customer_ddl)
 
-        NULL = ""
-        conn = get_mysql_conn(self.db_name, self.config)
         query = "SELECT * FROM TaxRate"
-        tax_rate = pd.read_sql(query, conn)
-        conn.close()
+        tax_rate = self.executor.read_frame(query)
 
-        conn = get_mysql_conn(self.db_name, self.config)
-        query = "SELECT * FROM Prospect"
-        prospect = pd.read_sql(query, conn)
-        conn.close()
+        df_customers, df_messages = self.transform_s_customer(tax_rate)
 
-        prospect["key"] = prospect.apply(lambda row: ''.join([
-            pd.notna(row["LastName"]) and str(row["LastName"]) or NULL,
-            pd.notna(row["FirstName"]) and str(row["FirstName"]) or NULL,
-            pd.notna(row["AddressLine1"]) and str(row["AddressLine1"]) or NULL,
-            pd.notna(row["AddressLine2"]) and str(row["AddressLine2"]) or NULL,
-            pd.notna(row["PostalCode"]) and str(row["PostalCode"]) or NULL]), axis=1)
+        df_customers = self.match_prospects(df_customers)
+        df_customers.replace("", np.nan, inplace=True)
+        df_customers["SK_CustomerID"] = df_customers.index
 
-        prospect["key"] = prospect["key"].apply(lambda x: x.upper())
-        prospect = prospect.set_index("key")
+        self.executor.load_frame(df_customers, "DimCustomer")
+        self.executor.load_frame(df_messages, "DImessages")
 
-        df_customers, df_messages = self.transform_s_customer(tax_rate)
+    def load_incremental_dim_customer(self):
+        """
+    Apply the customer changes of Customer.txt to DimCustomer: the current version of every inserted or updated
+    customer is closed on the batch date and its new version appended. Changes of one customer in the same batch
+    take effect on the same day, so only the last one makes a version.
+    """
+        batch_date = self.current_batch_date()
+        customers = pd.DataFrame(Delimited_Reader(CUSTOMER_CDC_SCHEMA).read(self.batch_dir + "Customer.txt"))
+        if customers.empty:
+            return
+        customers = customers.drop_duplicates("C_ID", keep="last").reset_index(drop=True)
 
-        df_customers["ProspectKey"] = df_customers["LastName"].apply(to_upper) + \
-                                      df_customers["FirstName"].apply(to_upper) + \
-                                      df_customers["AddressLine1"].apply(to_upper) + \
-                                      df_customers["AddressLine2"].apply(to_upper) + \
-                                      df_customers["PostalCode"].apply(to_upper)
-
-        df_customers["AgencyID"] = df_customers.apply(lambda x: get_prospect(x, prospect)[0], axis=1)
-        df_customers["CreditRating"] = df_customers.apply(lambda x: get_prospect(x, prospect)[1], axis=1)
-        df_customers["NetWorth"] = df_customers.apply(lambda x: get_prospect(x, prospect)[2], axis=1)
-        df_customers["MarketingNameplate"] = df_customers.apply(lambda x: get_prospect(x, prospect)[3], axis=1)
-        df_customers.drop("ProspectKey", inplace=True, axis=1)
+        query = "SELECT * FROM TaxRate"
+        tax_rate = self.executor.read_frame(query)
+        tax_names = dict(zip(tax_rate["TX_ID"], tax_rate["TX_NAME"]))
+        tax_rates = dict(zip(tax_rate["TX_ID"], tax_rate["TX_RATE"]))
+
+        gender = customers["C_GNDR"].str.upper()
+        gender = gender.where(gender.isna() | gender.isin(["F", "M"]), "U")
+
+        df_customers = pd.DataFrame({
+            "SK_CustomerID": self.next_surrogate_key("DimCustomer", "SK_CustomerID") + np.arange(len(customers)),
+            "CustomerID": customers["C_ID"],
+            "TaxID": customers["C_TAX_ID"],
+            "Status": customers["C_ST_ID"].map(TPCDI_Loader.STATUS_NAMES),
+            "LastName": customers["C_L_NAME"],
+            "FirstName": customers["C_F_NAME"],
+            "MiddleInitial": customers["C_M_NAME"],
+            "Gender": gender,
+            "Tier": customers["C_TIER"],
+            "DOB": customers["C_DOB"],
+            "AddressLine1": customers["C_ADLINE1"],
+            "AddressLine2": customers["C_ADLINE2"],
+            "PostalCode": customers["C_ZIPCODE"],
+            "City": customers["C_CITY"],
+            "StateProv": customers["C_STATE_PROV"],
+            "Country": customers["C_CTRY"],
+            "Phone1": get_cust_phones(1, customers),
+            "Phone2": get_cust_phones(2, customers),
+            "Phone3": get_cust_phones(3, customers),
+            "Email1": customers["C_PRIM_EMAIL"],
+            "Email2": customers["C_ALT_EMAIL"],
+            "NationalTaxRateDesc": customers["C_NAT_TX_ID"].map(tax_names),
+            "NationalTaxRate": customers["C_NAT_TX_ID"].map(tax_rates),
+            "LocalTaxRateDesc": customers["C_LCL_TX_ID"].map(tax_names),
+            "LocalTaxRate": customers["C_LCL_TX_ID"].map(tax_rates),
+            "IsCurrent": True,
+            "BatchID": self.batch_number,
+            "EffectiveDate": batch_date,
+            "EndDate": "9999-12-31"})
+        df_customers = self.match_prospects(df_customers)
         df_customers.replace("", np.nan, inplace=True)
-        df_customers["SK_CustomerID"] = df_customers.index
 
-        con = get_mysql_engine(self.db_name, self.config)
-        df_customers.to_sql("DimCustomer", index=False, if_exists="append", con=con)
-        df_messages.to_sql("DImessages", index=False, if_exists="append", con=con)
+        self.close_versions("DimCustomer", "CustomerID", customers["C_ID"], batch_date)
+        self.executor.load_frame(df_customers, "DimCustomer")
+        self.executor.load_frame(self.customer_alerts(customers), "DImessages")
 
     #TODO: ADD DDL to Dim Account, Insert DImessages as well
     def load_target_dim_account(self):
@@ -1390,162 +1301,151 @@ class TPCDI_Loader():
                 EndDate DATE NOT NULL
                 );
             """
-        dim_account_ddl_cmd = TPCDI_Loader.BASE_MYSQL_CMD + " -D " + self.db_name + " -e \"" + dim_account_ddl + "\""
 
         # Execute the command
-        os.system(dim_account_ddl_cmd)
+        self.executor.execute(dim_account_ddl)
 
-        conn = get_mysql_conn(self.db_name, self.config)
-        query = "SELECT * FROM S_Customer"
-        s_customer = pd.read_sql(query, conn)
-        conn.close()
-        s_customer = s_customer[['ActionType', 'ActionTS', 'C_ID', 'CA_ID', 'CA_TAX_ST', 'CA_B_ID', 'CA_NAME']]
-        s_customer.set_index('CA_ID', inplace=True)
-
-        conn = get_mysql_conn(self.db_name,self.config)
-        query = "SELECT SK_BROKERID, BrokerID FROM DimBroker"
-        dim_broker = pd.read_sql(query, conn)
-        conn.close()
-        dim_broker.set_index('SK_BROKERID', inplace=True)
-
-        conn = get_mysql_conn(self.db_name, self.config)
-        query = "SELECT SK_CustomerID, CustomerID, EffectiveDate, EndDate FROM DimCustomer"
-        dim_customer = pd.read_sql(query, conn)
-        dim_customer.SK_CustomerID = dim_customer.SK_CustomerID.astype('int64')
-        conn.close()
-        dim_customer.set_index('SK_CustomerID', inplace=True)
-
-        columns = ['AccountID', 'SK_BrokerID', 'SK_CustomerID',
-                   'Status', 'AccountDesc', 'TaxStatus', 'IsCurrent',
-                   'BatchID', 'EffectiveDate', 'EndDate']
-        dim_account = pd.DataFrame(columns=columns)
-        nrow = dict()
-
-        for index, row in s_customer.iterrows():
-
-            action_type = row['ActionType']
-            if action_type in ["NEW", "ADDACT"]:
+        query = "SELECT ActionType, ActionTS, C_ID, CA_ID, CA_TAX_ST, CA_B_ID, CA_NAME FROM S_Customer"
+        s_customer = self.executor.read_frame(query)
 
-                nrow['AccountID'] = index
-                nrow['AccountDesc'] = row.CA_NAME
-                nrow['TaxStatus'] = row.CA_TAX_ST
-                nrow['EffectiveDate'] = row.ActionTS[:10]
-                nrow['EndDate'] = "9999-12-31"
-                nrow['IsCurrent'] = 1
-                nrow['BatchID'] = 1
-                nrow['Status'] = 'Active'
+        query = "SELECT SK_BrokerID, BrokerID FROM DimBroker"
+        dim_broker = self.executor.read_frame(query)
+        brokers = dict(zip(dim_broker['BrokerID'], dim_broker['SK_BrokerID']))
 
-                r = dim_broker.loc[dim_broker['BrokerID'] == row.CA_B_ID]
-                if r.shape[0] > 0:
-                    nrow['SK_BrokerID'] = r.index[0]
-
-                r = dim_customer[(dim_customer['CustomerID'] == row.C_ID) &
-                                 (dim_customer['EffectiveDate'] <= datetime.strptime(row.ActionTS[:10],
-                                                                                     "%Y-%m-%d").date()) &
-                                 (dim_customer['EndDate'] > datetime.strptime(row.ActionTS[:10], "%Y-%m-%d").date())]
-
-                if r.shape[0] > 0:
-                    nrow['SK_CustomerID'] = r.index[0]
+        query = "SELECT SK_CustomerID, CustomerID, EffectiveDate, EndDate FROM DimCustomer"
+        dim_customer = self.executor.read_frame(query)
+        dim_customer.SK_CustomerID = dim_customer.SK_CustomerID.astype('int64')
 
-                dim_account = dim_account.append(nrow, ignore_index=True)
+        # Customer version in effect at every action, found with one batched as-of lookup
+        customers = AsOf_Lookup(dim_customer['CustomerID'], dim_customer['SK_CustomerID'],
+                                dim_customer['EffectiveDate'], dim_customer['EndDate'])
+        s_customer['SK_CustomerID'] = customers.lookup(s_customer['C_ID'], s_customer['ActionTS'])
+
+        dim_account = Column_Builder({
+            'AccountID': np.int64, 'SK_BrokerID': np.int64, 'SK_CustomerID': np.int64, 'Status': object,
+            'AccountDesc': object, 'TaxStatus': object, 'IsCurrent': np.int8, 'BatchID': np.int64,
+            'EffectiveDate': object, 'EndDate': object}, capacity=len(s_customer))
+
+        # Position of the current version of every account, and the accounts every customer holds
+        current = {}
+        owners = {}
+        holdings = {}
+
+        def add_version(account, action_ts):
+            # Close the current version of the account, then append its new version
+            position = current.get(account['AccountID'])
+            if position is not None:
+                dim_account.columns['EndDate'][position] = action_ts
+                dim_account.columns['IsCurrent'][position] = 0
+            account.update(IsCurrent=1, BatchID=1, EffectiveDate=action_ts, EndDate="9999-12-31")
+            current[account['AccountID']] = dim_account.append(account)
+
+        def set_owner(account_id, customer_id):
+            holdings.get(owners.get(account_id), {}).pop(account_id, None)
+            owners[account_id] = customer_id
+            holdings.setdefault(customer_id, {})[account_id] = None
+
+        for action_type, action_ts, c_id, ca_id, tax_status, broker_id, name, sk_customer_id in zip(
+                s_customer['ActionType'], s_customer['ActionTS'], s_customer['C_ID'], s_customer['CA_ID'],
+                s_customer['CA_TAX_ST'], s_customer['CA_B_ID'], s_customer['CA_NAME'], s_customer['SK_CustomerID']):
+            action_ts = action_ts[:10]
+            tax_status = tax_status if pd.notna(tax_status) else None
+
+            if action_type in ["NEW", "ADDACCT", "ADDACT"]:
+                add_version({'AccountID': ca_id, 'SK_BrokerID': brokers.get(broker_id, -1),
+                             'SK_CustomerID': sk_customer_id, 'Status': TPCDI_Loader.ACTIVE, 'AccountDesc': name,
+                             'TaxStatus': tax_status}, action_ts)
+                set_owner(ca_id, c_id)
 
             elif action_type == "UPDACCT":
-                new_account = dim_account[dim_account['AccountID'] == index].tail(1).copy()
-                old_account = new_account.copy()
-                new_account['EffectiveDate'] = row.ActionTS[:10]
-                new_account['EndDate'] = "9999-12-31"
-
-                for field in row.index:
-                    if row[field] is None:
-                        continue
-
-                    if field == 'C_ID':
-                        r = dim_customer[(dim_customer['CustomerID'] == row.C_ID) &
-                                         (dim_customer['EffectiveDate'] <= datetime.strptime(row.ActionTS[:10],
-                                                                                             "%Y-%m-%d").date()) &
-                                         (dim_customer['EndDate'] > datetime.strptime(row.ActionTS[:10],
-                                                                                      "%Y-%m-%d").date())]
-
-                        if r.shape[0] > 0:
-                            new_account['SK_CustomerID'] = r.index[0]
-
-                    if field == 'CA_TAX_ST':
-                        new_account['TaxStatus'] = row.CA_TAX_ST
-
-                    if field == 'CA_B_ID':
-                        r = dim_broker.loc[dim_broker['BrokerID'] == row.CA_B_ID]
-
-                        if r.shape[0] > 0:
-                            new_account['SK_BrokerID'] = r.index[0]
-
-                    if field == 'CA_NAME':
-                        new_account['AccountDesc'] = row.CA_NAME
-
-                old_account['EndDate'] = row.ActionTS[:10]
-                old_account['IsCurrent'] = 0
-                dim_account.update(old_account)
-                dim_account = dim_account.append(new_account, ignore_index=True)
-
-            elif action_type == 'CLOSEACCT':
-                new_accounts = dim_account[dim_account['AccountID'] == index].tail(1).copy()
-                old_accounts = new_accounts.copy()
-                new_accounts['EffectiveDate'] = row.ActionTS[:10]
-                new_accounts['Status'] = 'INACTIVE'
-                old_accounts['EndDate'] = row.ActionTS
-                dim_account.update(old_accounts)
-                dim_account = dim_account.append(new_accounts, ignore_index=True)
-
-            elif action_type == 'UPDCUST':
-
-                customer = dim_customer[(dim_customer['CustomerID'] == row.C_ID) & (
-                        (dim_customer['EffectiveDate'] == datetime.strptime(row.ActionTS[:10], "%Y-%m-%d").date()) |
-                        (dim_customer['EndDate'] == datetime.strptime(row.ActionTS[:10], "%Y-%m-%d").date()))]
-
-                if customer.empty:
+                if ca_id not in current:
                     continue
-
-                old_accounts = dim_account[dim_account['SK_CustomerID'] == customer.head(1).index[0]].copy()
-                new_accounts = old_accounts.copy()
-                new_accounts.loc[:, 'SK_CustomerID'] = int(customer.tail(1).index[0])
-                new_accounts.loc[:, 'EffectiveDate'] = row.ActionTS[:10]
-                new_accounts.loc[:, 'EndDate'] = "9999-12-31"
-                old_accounts.loc[:, 'EndDate'] = row.ActionTS[:10]
-                dim_account.update(old_accounts)
-                dim_account = dim_account.append(new_accounts, ignore_index=True)
-
-            elif action_type == 'INACT':
-
-                customer = dim_customer[(dim_customer['CustomerID'] == row.C_ID) & (
-                        (dim_customer['EffectiveDate'] == row.ActionTS[:10]) |
-                        (dim_customer['EndDate'] == row.ActionTS[:10]))]
-
-                if customer.empty:
+                account = dim_account.row(current[ca_id])
+                if sk_customer_id >= 0:
+                    account['SK_CustomerID'] = sk_customer_id
+                    set_owner(ca_id, c_id)
+                if tax_status is not None:
+                    account['TaxStatus'] = tax_status
+                if broker_id in brokers:
+                    account['SK_BrokerID'] = brokers[broker_id]
+                if pd.notna(name):
+                    account['AccountDesc'] = name
+                add_version(account, action_ts)
+
+            elif action_type == "CLOSEACCT":
+                if ca_id not in current:
                     continue
+                account = dim_account.row(current[ca_id])
+                account['Status'] = TPCDI_Loader.INACTIVE
+                add_version(account, action_ts)
 
-                old_accounts = dim_account[dim_account['SK_CustomerID'] == customer.head(1).index[0]].copy()
-                new_accounts = old_accounts.copy()
-                new_accounts.loc[:, 'SK_CustomerID'] = int(customer.tail(1).index[0])
-                new_accounts.loc[:, 'Status'] = 'INACTIVE'
-                new_accounts.loc[:, 'IsCurrent'] = 0
-                new_accounts.loc[:, 'EffectiveDate'] = row.ActionTS[:10]
-                new_accounts.loc[:, 'EndDate'] = "9999-12-31"
-                old_accounts.loc[:, 'EndDate'] = row.ActionTS[:10]
-
-                dim_account.update(old_accounts)
-                dim_account = dim_account.append(new_accounts, ignore_index=True)
-
+            elif action_type in ["UPDCUST", "INACT"]:
+                # Every account of the customer moves to the customer version the action created
+                if sk_customer_id < 0:
+                    continue
+                for account_id in list(holdings.get(c_id, ())):
+                    account = dim_account.row(current[account_id])
+                    account['SK_CustomerID'] = sk_customer_id
+                    if action_type == "INACT":
+                        account['Status'] = TPCDI_Loader.INACTIVE
+                    add_version(account, action_ts)
+
+        dim_account = dim_account.frame()
         dim_account.index.name = 'SK_AccountID'
-        dim_account.fillna(value={'SK_BrokerID': -1}, inplace=True)
 
-        dim_account['SK_CustomerID'] = dim_account['SK_CustomerID'].astype('int32')
-        dim_account['SK_BrokerID'] = dim_account['SK_BrokerID'].astype('int32')
-        dim_account.index.astype('int32', copy=False)
-        dim_account['AccountID'] = dim_account['AccountID'].astype('int32')
-        dim_account['BatchID'] = dim_account['BatchID'].astype('int32')
-        dim_account['IsCurrent'] = dim_account['IsCurrent'].astype('int32')
+        self.executor.load_frame(dim_account.reset_index(), 'DimAccount')
 
-        con = get_mysql_engine(self.db_name,self.config)
-        dim_account.to_sql(con=con, name='DimAccount', if_exists='append')
+    def load_incremental_dim_account(self):
+        """
+    Apply the account changes of Account.txt to DimAccount: the current version of every changed account is closed on
+    the batch date and its new version appended. Accounts of a customer that got a new version in this batch move to
+    it as well, and become inactive with their customer.
+    """
+        batch_date = self.current_batch_date()
+        accounts = pd.DataFrame(Delimited_Reader(ACCOUNT_CDC_SCHEMA).read(self.batch_dir + "Account.txt"))
+        accounts = accounts.drop_duplicates("CA_ID", keep="last")
+
+        query = "SELECT SK_BrokerID, BrokerID FROM DimBroker WHERE IsCurrent"
+        dim_broker = self.executor.read_frame(query)
+        brokers = dict(zip(dim_broker["BrokerID"], dim_broker["SK_BrokerID"]))
+
+        query = "SELECT SK_CustomerID, CustomerID FROM DimCustomer WHERE IsCurrent"
+        dim_customer = self.executor.read_frame(query)
+        customers = dict(zip(dim_customer["CustomerID"], dim_customer["SK_CustomerID"]))
+
+        changed = pd.DataFrame({
+            "AccountID": accounts["CA_ID"],
+            "SK_BrokerID": accounts["CA_B_ID"].map(brokers),
+            "SK_CustomerID": accounts["CA_C_ID"].map(customers),
+            "Status": accounts["CA_ST_ID"].map(TPCDI_Loader.STATUS_NAMES),
+            "AccountDesc": accounts["CA_NAME"],
+            "TaxStatus": accounts["CA_TAX_ST"]})
+
+        # Current versions of the other accounts still referring to a customer version this batch closed
+        query = """
+        SELECT A.AccountID, A.SK_BrokerID, C.SK_CustomerID, IF(C.Status = '%(inactive)s', '%(inactive)s', A.Status) Status,
+               A.AccountDesc, A.TaxStatus
+        FROM DimAccount A
+        JOIN DimCustomer O ON A.SK_CustomerID = O.SK_CustomerID
+        JOIN DimCustomer C ON C.CustomerID = O.CustomerID AND C.IsCurrent
+        WHERE A.IsCurrent AND NOT O.IsCurrent
+        """ % {"inactive": TPCDI_Loader.INACTIVE}
+        moved = self.executor.read_frame(query)
+        moved = moved[~moved["AccountID"].isin(changed["AccountID"])]
+
+        dim_account = pd.concat([changed, moved], ignore_index=True)
+        if dim_account.empty:
+            return
+        dim_account["SK_BrokerID"] = dim_account["SK_BrokerID"].fillna(-1).astype(np.int64)
+        dim_account["SK_CustomerID"] = dim_account["SK_CustomerID"].fillna(-1).astype(np.int64)
+        dim_account["SK_AccountID"] = self.next_surrogate_key("DimAccount", "SK_AccountID") + np.arange(len(dim_account))
+        dim_account["IsCurrent"] = True
+        dim_account["BatchID"] = self.batch_number
+        dim_account["EffectiveDate"] = batch_date
+        dim_account["EndDate"] = "9999-12-31"
+
+        self.close_versions("DimAccount", "AccountID", dim_account["AccountID"], batch_date)
+        self.executor.load_frame(dim_account, "DimAccount")
 
     def load_target_dim_trade(self):
 
@@ -1576,85 +1476,224 @@ class TPCDI_Loader():
         );
         """
 
-        dim_trade_ddl_load_query = """
-        INSERT INTO DimTrade (SK_CreateDateID, SK_CreateTimeID, SK_CloseDateID, SK_CloseTimeID, TradeID, CashFlag, 
-        Quantity, BidPrice, ExecutedBy, TradePrice, Fee, Commission, Tax, Status, Type, SK_SecurityID, SK_CompanyID,
-        SK_AccountID, SK_CustomerID, SK_BrokerID, BatchID)
-        SELECT 
-        Case When (sth.th_st_id = 'SBMT' and (sth.t_tt_id = 'TMB' or sth.t_tt_id ='TMS')) or (sth.th_st_id = 'PNDG') 
-             then D.SK_DateID else NULL
-        end,
-        Case When (sth.th_st_id = 'SBMT' and (sth.t_tt_id = 'TMB' or sth.t_tt_id ='TMS')) or (sth.th_st_id = 'PNDG') 
-             then T.SK_TimeID else NULL
-        end,
-        case when (sth.th_st_id = 'CMPT' or sth.th_st_id = 'CNCL') then D.SK_DateID else NULL
-        end,
-        case when (sth.th_st_id = 'CMPT' or sth.th_st_id = 'CNCL') then T.SK_TimeID else NULL
-        end,
-        sth.T_ID, sth.T_IS_CASH, sth.T_QTY, sth.T_BID_PRICE, sth.T_EXEC_NAME, sth.T_TRADE_PRICE, sth.T_CHRG,
-        sth.T_COMM, sth.T_TAX, st.ST_NAME, tt.TT_NAME, 
-        case when (date(sth.th_dts) >= ds.EffectiveDate) and (date(sth.th_dts) <= ds.EndDate) 
-            then ds.SK_SecurityID END,
-        case when (date(sth.th_dts) >= ds.EffectiveDate) and (date(sth.th_dts) <= ds.EndDate) 
-            then ds.SK_CompanyID END,
-        case when (date(sth.th_dts) >= ds.EffectiveDate) and (date(sth.th_dts) <= ds.EndDate) 
-            then da.SK_AccountID END,
-        case when (date(sth.th_dts) >= ds.EffectiveDate) and (date(sth.th_dts) <= ds.EndDate) 
-            then da.SK_CustomerID END,
-        case when (date(sth.th_dts) >= ds.EffectiveDate) and (date(sth.th_dts) <= ds.EndDate) 
-            then da.SK_BrokerID END,
-        1
-        from S_Trade_Joined sth 
-        join StatusType st on sth.T_ST_ID = st.ST_ID 
-        join TradeType tt on sth.T_TT_ID = tt.TT_ID
-        join DimSecurity ds on sth.T_S_SYMB = ds.Symbol
-        join DimAccount da on sth.T_CA_ID = da.AccountID
-        JOIN DimDate D on DATE(sth.th_dts) = D.DateValue
-        join DimTime T on Time(sth.th_dts) = T.TimeValue
-        
-        ON DUPLICATE KEY UPDATE  SK_CloseDateID = D.SK_DateID, SK_CloseTimeID = T.SK_TimeID;
-        """
+        self.executor.execute(dim_trade_ddl)
 
-        # Construct mysql client bash command to execute ddl and data loading query
-        dim_trade_ddl_cmd = TPCDI_Loader.BASE_MYSQL_CMD + " -D " + self.db_name + " -e \"" + dim_trade_ddl + "\""
-        dim_trade_ddl_load_query_cmd = TPCDI_Loader.BASE_MYSQL_CMD + " --local-infile=1 -D " + self.db_name + " -e \"" + dim_trade_ddl_load_query + "\""
+        to_dim_trade = self.dim_trade_builder()
 
-        # Execute the command
-        os.system(dim_trade_ddl_cmd)
-        os.system(dim_trade_ddl_load_query_cmd)
+        # Trades are merged with their history by trade id and folded into finished rows, loaded a batch at a time
+        trades = iter_trade_lifecycles(sort_merge_join(self.batch_dir + "Trade.txt", self.batch_dir + "TradeHistory.txt",
+                                                       0, 0, CSV_Transformer('|', TRADE_SCHEMA),
+                                                       CSV_Transformer('|', TRADE_HISTORY_SCHEMA), workers=self.workers))
+        while True:
+            batch = list(islice(trades, 500000))
+            if not batch:
+                break
+            self.executor.load_frame(to_dim_trade(batch), "DimTrade")
+
+    def load_incremental_dim_trade(self):
+        """
+    Apply the trade changes of Trade.txt to DimTrade. The records of a trade are its history: they set its create
+    and close time like the history events of the historical load, and the last one gives its state. New trades are
+    appended, trades already loaded keep the keys of their creation and take their new status, prices and close time.
+    """
+        trades = pd.DataFrame(Delimited_Reader(TRADE_CDC_SCHEMA).read(self.batch_dir + "Trade.txt"))
+        if trades.empty:
+            return
+        status = trades["T_ST_ID"]
+        created = (status == "PNDG") | ((status == "SBMT") & trades["T_TT_ID"].isin(["TMB", "TMS"]))
+        trades["Created"] = trades["T_DTS"].where(created)
+        trades["Closed"] = trades["T_DTS"].where(status.isin(["CMPT", "CNCL"]))
+        events = trades.groupby("T_ID", sort=False)[["Created", "Closed"]].last()
+        trades = trades.drop_duplicates("T_ID", keep="last").set_index("T_ID", drop=False)
+        trades[["Created", "Closed"]] = events
+
+        dim_trade = self.dim_trade_builder()(
+            trades[[column.name for column in TRADE_SCHEMA] + ["Created", "Closed"]].values.tolist())
+
+        self.executor.execute("DROP TABLE IF EXISTS S_DimTrade_Changes; CREATE TABLE S_DimTrade_Changes LIKE DimTrade;")
+        self.executor.load_frame(dim_trade, "S_DimTrade_Changes")
+        merge_trade_query = """
+        INSERT INTO DimTrade
+        SELECT * FROM S_DimTrade_Changes C
+        ON DUPLICATE KEY UPDATE
+            SK_CreateDateID = COALESCE(DimTrade.SK_CreateDateID, C.SK_CreateDateID),
+            SK_CreateTimeID = COALESCE(DimTrade.SK_CreateTimeID, C.SK_CreateTimeID),
+            SK_CloseDateID = COALESCE(C.SK_CloseDateID, DimTrade.SK_CloseDateID),
+            SK_CloseTimeID = COALESCE(C.SK_CloseTimeID, DimTrade.SK_CloseTimeID),
+            Status = C.Status, Type = C.Type, CashFlag = C.CashFlag, Quantity = C.Quantity, BidPrice = C.BidPrice,
+            ExecutedBy = C.ExecutedBy, TradePrice = C.TradePrice, Fee = C.Fee, Commission = C.Commission, Tax = C.Tax,
+            BatchID = C.BatchID;
+        DROP TABLE S_DimTrade_Changes;
+        """
+        self.executor.execute(merge_trade_query)
+
+    def dim_trade_builder(self):
+        """
+    Read the names and surrogate keys trades refer to, and return the function turning finished trades
+    (TRADE_SCHEMA fields followed by their create and close timestamps) into DimTrade rows.
+    """
+        # Lookups of the names and surrogate keys trades refer to
+        query = "SELECT ST_ID, ST_NAME FROM StatusType"
+        status_type = self.executor.read_frame(query)
+        status_names = dict(zip(status_type["ST_ID"], status_type["ST_NAME"]))
+
+        query = "SELECT TT_ID, TT_NAME FROM TradeType"
+        trade_type = self.executor.read_frame(query)
+        type_names = dict(zip(trade_type["TT_ID"], trade_type["TT_NAME"]))
+
+        query = "SELECT SK_SecurityID, SK_CompanyID, Symbol, EffectiveDate, EndDate FROM DimSecurity"
+        dim_security = self.executor.read_frame(query)
+        securities = AsOf_Lookup(dim_security["Symbol"], np.arange(len(dim_security)),
+                                 dim_security["EffectiveDate"], dim_security["EndDate"])
+
+        query = "SELECT SK_AccountID, SK_CustomerID, SK_BrokerID, AccountID, EffectiveDate, EndDate FROM DimAccount"
+        dim_account = self.executor.read_frame(query)
+        accounts = AsOf_Lookup(dim_account["AccountID"], np.arange(len(dim_account)),
+                               dim_account["EffectiveDate"], dim_account["EndDate"])
+
+        query = "SELECT SK_DateID, DateValue FROM DimDate"
+        dim_date = self.executor.read_frame(query)
+        date_ids = pd.Series(dim_date["SK_DateID"].values, index=dim_date["DateValue"].astype(str))
+
+        query = "SELECT SK_TimeID, TimeValue FROM DimTime"
+        dim_time = self.executor.read_frame(query)
+        time_ids = pd.Series(dim_time["SK_TimeID"].values,
+                             index=pd.to_timedelta(dim_time["TimeValue"]).dt.total_seconds().astype(np.int64))
+
+        def pick(frame, column, position):
+            # Value of the column at every version found, NULL where the lookup found none
+            return pd.array(frame[column].values, dtype="Int64").take(position, allow_fill=True)
+
+        def date_key(ts):
+            return pd.array(ts.str[:10].map(date_ids), dtype="Int64")
+
+        def time_key(ts):
+            seconds = pd.to_timedelta(ts.str[11:19], errors="coerce").dt.total_seconds()
+            return pd.array(seconds.map(time_ids), dtype="Int64")
+
+        def to_dim_trade(batch):
+            trades = pd.DataFrame(batch, columns=[column.name for column in TRADE_SCHEMA] + ["Created", "Closed"])
+            trades = trades.astype(object).where(trades.notna() & (trades != ""), None)
+            # Security and account versions in effect when the trade was created
+            as_of = trades["Created"].fillna(trades["T_DTS"])
+            security = securities.lookup(trades["T_S_SYMB"], as_of)
+            account = accounts.lookup(trades["T_CA_ID"].astype(np.int64), as_of)
+            dim_trade = pd.DataFrame({
+                "TradeID": trades["T_ID"].astype(np.int64),
+                "SK_BrokerID": pick(dim_account, "SK_BrokerID", account),
+                "SK_CreateDateID": date_key(trades["Created"]),
+                "SK_CreateTimeID": time_key(trades["Created"]),
+                "SK_CloseDateID": date_key(trades["Closed"]),
+                "SK_CloseTimeID": time_key(trades["Closed"]),
+                "Status": trades["T_ST_ID"].map(status_names),
+                "Type": trades["T_TT_ID"].map(type_names),
+                "CashFlag": trades["T_IS_CASH"],
+                "SK_SecurityID": pick(dim_security, "SK_SecurityID", security),
+                "SK_CompanyID": pick(dim_security, "SK_CompanyID", security),
+                "Quantity": trades["T_QTY"],
+                "BidPrice": trades["T_BID_PRICE"],
+                "SK_CustomerID": pick(dim_account, "SK_CustomerID", account),
+                "SK_AccountID": pick(dim_account, "SK_AccountID", account),
+                "ExecutedBy": trades["T_EXEC_NAME"],
+                "TradePrice": trades["T_TRADE_PRICE"],
+                "Fee": trades["T_CHRG"],
+                "Commission": trades["T_COMM"],
+                "Tax": trades["T_TAX"],
+                "BatchID": self.batch_number})
+            return dim_trade[dim_trade["Status"].notna() & dim_trade["Type"].notna()]
+
+        return to_dim_trade
 
     def load_target_fact_cash_balance(self):
         """
-        create FactCashBalances table
+        create FactCashBalances table, with the closing cash balance of every account on every day it had transactions.
+        CashTransaction.txt is streamed in chunks and reduced to one net amount per account and day, the balances
+        are the running sums of those amounts, so every key is written exactly once.
         """
         # Create ddl to store tradeType
         fact_cash_balance_ddl = """
         USE """ + self.db_name + """;
 
         CREATE TABLE FactCashBalances (
-            SK_CustomerID INTEGER NOT NULL PRIMARY KEY,
+            SK_CustomerID INTEGER NOT NULL,
             SK_AccountID INTEGER NOT NULL,
             SK_DateID INTEGER(10) Not NULL,
-            Cash INTEGER Not NULL,
-            BatchID numeric(5) Not NULL
+            Cash NUMERIC(15,2) Not NULL,
+            BatchID numeric(5) Not NULL,
+            PRIMARY KEY(SK_AccountID, SK_DateID)
           );
         """
-        fact_cash_balance_load_query = """
-              INSERT INTO FactCashBalances (SK_CustomerID,SK_AccountID,SK_DateID,Cash,BatchID)
-              SELECT C.CT_CA_ID, A.SK_AccountID, D.SK_DateID , C.CT_AMT , 1
-              FROM S_Cash_Balances C
-              JOIN DimAccount A ON C.CT_CA_ID = A.SK_CustomerID
-              JOIN DimDate D on DATE(C.CT_DTS) = D.DateValue
-              where A.IsCurrent = true
-              ON DUPLICATE KEY UPDATE Cash = (Cash + C.CT_AMT);
-            """
-        # Construct mysql client bash command to execute ddl and data loading query
-        fact_cash_balance_ddl_cmd = TPCDI_Loader.BASE_MYSQL_CMD + " -D " + self.db_name + " -e \"" + fact_cash_balance_ddl + "\""
-        fact_cash_balance_load_cmd = TPCDI_Loader.BASE_MYSQL_CMD + " --local-infile=1 -D " + self.db_name + " -e \"" + fact_cash_balance_load_query + "\""
+        self.executor.execute(fact_cash_balance_ddl)
 
-        # Execute the command
-        os.system(fact_cash_balance_ddl_cmd)
-        os.system(fact_cash_balance_load_cmd)
+        daily = self.read_daily_cash(CASH_TRANSACTION_SCHEMA)
+        if daily is None:
+            return
+        daily["Cash"] = daily.groupby("AccountID")["Cents"].cumsum() / 100
+
+        self.executor.load_frame(self.to_fact_cash_balances(daily), "FactCashBalances")
+
+    def load_incremental_fact_cash_balance(self):
+        """
+    Append the balances of the accounts with transactions in the CashTransaction.txt of the batch, the running sums
+    starting from the last balance of every account.
+    """
+        daily = self.read_daily_cash(CASH_TRANSACTION_CDC_SCHEMA)
+        if daily is None:
+            return
+
+        # Closing balance of every account before this batch, whatever account version it was recorded on
+        query = """
+        SELECT AccountID, Cash
+        FROM (SELECT A.AccountID, F.Cash, ROW_NUMBER() OVER (PARTITION BY A.AccountID ORDER BY F.SK_DateID DESC) RN
+              FROM FactCashBalances F
+              JOIN DimAccount A ON F.SK_AccountID = A.SK_AccountID) B
+        WHERE RN = 1
+        """
+        balances = self.executor.read_frame(query)
+        opening = pd.Series(np.round(pd.to_numeric(balances["Cash"]).values * 100).astype(np.int64),
+                            index=balances["AccountID"].values)
+        daily["Cash"] = (daily["AccountID"].map(opening).fillna(0).astype(np.int64) +
+                         daily.groupby("AccountID")["Cents"].cumsum()) / 100
+
+        self.executor.load_frame(self.to_fact_cash_balances(daily), "FactCashBalances")
+
+    def read_daily_cash(self, schema):
+        """
+    Net amount of the CashTransaction.txt of the batch per account and day, in cents so running sums stay exact.
+    None when the file has no transactions.
+    """
+        daily = []
+        for batch in Delimited_Reader(schema).read_batches(self.batch_dir + "CashTransaction.txt"):
+            chunk = pd.DataFrame({"AccountID": batch["CT_CA_ID"], "Date": np.datetime_as_string(batch["CT_DTS"]),
+                                  "Cents": np.round(batch["CT_AMT"] * 100).astype(np.int64)})
+            daily.append(chunk.groupby(["AccountID", "Date"])["Cents"].sum())
+        if not daily:
+            return None
+        return pd.concat(daily).groupby(level=["AccountID", "Date"]).sum().reset_index()
+
+    def to_fact_cash_balances(self, daily):
+        """
+    FactCashBalances rows of the daily balances (AccountID, Date, Cash) of accounts.
+    """
+        # Account version in effect on every day, its position gives both surrogate keys
+        query = "SELECT SK_AccountID, AccountID, SK_CustomerID, EffectiveDate, EndDate FROM DimAccount"
+        dim_account = self.executor.read_frame(query)
+        accounts = AsOf_Lookup(dim_account["AccountID"], np.arange(len(dim_account)),
+                               dim_account["EffectiveDate"], dim_account["EndDate"])
+        position = accounts.lookup(daily["AccountID"], daily["Date"])
+        daily, position = daily[position >= 0], position[position >= 0]
+
+        query = "SELECT SK_DateID, DateValue FROM DimDate"
+        dim_date = self.executor.read_frame(query)
+        date_ids = pd.Series(dim_date["SK_DateID"].values, index=dim_date["DateValue"].astype(str))
+
+        fact_cash_balances = pd.DataFrame({
+            "SK_CustomerID": dim_account["SK_CustomerID"].values[position],
+            "SK_AccountID": dim_account["SK_AccountID"].values[position],
+            "SK_DateID": daily["Date"].map(date_ids).values,
+            "Cash": daily["Cash"].values,
+            "BatchID": self.batch_number})
+        return fact_cash_balances[fact_cash_balances["SK_DateID"].notna()]
 
     def load_target_dim_security(self):
         """
@@ -1706,34 +1745,11 @@ class TPCDI_Loader():
                         AND LEFT(SS.COMPANY_NAME_OR_CIK,1) <> '0';
     """
 
-        dim_security_scd = """
-    CREATE TABLE sdc_dimsecurity
-      LIKE DimSecurity;
-    ALTER TABLE sdc_dimsecurity
-      ADD COLUMN RN NUMERIC;
-    INSERT INTO sdc_dimsecurity
-    SELECT *, ROW_NUMBER() OVER(ORDER BY Symbol, EffectiveDate) RN
-    FROM DimSecurity;
 
-    WITH candidate AS (SELECT s1.SK_SecurityID, s2.EffectiveDate EndDate
-                      FROM sdc_dimsecurity s1
-                              JOIN sdc_dimsecurity s2 ON (s1.RN = (s2.RN - 1) AND s1.Symbol = s2.Symbol))
-    UPDATE DimSecurity, candidate
-    SET DimSecurity.EndDate   = candidate.EndDate,
-        DimSecurity.IsCurrent = FALSE
-    WHERE DimSecurity.SK_SecurityID = candidate.SK_SecurityID;
-    DROP TABLE sdc_dimsecurity;
-    """
-
-        # Construct mysql client bash command to execute ddl and data loading query
-        dim_security_ddl_cmd = TPCDI_Loader.BASE_MYSQL_CMD + " -D " + self.db_name + " -e \"" + security_ddl + "\""
-        dim_security_load_cmd = TPCDI_Loader.BASE_MYSQL_CMD + " --local-infile=1 -D " + self.db_name + " -e \"" + security_load_query + "\""
-        dim_security_scd_cmd = TPCDI_Loader.BASE_MYSQL_CMD + " -D " + self.db_name + " -e \"" + dim_security_scd + "\""
-
-        # Execute the command
-        os.system(dim_security_ddl_cmd)
-        os.system(dim_security_load_cmd)
-        os.system(dim_security_scd_cmd)
+        # Execute the ddl and data loading query
+        self.executor.execute(security_ddl)
+        self.executor.execute(security_load_query)
+        self.end_superseded_versions("DimSecurity", "SK_SecurityID", "Symbol")
 
     def load_target_financial(self):
         """
@@ -1780,13 +1796,9 @@ class TPCDI_Loader():
                           AND LEFT(CO_NAME_OR_CIK,1) <> '0'
     """
 
-        # Construct mysql client bash command to execute ddl and data loading query
-        dim_financial_ddl_cmd = TPCDI_Loader.BASE_MYSQL_CMD + " -D " + self.db_name + " -e \"" + financial_ddl + "\""
-        dim_financial_load_cmd = TPCDI_Loader.BASE_MYSQL_CMD + " --local-infile=1 -D " + self.db_name + " -e \"" + financial_load_query + "\""
-
-        # Execute the command
-        os.system(dim_financial_ddl_cmd)
-        os.system(dim_financial_load_cmd)
+        # Execute the ddl and data loading query
+        self.executor.execute(financial_ddl)
+        self.executor.execute(financial_load_query)
 
     def load_staging_fact_holding(self):
         """
@@ -1805,16 +1817,9 @@ class TPCDI_Loader():
        );
        """
 
-        # Create query to load text data into prospect table
-        holding_load_query = "LOAD DATA LOCAL INFILE 'staging/" + self.sf + "/Batch1/HoldingHistory.txt' INTO TABLE s_fact_holding COLUMNS TERMINATED BY '|';"
-
-        # Construct mysql client bash command to execute ddl and data loading query
-        holding_ddl_cmd = TPCDI_Loader.BASE_MYSQL_CMD + " -D " + self.db_name + " -e \"" + holding_ddl + "\""
-        holding_load_cmd = TPCDI_Loader.BASE_MYSQL_CMD + " --local-infile=1 -D " + self.db_name + " -e \"" + holding_load_query + "\""
-
-        # Execute the command
-        os.system(holding_ddl_cmd)
-        os.system(holding_load_cmd)
+        # Execute the ddl and data loading query
+        self.executor.execute(holding_ddl)
+        self.executor.load_file(self.batch_dir + "HoldingHistory.txt", "s_fact_holding")
 
     def load_target_fact_holding(self):
         """
@@ -1838,30 +1843,46 @@ class TPCDI_Loader():
                    BatchID numeric(5) Not NULL
                  );
                """
+
+        # Execute the ddl and data loading query
+        self.executor.execute(fact_holding_ddl)
+        self.merge_fact_holdings()
+
+    def load_incremental_fact_holding(self):
+        """
+    Stage the HoldingHistory.txt of the batch in s_fact_holding and merge it into FactHoldings.
+    """
+        self.executor.execute("DELETE FROM s_fact_holding;")
+        self.executor.load_file(self.batch_dir + "HoldingHistory.txt", "s_fact_holding",
+                                columns=["@CDC_FLAG", "@CDC_DSN", "HH_H_T_ID", "HH_T_ID", "HH_BEFORE_QTY", "HH_AFTER_QTY"])
+        self.merge_fact_holdings()
+
+    def merge_fact_holdings(self):
+        """
+    Insert the holdings staged in s_fact_holding into FactHoldings, holdings already there take their new quantity.
+    Keys the trade could not be resolved to are stored as 0, as MySQL does outside strict mode.
+    """
         fact_holding_load_query = """
                      INSERT INTO FactHoldings (TradeID,CurrentTradeID,SK_CustomerID,SK_AccountID,
                                                 SK_SecurityID, SK_CompanyID, SK_DateID, SK_TimeID, CurrentPrice,
                                                 CurrentHolding, BatchID)
-                     SELECT F.HH_H_T_ID, F.HH_T_ID, T.SK_CustomerID, T.SK_AccountID, 
-                     T.SK_SecurityID, T.SK_CompanyID, T.SK_CloseDateID, T.SK_CloseTimeID, T.TradePrice, \
-                     F.HH_AFTER_QTY, 1
-                     FROM s_fact_holding F
-                     JOIN DimTrade T ON F.HH_T_ID = T.TradeID
-                     ON DUPLICATE KEY UPDATE CurrentHolding = F.HH_AFTER_QTY, CurrentPrice = T.TradePrice;
-                   """
-
-        # Construct mysql client bash command to execute ddl and data loading query
-        fact_holding_ddl_cmd = TPCDI_Loader.BASE_MYSQL_CMD + " -D " + self.db_name + " -e \"" + fact_holding_ddl + "\""
-        fact_holding_load_cmd = TPCDI_Loader.BASE_MYSQL_CMD + " --local-infile=1 -D " + self.db_name + " -e \"" + fact_holding_load_query + "\""
-
-        # Execute the command
-        os.system(fact_holding_ddl_cmd)
-        os.system(fact_holding_load_cmd)
+                     SELECT * FROM (
+                       SELECT F.HH_H_T_ID, F.HH_T_ID, COALESCE(T.SK_CustomerID, 0), COALESCE(T.SK_AccountID, 0),
+                       COALESCE(T.SK_SecurityID, 0), COALESCE(T.SK_CompanyID, 0), COALESCE(T.SK_CloseDateID, 0),
+                       COALESCE(T.SK_CloseTimeID, 0), COALESCE(T.TradePrice, 0) CurrentPrice,
+                       F.HH_AFTER_QTY CurrentHolding, %s
+                       FROM s_fact_holding F
+                       JOIN DimTrade T ON F.HH_T_ID = T.TradeID) H
+                     ON DUPLICATE KEY UPDATE CurrentHolding = H.CurrentHolding, CurrentPrice = H.CurrentPrice;
+                   """ % str(self.batch_number)
+        self.executor.execute(fact_holding_load_query)
 
     def load_target_fact_watches(self):
         """
-        create FactWatches table
-         """
+        create FactWatches table, with one row per watch: WatchHistory.txt is streamed in time order, placements
+        are paired with their cancellation per (customer, symbol) in a dict, and the finished watches are resolved
+        to surrogate keys in memory and appended with a bulk load.
+        """
         # Create ddl to store FactWatches
         fact_watches_ddl = """
                USE """ + self.db_name + """;
@@ -1872,27 +1893,119 @@ class TPCDI_Loader():
                    SK_DateID_DatePlaced INTEGER NOT NULL,
                    SK_DateID_DateRemoved INTEGER ,
                    BatchID numeric(5) Not NULL, 
-                   PRIMARY KEY(SK_CustomerID, SK_SecurityID)
+                   PRIMARY KEY(SK_CustomerID, SK_SecurityID, SK_DateID_DatePlaced)
                  );
                """
-        fact_watches_load_query = """
-                     INSERT INTO FactWatches 
-                     SELECT C.CustomerID, S.SK_SecurityID, D.SK_DateID, Null ,1
-                     FROM S_Watches W
-                     JOIN DimCustomer C ON W.W_C_ID = C.CustomerID
-                     JOIN DimSecurity S ON S.Symbol = W.W_S_SYMB
-                    JOIN DimDate D on DATE(W.W_DTS) = D.DateValue
-                    ON DUPLICATE KEY UPDATE SK_DateID_DateRemoved = D.SK_DateID;
-                   """
-
-        # Construct mysql client bash command to execute ddl and data loading query
-        fact_watches_ddl_cmd = TPCDI_Loader.BASE_MYSQL_CMD + " -D " + self.db_name + " -e \"" + fact_watches_ddl + "\""
-        fact_watches_load_cmd = TPCDI_Loader.BASE_MYSQL_CMD + " --local-infile=1 -D " + self.db_name + " -e \"" + fact_watches_load_query + "\""
+        self.executor.execute(fact_watches_ddl)
 
-        # Execute the command
-        os.system(fact_watches_ddl_cmd)
-        os.system(fact_watches_load_cmd)
+        watches, _ = self.pair_watches(WATCH_HISTORY_SCHEMA)
+        self.executor.load_frame(self.to_fact_watches(watches), "FactWatches")
 
+    def load_incremental_fact_watches(self):
+        """
+    Apply the WatchHistory.txt of the batch to FactWatches: cancellations of watches placed in an earlier batch
+    close their open row, the watches placed in this batch are appended.
+    """
+        watches, removed = self.pair_watches(WATCH_HISTORY_CDC_SCHEMA)
+
+        # Open watches the batch closes, with the BatchID they had, so that an unfinished run can reopen them
+        self.executor.execute("""
+        CREATE TABLE IF NOT EXISTS FactWatches_Undo (
+            SK_CustomerID INTEGER NOT NULL,
+            SK_SecurityID INTEGER NOT NULL,
+            SK_DateID_DatePlaced INTEGER NOT NULL,
+            PriorBatchID numeric(5) NOT NULL,
+            BatchID numeric(5) NOT NULL
+        );
+        DELETE FROM FactWatches_Undo WHERE BatchID = %s;
+        """ % str(self.batch_number))
+
+        if not removed.empty:
+            query = "SELECT SK_DateID, DateValue FROM DimDate"
+            dim_date = self.executor.read_frame(query)
+            date_ids = pd.Series(dim_date["SK_DateID"].values, index=dim_date["DateValue"].astype(str))
+            removed["SK_DateID_DateRemoved"] = removed.pop("DateRemoved").map(date_ids)
+
+            self.executor.execute("""
+            DROP TABLE IF EXISTS S_Watches_Removed;
+            CREATE TABLE S_Watches_Removed (
+                CustomerID INTEGER NOT NULL,
+                Symbol CHAR(15) NOT NULL,
+                SK_DateID_DateRemoved INTEGER
+            );
+            """)
+            self.executor.load_frame(removed, "S_Watches_Removed")
+            self.executor.execute("""
+            INSERT INTO FactWatches_Undo
+            SELECT W.SK_CustomerID, W.SK_SecurityID, W.SK_DateID_DatePlaced, W.BatchID, %s
+            FROM FactWatches W
+            JOIN DimCustomer C ON W.SK_CustomerID = C.SK_CustomerID
+            JOIN DimSecurity S ON W.SK_SecurityID = S.SK_SecurityID
+            JOIN S_Watches_Removed R ON R.CustomerID = C.CustomerID AND R.Symbol = S.Symbol
+            WHERE W.SK_DateID_DateRemoved IS NULL;
+
+            UPDATE FactWatches W
+            JOIN DimCustomer C ON W.SK_CustomerID = C.SK_CustomerID
+            JOIN DimSecurity S ON W.SK_SecurityID = S.SK_SecurityID
+            JOIN S_Watches_Removed R ON R.CustomerID = C.CustomerID AND R.Symbol = S.Symbol
+            SET W.SK_DateID_DateRemoved = R.SK_DateID_DateRemoved, W.BatchID = %s
+            WHERE W.SK_DateID_DateRemoved IS NULL;
+            DROP TABLE S_Watches_Removed;
+            """ % (str(self.batch_number), str(self.batch_number)))
+
+        self.executor.load_frame(self.to_fact_watches(watches), "FactWatches")
+
+    def pair_watches(self, schema):
+        """
+    Pair the placements of the WatchHistory.txt of the batch with their cancellation: the file is streamed in time
+    order and open watches are kept in a dict by (customer, symbol).
+    Returns the watches (CustomerID, Symbol, DatePlaced, DateRemoved), and the cancellations of watches the file
+    does not place (CustomerID, Symbol, DateRemoved).
+    """
+        # Open watches by (customer, symbol) -> date placed, a cancellation closes the watch
+        placed = {}
+        watches = []
+        removed = []
+        for batch in Delimited_Reader(schema).read_batches(self.batch_dir + "WatchHistory.txt"):
+            for c_id, symbol, dts, action in zip(batch["W_C_ID"].tolist(), batch["W_S_SYMB"],
+                                                 np.datetime_as_string(batch["W_DTS"]).tolist(), batch["W_ACTION"]):
+                if action == "ACTV":
+                    placed.setdefault((c_id, symbol), dts)
+                elif action == "CNCL" and (c_id, symbol) in placed:
+                    watches.append((c_id, symbol, placed.pop((c_id, symbol)), dts))
+                elif action == "CNCL":
+                    removed.append((c_id, symbol, dts))
+        watches.extend((c_id, symbol, date_placed, None) for (c_id, symbol), date_placed in placed.items())
+        return (pd.DataFrame(watches, columns=["CustomerID", "Symbol", "DatePlaced", "DateRemoved"]),
+                pd.DataFrame(removed, columns=["CustomerID", "Symbol", "DateRemoved"]))
+
+    def to_fact_watches(self, watches):
+        """
+    FactWatches rows of the watches (CustomerID, Symbol, DatePlaced, DateRemoved).
+    """
+        # Customer and security versions in effect when the watch was placed
+        query = "SELECT SK_CustomerID, CustomerID, EffectiveDate, EndDate FROM DimCustomer"
+        dim_customer = self.executor.read_frame(query)
+        customers = AsOf_Lookup(dim_customer["CustomerID"], dim_customer["SK_CustomerID"],
+                                dim_customer["EffectiveDate"], dim_customer["EndDate"])
+
+        query = "SELECT SK_SecurityID, Symbol, EffectiveDate, EndDate FROM DimSecurity"
+        dim_security = self.executor.read_frame(query)
+        securities = AsOf_Lookup(dim_security["Symbol"], dim_security["SK_SecurityID"],
+                                 dim_security["EffectiveDate"], dim_security["EndDate"])
+
+        query = "SELECT SK_DateID, DateValue FROM DimDate"
+        dim_date = self.executor.read_frame(query)
+        date_ids = pd.Series(dim_date["SK_DateID"].values, index=dim_date["DateValue"].astype(str))
+
+        fact_watches = pd.DataFrame({
+            "SK_CustomerID": customers.lookup(watches["CustomerID"], watches["DatePlaced"]),
+            "SK_SecurityID": securities.lookup(watches["Symbol"], watches["DatePlaced"]),
+            "SK_DateID_DatePlaced": watches["DatePlaced"].map(date_ids),
+            "SK_DateID_DateRemoved": watches["DateRemoved"].map(date_ids).astype("Int64"),
+            "BatchID": self.batch_number})
+        return fact_watches[(fact_watches["SK_CustomerID"] >= 0) & (fact_watches["SK_SecurityID"] >= 0) &
+                            fact_watches["SK_DateID_DatePlaced"].notna()]
 
     def load_staging_daily_market(self):
         """
@@ -1911,15 +2024,7 @@ class TPCDI_Loader():
                            DM_VOL NUMERIC 
                          );
                        """
-        # Create query to load text data into prospect table
-        daily_market_load_query = "LOAD DATA LOCAL INFILE 'staging/" + self.sf + "/Batch1/DailyMarket.txt' INTO " \
-                                                                                 "TABLE S_DailyMarketHistory COLUMNS " \
-                                                                                 "TERMINATED BY '|';"
-
-        # Construct mysql client bash command to execute ddl and data loading query
-        daily_market_ddl_cmd = TPCDI_Loader.BASE_MYSQL_CMD + " -D " + self.db_name + " -e \"" + daily_market_ddl + "\""
-        daily_market_load_cmd = TPCDI_Loader.BASE_MYSQL_CMD + " --local-infile=1 -D " + self.db_name + " -e \"" + daily_market_load_query + "\""
 
-        # Execute the command
-        os.system(daily_market_ddl_cmd)
-        os.system(daily_market_load_cmd)
+        # Execute the ddl and data loading query
+        self.executor.execute(daily_market_ddl)
+        self.executor.load_file(self.batch_dir + "DailyMarket.txt", "S_DailyMarketHistory")
@@ -0,0 +1,160 @@
+import optparse
+import configparser
+import json
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+from utils import Stage_Metrics, get_executor, batch_numbers, git_revision
+from main import load
+
+
+def run_benchmark(scale_factors, repetitions, config, metrics_path, jobs=1, workers=1, keep=False, engine='mysql'):
+    """
+    Load every scale factor repetitions times into throwaway databases, measuring every stage.
+    Args:
+        scale_factors (list): Scale factors to load, each one generated in staging/<scalefactor>/.
+        repetitions (int): Number of loads of every scale factor.
+        config (config list): Config object retrieved from calling ConfigParser().read().
+        metrics_path (str): JSON lines file receiving the stage measurements.
+        jobs (int): Maximum number of load steps running in parallel.
+        workers (int): Number of processes used to parse flat files.
+        keep (bool): Keep the databases instead of dropping them after each load.
+        engine (str): Database engine the warehouse is loaded into, 'mysql' or 'sqlite'.
+    """
+    for sf in scale_factors:
+        batches = batch_numbers('staging/' + sf)
+        for repetition in range(repetitions):
+            db_name = "tpcdi_bench_sf%s_%i" % (sf.replace(".", "_"), repetition)
+            print("+----- benchmark sf %s, run %i of %i" % (sf, repetition + 1, repetitions))
+            metrics = Stage_Metrics(metrics_path, scale_factor=sf, repetition=repetition, jobs=jobs, workers=workers)
+            try:
+                load(sf, db_name, config, batches, jobs=jobs, workers=workers, metrics=metrics, engine=engine)
+            finally:
+                if not keep:
+                    executor = get_executor(engine, db_name, config, pool_size=1)
+                    executor.drop_database()
+                    executor.close()
+
+def read_metrics(path, revision=None):
+    """
+    Stage records of a metrics file, restricted to one revision of the loader when given.
+    """
+    records = pd.read_json(path, lines=True, dtype={"revision": str})
+    if revision is not None:
+        records = records[records["revision"] == revision]
+    records["scale_factor"] = records["scale_factor"].astype(float)
+    if "repetition" not in records:
+        records["repetition"] = 0
+    return records
+
+def stage_medians(records):
+    """
+    Median wall time of every stage (rows) at every scale factor (columns), over the repetitions and batches.
+    """
+    per_load = records.groupby(["stage", "scale_factor", "run", "repetition"])["wall_time"].sum()
+    return per_load.groupby(level=["stage", "scale_factor"]).median().unstack("scale_factor").sort_index(axis=1)
+
+def scaling_exponents(medians):
+    """
+    Exponent k of the time ~ SF^k fit of every stage, from a least squares line in log-log space.
+    1 means the stage scales linearly, above 1 it degrades as the data grows. NaN with less than 2 scale factors.
+    """
+    exponents = {}
+    for stage, times in medians.iterrows():
+        times = times[times > 0].dropna()
+        if len(times) < 2:
+            exponents[stage] = np.nan
+            continue
+        exponents[stage] = np.polyfit(np.log(times.index.values), np.log(times.values), 1)[0]
+    return pd.Series(exponents, name="exponent")
+
+def find_regressions(medians, baseline, threshold=0.1, min_time=1.0):
+    """
+    Stages and scale factors whose median time grew by more than threshold over the baseline.
+    Stages taking less than min_time seconds in both are too noisy to judge and are left out.
+    """
+    baseline = baseline.reindex(index=medians.index, columns=medians.columns)
+    compared = pd.DataFrame({"baseline": baseline.stack(), "current": medians.stack()}).dropna()
+    compared["ratio"] = compared["current"] / compared["baseline"]
+    slower = (compared["ratio"] > 1 + threshold) & (compared[["baseline", "current"]].max(axis=1) >= min_time)
+    return compared[slower]
+
+def save_baseline(path, medians, revision):
+    with open(path, "w") as baseline_file:
+        json.dump({"revision": revision,
+                   "medians": {stage: {str(sf): seconds for sf, seconds in times.dropna().items()}
+                               for stage, times in medians.iterrows()}}, baseline_file, indent=2, sort_keys=True)
+
+def load_baseline(path):
+    with open(path) as baseline_file:
+        baseline = json.load(baseline_file)
+    medians = pd.DataFrame(baseline["medians"]).T
+    medians.columns = medians.columns.astype(float)
+    return medians.sort_index(axis=1), baseline["revision"]
+
+if __name__ == "__main__":
+    # Parse user's option
+    parser = optparse.OptionParser(usage="usage: %prog [options]")
+    parser.add_option("-s", "--scalefactors", default="3,4,5,6",
+                      help="Comma separated scale factors to load (default 3,4,5,6)")
+    parser.add_option("-n", "--repetitions", default="3", help="Number of loads of every scale factor (default 3)")
+    parser.add_option(
+        "-j", "--jobs", default="1", help="Maximum number of load steps running in parallel (default 1)")
+    parser.add_option(
+        "-w", "--workers", default="1", help="Number of processes used to parse flat files (default 1)")
+    parser.add_option("-m", "--metrics",
+                      help="JSON lines file receiving the measurements (default results/benchmark_<time>.jsonl)")
+    parser.add_option("-r", "--report", action="store_true", default=False,
+                      help="Only report on the measurements already in the metrics file, for the current revision")
+    parser.add_option("-b", "--baseline", default="results/benchmark_baseline.json",
+                      help="Baseline the medians are compared with (default results/benchmark_baseline.json)")
+    parser.add_option("-t", "--threshold", default="0.1",
+                      help="Relative slowdown of a stage reported as a regression (default 0.1)")
+    parser.add_option("--min-time", default="1.0",
+                      help="Stages faster than this in seconds are not checked for regressions (default 1.0)")
+    parser.add_option("--save-baseline", action="store_true", default=False,
+                      help="Store the medians of this run as the new baseline")
+    parser.add_option("-e", "--engine", default="mysql", choices=["mysql", "sqlite"],
+                      help="Database engine, mysql or sqlite (default mysql)")
+    parser.add_option("--keep", action="store_true", default=False, help="Keep the benchmark databases")
+
+    (options, args) = parser.parse_args()
+
+    if options.report and not options.metrics:
+        parser.error("--report needs the metrics file to read (-m)")
+
+    revision = git_revision(os.path.dirname(os.path.abspath(__file__)))
+    metrics_path = options.metrics or "results/benchmark_%s.jsonl" % time.strftime("%Y%m%d_%H%M%S")
+
+    if not options.report:
+        # Read and retrieve config from the configfile
+        config = configparser.ConfigParser()
+        config.read('db.conf')
+        run_benchmark(options.scalefactors.split(","), int(options.repetitions), config, metrics_path,
+                      jobs=int(options.jobs), workers=int(options.workers), keep=options.keep,
+                      engine=options.engine)
+
+    medians = stage_medians(read_metrics(metrics_path, revision))
+    report = medians.join(scaling_exponents(medians))
+    print("Median wall time per stage (s) by scale factor, and time ~ SF^exponent:")
+    print(report.round(3).to_string())
+
+    regressions = pd.DataFrame()
+    if os.path.exists(options.baseline):
+        baseline, baseline_revision = load_baseline(options.baseline)
+        regressions = find_regressions(medians, baseline, float(options.threshold), float(options.min_time))
+        if regressions.empty:
+            print("No stage regressed by more than %s%% against %s" % (
+                float(options.threshold) * 100, baseline_revision))
+        else:
+            print("Stages slower by more than %s%% than %s:" % (float(options.threshold) * 100, baseline_revision))
+            print(regressions.round(3).to_string())
+
+    if options.save_baseline:
+        save_baseline(options.baseline, medians, revision)
+        print("Baseline saved to " + options.baseline)
+
+    sys.exit(1 if not regressions.empty else 0)
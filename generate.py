@@ -0,0 +1,601 @@
+import optparse
+import os
+import random
+from calendar import day_name, month_name
+from datetime import date, datetime, timedelta
+from xml.sax.saxutils import escape, quoteattr
+
+
+# Rows generated per unit of scale factor, close to the volumes of DIGen.jar at the same scale factor
+ROWS_PER_SF = {
+    "employees": 5000,
+    "customers": 5000,
+    "added_accounts": 5000,
+    "customer_updates": 2500,
+    "account_updates": 2500,
+    "account_closes": 500,
+    "inactivations": 250,
+    "companies": 500,
+    "company_updates": 50,
+    "securities": 700,
+    "prospects": 5000,
+    "trades": 130000,
+    "cash_transactions": 30000,
+    "watches": 40000,
+}
+
+# Timeline of the historical load: customers join from CUSTOMER_START, companies are listed from FINWIRE_START,
+# and the market (daily prices, trades, watches) is open from MARKET_START until the batch date
+BATCH_DATE = date(2017, 7, 7)
+CUSTOMER_START = date(2007, 7, 7)
+FINWIRE_START = date(1967, 1, 1)
+FINANCIAL_START = date(2012, 7, 1)
+MARKET_START = date(2015, 7, 6)
+DATE_RANGE = (date(1950, 1, 1), date(2020, 12, 31))
+
+INDUSTRIES = [("AD", "Aerospace & Defense", "IN"), ("AP", "Apparel & Accessories", "CC"),
+              ("BM", "Banking & Markets", "FN"), ("CE", "Computer Equipment", "TC"), ("CH", "Chemicals", "BM"),
+              ("FP", "Food Processing", "CS"), ("HC", "Health Care Providers", "HC"), ("IN", "Insurance", "FN"),
+              ("MI", "Mining", "BM"), ("OG", "Oil & Gas Operations", "EN"), ("RE", "Real Estate", "FN"),
+              ("RT", "Retail", "CC"), ("SW", "Software & Programming", "TC"), ("TR", "Transportation", "IN"),
+              ("UT", "Utilities", "UT")]
+STATUS_TYPES = [("ACTV", "Active"), ("CMPT", "Completed"), ("CNCL", "Canceled"), ("PNDG", "Pending"),
+                ("SBMT", "Submitted"), ("INAC", "Inactive")]
+TAX_RATES = [("US1", "U.S. Income Tax Bracket for the poor", "0.15"),
+             ("US2", "U.S. Income Tax Bracket for the huddled masses", "0.275"),
+             ("US3", "U.S. Income Tax Bracket for the masses", "0.3"),
+             ("US4", "U.S. Income Tax Bracket for the well to do", "0.35"),
+             ("US5", "U.S. Income Tax Bracket for the rich", "0.396"),
+             ("CN1", "Canadian Income Tax for the poor", "0.15"),
+             ("CN2", "Canadian Income Tax for the middle class", "0.22"),
+             ("CN3", "Canadian Income Tax for the rich", "0.29"),
+             ("NY", "New York State Tax", "0.0685"), ("CA", "California State Tax", "0.093"),
+             ("TX", "Texas State Tax", "0.0"), ("ON", "Ontario Provincial Tax", "0.1116"),
+             ("QC", "Quebec Provincial Tax", "0.24")]
+TRADE_TYPES = [("TLB", "Limit-Buy", 0, 0), ("TLS", "Limit-Sell", 1, 0), ("TMB", "Market-Buy", 0, 1),
+               ("TMS", "Market-Sell", 1, 1), ("TSL", "Stop-Loss", 1, 0)]
+
+FIRST_NAMES = ["Adara", "Bennett", "Carmen", "Dmitri", "Elena", "Farid", "Greta", "Hiroshi", "Ines", "Jonas", "Keiko",
+               "Liam", "Maren", "Nikhil", "Olga", "Pablo", "Quinn", "Rosa", "Stefan", "Tamsin", "Umar", "Vera",
+               "Wendell", "Ximena", "Yusuf", "Zora"]
+LAST_NAMES = ["Abbott", "Brandt", "Castillo", "Dubois", "Eriksen", "Fontaine", "Gallo", "Hartmann", "Ibarra",
+              "Jansen", "Kowalski", "Lindqvist", "Moreau", "Nakamura", "Okafor", "Petrov", "Quintero", "Rossi",
+              "Schneider", "Tanaka", "Ueda", "Varga", "Whitfield", "Xu", "Yilmaz", "Zhang"]
+STREETS = ["Weller Way", "Oak Street", "Maple Avenue", "Harbor Road", "Cedar Lane", "Summit Drive", "Lake Boulevard",
+           "Mill Road", "Elm Court", "Ridge Parkway"]
+PLACES = [("Columbus", "OH", "United States of America", "US"), ("Austin", "TX", "United States of America", "US"),
+          ("Albany", "NY", "United States of America", "US"), ("Fresno", "CA", "United States of America", "US"),
+          ("Toronto", "ON", "Canada", "CN"), ("Montreal", "QC", "Canada", "CN")]
+LOCAL_TAX_IDS = {"OH": "US3", "TX": "TX", "NY": "NY", "CA": "CA", "ON": "ON", "QC": "QC"}
+COMPANY_WORDS = ["Atlas", "Beacon", "Cobalt", "Delta", "Ember", "Frontier", "Granite", "Horizon", "Ion", "Juniper",
+                 "Keystone", "Lumen", "Meridian", "Nimbus", "Orion", "Pinnacle", "Quartz", "Redwood", "Sterling",
+                 "Titan", "Union", "Vertex", "Willow", "Zenith"]
+COMPANY_SUFFIXES = ["Corp", "Inc", "Holdings", "Group", "Industries", "Systems", "Partners"]
+SP_RATINGS = ["AAA", "AA+", "AA", "AA-", "A+", "A", "A-", "BBB+", "BBB", "BBB-", "BB+", "BB", "BB-", "B+", "B", "B-",
+              "CCC+", "CCC", "CC", "C", "D"]
+EXCHANGES = ["NYSE", "NASDAQ", "AMEX", "PCX"]
+ISSUE_TYPES = ["COMMON", "COMMON", "COMMON", "PREF_A", "PREF_B"]
+
+
+def finwire_field(value, width):
+    return str(value)[:width].ljust(width)
+
+def finwire_quarters(start, end):
+    """
+    Quarters from the one holding start to the one holding end, as (year, quarter) pairs.
+    """
+    year, quarter = start.year, (start.month - 1) // 3 + 1
+    while (year, quarter) <= (end.year, (end.month - 1) // 3 + 1):
+        yield year, quarter
+        year, quarter = (year + 1, 1) if quarter == 4 else (year, quarter + 1)
+
+def security_symbol(n):
+    """
+    Unique ticker symbol of the n-th security: AAA, AAB, ... growing past three letters when needed.
+    """
+    symbol = ""
+    while n or len(symbol) < 3:
+        symbol = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"[n % 26] + symbol
+        n //= 26
+    return symbol
+
+def weekdays(start, end):
+    day = start
+    while day < end:
+        if day.weekday() < 5:
+            yield day
+        day += timedelta(days=1)
+
+def write_lines(path, lines):
+    with open(path, "w", newline="\n") as out_file:
+        out_file.writelines(line + "\n" for line in lines)
+    return len(lines)
+
+def date_rows(first, last):
+    """
+    Rows of Date.txt, one per calendar day. The fiscal year starts with the calendar year.
+    """
+    day = first
+    while day <= last:
+        quarter = (day.month - 1) // 3 + 1
+        week_year, week = day.isocalendar()[:2]
+        yield "|".join([day.strftime("%Y%m%d"), day.isoformat(), "%s %i, %i" % (month_name[day.month], day.day, day.year),
+                        str(day.year), str(day.year), "%i%i" % (day.year, quarter), "%i Q%i" % (day.year, quarter),
+                        day.strftime("%Y%m"), "%i %s" % (day.year, month_name[day.month]),
+                        "%i%02i" % (week_year, week), "%i-W%02i" % (week_year, week), str(day.isoweekday()),
+                        day_name[day.weekday()], str(day.year), str(day.year), "%i%i" % (day.year, quarter),
+                        "%i Q%i" % (day.year, quarter), "true" if (day.month, day.day) in ((1, 1), (12, 25)) else "false"])
+        day += timedelta(days=1)
+
+def time_rows():
+    """
+    Rows of Time.txt, one per second of the day.
+    """
+    for second in range(86400):
+        hour, minute, sec = second // 3600, second // 60 % 60, second % 60
+        yield "|".join(["%02i%02i%02i" % (hour, minute, sec), "%02i:%02i:%02i" % (hour, minute, sec),
+                        str(hour), "%02i" % hour, str(minute), "%02i:%02i" % (hour, minute), str(sec),
+                        "%02i:%02i:%02i" % (hour, minute, sec), "true" if 9 <= hour < 16 else "false",
+                        "true" if 8 <= hour < 18 else "false"])
+
+
+class TPCDI_Generator():
+    """
+    Generate a structurally valid historical batch (Batch1) of TPC-DI flat files in pure Python, as a stand-in for
+    DIGen.jar where no JVM is available. The same scale and seed always produce the same files.
+    Attributes:
+        batch_dir (str): Directory receiving the flat files.
+        scale (float): Scale factor the row counts are proportional to.
+        rng (Random): Source of every random choice, seeded for reproducibility.
+        counts (dict): Number of records written to every file, reported in the audit file.
+    """
+    def __init__(self, batch_dir, scale, seed=0):
+        self.batch_dir = batch_dir
+        self.scale = scale
+        self.rng = random.Random(seed)
+        self.counts = {}
+        os.makedirs(batch_dir, exist_ok=True)
+
+    def rows(self, name):
+        return max(1, int(round(ROWS_PER_SF[name] * self.scale)))
+
+    def write(self, file_name, lines):
+        self.counts[file_name] = write_lines(os.path.join(self.batch_dir, file_name), lines)
+
+    def timestamp(self, start, end):
+        """
+        Random moment between two dates or datetimes, with a one second resolution.
+        """
+        start = start if isinstance(start, datetime) else datetime.combine(start, datetime.min.time())
+        end = end if isinstance(end, datetime) else datetime.combine(end, datetime.min.time())
+        return start + timedelta(seconds=self.rng.randrange(max(1, int((end - start).total_seconds()))))
+
+    def person(self):
+        rng = self.rng
+        city, state, country, nation = rng.choice(PLACES)
+        return {
+            "first_name": rng.choice(FIRST_NAMES), "last_name": rng.choice(LAST_NAMES),
+            "middle_initial": rng.choice("ABCDEFGHJKLMNPRSTW") if rng.random() < 0.6 else "",
+            "gender": rng.choice("MF") if rng.random() < 0.97 else rng.choice("mfX"),
+            "address_1": "%i %s" % (rng.randrange(1, 9999), rng.choice(STREETS)),
+            "address_2": "Suite %i" % rng.randrange(1, 500) if rng.random() < 0.1 else "",
+            "postal_code": "%05i" % rng.randrange(10000, 99999), "city": city, "state": state, "country": country,
+            "nation": nation, "dob": date(1930, 1, 1) + timedelta(days=rng.randrange(25000)),
+        }
+
+    def phone(self):
+        rng = self.rng
+        return {"C_CTRY_CODE": "1" if rng.random() < 0.5 else "", "C_AREA_CODE": str(rng.randrange(201, 990)),
+                "C_LOCAL": "%03i-%04i" % (rng.randrange(200, 999), rng.randrange(10000)),
+                "C_EXT": str(rng.randrange(1, 999)) if rng.random() < 0.1 else ""}
+
+    def generate_reference(self):
+        """
+        Write the reference tables and calendars: Date.txt, Time.txt, Industry.txt, StatusType.txt, TaxRate.txt,
+        TradeType.txt and BatchDate.txt.
+        """
+        self.write("Date.txt", list(date_rows(*DATE_RANGE)))
+        self.write("Time.txt", list(time_rows()))
+        self.write("Industry.txt", ["|".join(industry) for industry in INDUSTRIES])
+        self.write("StatusType.txt", ["|".join(status) for status in STATUS_TYPES])
+        self.write("TaxRate.txt", ["|".join(tax_rate) for tax_rate in TAX_RATES])
+        self.write("TradeType.txt", ["%s|%s|%i|%i" % trade_type for trade_type in TRADE_TYPES])
+        self.write("BatchDate.txt", [BATCH_DATE.isoformat()])
+
+    def generate_brokers(self):
+        """
+        Write HR.csv. About a third of the employees are brokers (job code 314), the ones accounts are assigned to.
+        Returns the employee ids of the brokers.
+        """
+        rng = self.rng
+        lines, brokers = [], []
+        for employee_id in range(self.rows("employees")):
+            person = self.person()
+            job_code = 314 if employee_id == 0 or rng.random() < 0.3 else rng.choice([535, 536, 537, 538])
+            if job_code == 314:
+                brokers.append(employee_id)
+            lines.append(",".join([str(employee_id), str(rng.randrange(employee_id) if employee_id else 0),
+                                   person["first_name"], person["last_name"], person["middle_initial"], str(job_code),
+                                   person["city"], "OFFICE%i" % rng.randrange(1, 100),
+                                   "(%03i) %03i-%04i" % (rng.randrange(201, 990), rng.randrange(200, 999),
+                                                         rng.randrange(10000))]))
+        self.write("HR.csv", lines)
+        return brokers
+
+    def generate_customers(self, brokers):
+        """
+        Write CustomerMgmt.xml: every customer is created with an account by a NEW action, then accounts are added,
+        updated and closed, customers updated and inactivated, all actions being in time order.
+        Returns the customers as of the batch date (C_ID -> (creation time, person)) and the accounts
+        (CA_ID -> (C_ID, opening time)).
+        """
+        rng = self.rng
+        last_action = datetime.combine(BATCH_DATE, datetime.min.time()) - timedelta(seconds=1)
+        # (time, sequence, action type, customer id, account id, payload)
+        actions, customers, accounts = [], {}, {}
+
+        joined = sorted(self.timestamp(CUSTOMER_START, BATCH_DATE - timedelta(days=30))
+                        for _ in range(self.rows("customers")))
+        for c_id, created in enumerate(joined):
+            customers[c_id] = (created, self.person())
+            accounts[len(accounts)] = (c_id, created)
+            actions.append((created, len(actions), "NEW", c_id, len(accounts) - 1, customers[c_id][1]))
+
+        for _ in range(self.rows("added_accounts")):
+            c_id = rng.randrange(len(customers))
+            opened = self.timestamp(customers[c_id][0], last_action)
+            accounts[len(accounts)] = (c_id, opened)
+            actions.append((opened, len(actions), "ADDACCT", c_id, len(accounts) - 1, None))
+
+        for _ in range(self.rows("customer_updates")):
+            c_id = rng.randrange(len(customers))
+            change = rng.choice(["tier", "address", "contact"])
+            payload = self.person() if change == "address" else None
+            actions.append((self.timestamp(customers[c_id][0], last_action), len(actions), "UPDCUST", c_id, None,
+                            (change, payload)))
+            if change == "address":
+                # The current address is the one prospects are matched on
+                person = dict(customers[c_id][1])
+                person.update({key: payload[key] for key in ("address_1", "address_2", "postal_code", "city",
+                                                              "state", "country", "nation")})
+                customers[c_id] = (customers[c_id][0], person)
+
+        for _ in range(self.rows("account_updates")):
+            ca_id = rng.randrange(len(accounts))
+            actions.append((self.timestamp(accounts[ca_id][1], last_action), len(actions), "UPDACCT",
+                            accounts[ca_id][0], ca_id, None))
+
+        # Nothing happens to an account after it is closed, or to a customer after it is inactivated
+        closed = {}
+        for ca_id in rng.sample(range(len(accounts)), min(len(accounts), self.rows("account_closes"))):
+            closed[ca_id] = self.timestamp(accounts[ca_id][1], last_action)
+            actions.append((closed[ca_id], len(actions), "CLOSEACCT", accounts[ca_id][0], ca_id, None))
+        inactive = {}
+        for c_id in rng.sample(range(len(customers)), min(len(customers), self.rows("inactivations"))):
+            inactive[c_id] = self.timestamp(customers[c_id][0], last_action)
+            actions.append((inactive[c_id], len(actions), "INACT", c_id, None, None))
+        def is_live(action):
+            ts, _, action_type, c_id, ca_id, _ = action
+            return (action_type == "INACT" or ts < inactive.get(c_id, last_action)) and \
+                (action_type == "CLOSEACCT" or ca_id not in closed or ts < closed[ca_id])
+        actions = sorted(action for action in actions if is_live(action))
+
+        with open(os.path.join(self.batch_dir, "CustomerMgmt.xml"), "w", newline="\n") as xml_file:
+            xml_file.write('<?xml version="1.0" encoding="UTF-8"?>\n<TPCDI:Actions xmlns:TPCDI="http://www.tpc.org/tpc-di">\n')
+            for ts, _, action_type, c_id, ca_id, payload in actions:
+                xml_file.write('<TPCDI:Action ActionType="%s" ActionTS="%s">%s</TPCDI:Action>\n' % (
+                    action_type, ts.strftime("%Y-%m-%dT%H:%M:%S"),
+                    self.customer_xml(action_type, c_id, ca_id, payload, customers, brokers)))
+            xml_file.write('</TPCDI:Actions>\n')
+        self.counts["CustomerMgmt.xml"] = len(actions)
+
+        return ({c_id: customer for c_id, customer in customers.items() if c_id not in inactive},
+                {ca_id: account for ca_id, account in accounts.items()
+                 if ca_id not in closed and account[0] not in inactive})
+
+    def customer_xml(self, action_type, c_id, ca_id, payload, customers, brokers):
+        """
+        Customer element of one action, holding only the parts the action type carries.
+        """
+        rng = self.rng
+
+        def element(tag, value):
+            return "<%s>%s</%s>" % (tag, escape(value), tag) if value else "<%s/>" % tag
+
+        def address(person):
+            return "<Address>%s</Address>" % "".join([
+                element("C_ADLINE1", person["address_1"]), element("C_ADLINE2", person["address_2"]),
+                element("C_ZIPCODE", person["postal_code"]), element("C_CITY", person["city"]),
+                element("C_STATE_PROV", person["state"]), element("C_CTRY", person["country"])])
+
+        def contact(person):
+            email = "%s.%s@%s" % (person["first_name"], person["last_name"], rng.choice(["moose-mail.com", "gmx.com"]))
+            phones = ["<C_PHONE_%i>%s</C_PHONE_%i>" % (n, "".join(element(tag, value) for tag, value in phone.items()), n)
+                      for n, phone in enumerate([self.phone() for _ in range(rng.randrange(1, 4))], 1)]
+            return "<ContactInfo>%s%s%s</ContactInfo>" % (
+                element("C_PRIM_EMAIL", email), element("C_ALT_EMAIL", email.lower() if rng.random() < 0.3 else ""),
+                "".join(phones))
+
+        def account(attributes):
+            return '<Account CA_ID="%i"%s>%s%s</Account>' % (
+                ca_id, ' CA_TAX_ST="%i"' % rng.randrange(3) if "tax" in attributes else "",
+                element("CA_B_ID", str(rng.choice(brokers))) if "broker" in attributes else "",
+                element("CA_NAME", "".join(rng.choice("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ")
+                                           for _ in range(rng.randrange(10, 40)))) if "name" in attributes else "")
+
+        if action_type == "NEW":
+            person = payload
+            return '<Customer C_ID="%i" C_TAX_ID=%s C_GNDR="%s" C_TIER="%i" C_DOB="%s">%s%s%s%s%s</Customer>' % (
+                c_id, quoteattr("%03i-%02i-%04i" % (rng.randrange(1000), rng.randrange(100), rng.randrange(10000))),
+                person["gender"], rng.choice([1, 2, 2, 3, 3, 3]), person["dob"].isoformat(),
+                "<Name>%s%s%s</Name>" % (element("C_L_NAME", person["last_name"]),
+                                         element("C_F_NAME", person["first_name"]),
+                                         element("C_M_NAME", person["middle_initial"])),
+                address(person), contact(person),
+                "<TaxInfo>%s%s</TaxInfo>" % (element("C_LCL_TX_ID", LOCAL_TAX_IDS[person["state"]]),
+                                             element("C_NAT_TX_ID", person["nation"] + str(rng.randrange(1, 4)))),
+                account(["tax", "broker", "name"]))
+        if action_type == "ADDACCT":
+            return '<Customer C_ID="%i">%s</Customer>' % (c_id, account(["tax", "broker", "name"]))
+        if action_type == "UPDACCT":
+            return '<Customer C_ID="%i">%s</Customer>' % (
+                c_id, account(rng.sample(["tax", "broker", "name"], rng.randrange(1, 4))))
+        if action_type == "CLOSEACCT":
+            return '<Customer C_ID="%i"><Account CA_ID="%i"/></Customer>' % (c_id, ca_id)
+        if action_type == "INACT":
+            return '<Customer C_ID="%i"/>' % c_id
+        change, person = payload
+        if change == "tier":
+            return '<Customer C_ID="%i" C_TIER="%i"/>' % (c_id, rng.randrange(1, 4))
+        if change == "address":
+            return '<Customer C_ID="%i">%s</Customer>' % (c_id, address(person))
+        return '<Customer C_ID="%i">%s</Customer>' % (c_id, contact(customers[c_id][1]))
+
+    def generate_prospects(self, customers):
+        """
+        Write Prospect.csv. A third of the prospects are customers, with the same name and current address.
+        """
+        rng = self.rng
+        lines = []
+        customer_ids = sorted(customers)
+        for n in range(self.rows("prospects")):
+            person = customers[rng.choice(customer_ids)][1] if customer_ids and rng.random() < 0.33 else self.person()
+            lines.append(",".join([
+                "ZZZ%05i" % n, person["last_name"], person["first_name"], person["middle_initial"], person["gender"],
+                person["address_1"], person["address_2"], person["postal_code"], person["city"], person["state"],
+                person["country"], "%03i-%03i-%04i" % (rng.randrange(201, 990), rng.randrange(200, 999), rng.randrange(10000)),
+                str(rng.randrange(10000, 500000)), str(rng.randrange(5)), str(rng.randrange(6)), rng.choice("SMDWU"),
+                str(rng.randrange(18, 90)), str(rng.randrange(300, 850)), rng.choice("OR"), rng.choice(COMPANY_WORDS),
+                str(rng.randrange(10)), str(rng.randrange(-100000, 5000000))]))
+        self.write("Prospect.csv", lines)
+
+    def generate_finwire(self):
+        """
+        Write one FINWIRE<year>Q<quarter> file per quarter with records: companies (CMP) and their updates,
+        securities (SEC) listed before the market opens, and quarterly financials (FIN) of every company.
+        Securities and financials name their company by CIK or by name. Returns the symbols of the securities.
+        """
+        rng = self.rng
+        market_open = datetime.combine(MARKET_START, datetime.min.time())
+        records = []
+
+        companies = []
+        for n in range(self.rows("companies")):
+            cik = "%010i" % (1000 + n)
+            name = "%s %s %s %i" % (rng.choice(COMPANY_WORDS), rng.choice(COMPANY_WORDS), rng.choice(COMPANY_SUFFIXES), n)
+            listed = self.timestamp(FINWIRE_START, MARKET_START - timedelta(days=400))
+            companies.append((cik, name, listed))
+            records.append((listed, self.company_record(listed, cik, name, "ACTV")))
+        for _ in range(self.rows("company_updates")):
+            cik, name, listed = rng.choice(companies)
+            updated = self.timestamp(listed, BATCH_DATE)
+            records.append((updated, self.company_record(updated, cik, name, rng.choice(["ACTV", "ACTV", "INAC"]))))
+
+        symbols = []
+        for n in range(self.rows("securities")):
+            cik, name, listed = companies[n % len(companies)]
+            issued = self.timestamp(listed, market_open)
+            symbol = security_symbol(n)
+            symbols.append(symbol)
+            records.append((issued, "".join([
+                finwire_field(issued.strftime("%Y%m%d-%H%M%S"), 15), "SEC", finwire_field(symbol, 15),
+                finwire_field(rng.choice(ISSUE_TYPES), 6), "ACTV", finwire_field("%s %s" % (name, symbol), 70),
+                finwire_field(rng.choice(EXCHANGES), 6), finwire_field(rng.randrange(100000, 1000000000), 13),
+                finwire_field(issued.strftime("%Y%m%d"), 8), finwire_field(issued.strftime("%Y%m%d"), 8),
+                finwire_field("%.2f" % rng.uniform(0, 5), 12), cik if rng.random() < 0.5 else name])))
+
+        for cik, name, listed in companies:
+            for year, quarter in finwire_quarters(max(listed.date(), FINANCIAL_START), BATCH_DATE - timedelta(days=120)):
+                start = date(year, 3 * quarter - 2, 1)
+                posted = self.timestamp(start + timedelta(days=92), start + timedelta(days=120))
+                revenue = rng.uniform(1e6, 1e10)
+                earnings = revenue * rng.uniform(-0.1, 0.3)
+                shares = rng.randrange(1000000, 1000000000)
+                records.append((posted, "".join([
+                    finwire_field(posted.strftime("%Y%m%d-%H%M%S"), 15), "FIN", str(year), str(quarter),
+                    start.strftime("%Y%m%d"), posted.strftime("%Y%m%d"), finwire_field("%.2f" % revenue, 17),
+                    finwire_field("%.2f" % earnings, 17), finwire_field("%.2f" % (earnings / shares), 12),
+                    finwire_field("%.2f" % (earnings / shares * 0.95), 12), finwire_field("%.2f" % (earnings / revenue), 12),
+                    finwire_field("%.2f" % rng.uniform(0, 1e9), 17), finwire_field("%.2f" % rng.uniform(1e6, 1e11), 17),
+                    finwire_field("%.2f" % rng.uniform(1e5, 1e10), 17), finwire_field(shares, 13),
+                    finwire_field(int(shares * 1.05), 13), cik if rng.random() < 0.5 else name])))
+
+        records.sort()
+        quarters = {}
+        for ts, record in records:
+            quarters.setdefault("FINWIRE%iQ%i" % (ts.year, (ts.month - 1) // 3 + 1), []).append(record)
+        for file_name, lines in quarters.items():
+            self.write(file_name, lines)
+        return symbols
+
+    def company_record(self, ts, cik, name, status):
+        rng = self.rng
+        person = self.person()
+        founded = person["dob"].strftime("%Y%m%d") if rng.random() < 0.9 else ""
+        return "".join([
+            finwire_field(ts.strftime("%Y%m%d-%H%M%S"), 15), "CMP", finwire_field(name, 60), cik, status,
+            rng.choice(INDUSTRIES)[0], finwire_field(rng.choice(SP_RATINGS), 4), finwire_field(founded, 8),
+            finwire_field(person["address_1"], 80), finwire_field(person["address_2"], 80),
+            finwire_field(person["postal_code"], 12), finwire_field(person["city"], 25),
+            finwire_field(person["state"], 20), finwire_field(person["country"], 24),
+            finwire_field("%s %s" % (person["first_name"], person["last_name"]), 46),
+            "%s makes %s." % (name, rng.choice(INDUSTRIES)[1].lower())])
+
+    def generate_market(self, symbols):
+        """
+        Write DailyMarket.txt, a random walk of the price of every security over the market days.
+        Returns the closing prices by (day, symbol).
+        """
+        rng = self.rng
+        prices = {symbol: rng.uniform(5, 200) for symbol in symbols}
+        lines, closes = [], {}
+        for day in weekdays(MARKET_START, BATCH_DATE):
+            for symbol in symbols:
+                price = max(1.0, prices[symbol] * rng.gauss(1, 0.02))
+                prices[symbol] = price
+                closes[day, symbol] = price
+                lines.append("%s|%s|%.2f|%.2f|%.2f|%i" % (day.isoformat(), symbol, price, price * rng.uniform(1, 1.05),
+                                                          price * rng.uniform(0.95, 1), rng.randrange(1000, 10000000)))
+        self.write("DailyMarket.txt", lines)
+        return closes
+
+    def generate_trades(self, accounts, symbols, closes):
+        """
+        Write Trade.txt, TradeHistory.txt, HoldingHistory.txt and CashTransaction.txt. Market orders are submitted
+        then completed, limit orders pending, submitted and then completed or canceled, and a few trades are still
+        open on the batch date. Completed trades update the holding of their account in the security, and settle in
+        cash for cash trades.
+        """
+        rng = self.rng
+        account_ids = sorted(accounts)
+        market_open = datetime.combine(MARKET_START, datetime.min.time())
+        batch_start = datetime.combine(BATCH_DATE, datetime.min.time())
+        created = sorted((self.timestamp(max(market_open, accounts[ca_id][1]), batch_start), ca_id)
+                         for ca_id in (rng.choice(account_ids) for _ in range(self.rows("trades"))))
+
+        trades, history, completions = [], [], []
+        for t_id, (ts, ca_id) in enumerate(created):
+            tt_id, _, is_sell, is_market = rng.choice(TRADE_TYPES)
+            symbol = rng.choice(symbols)
+            quantity = rng.randrange(1, 100) * 10
+            # Orders are priced around the last close
+            day = ts.date()
+            while (day, symbol) not in closes and day > MARKET_START:
+                day -= timedelta(days=1)
+            price = closes.get((day, symbol), 100.0) * rng.uniform(0.98, 1.02)
+            is_cash = 1 if rng.random() < 0.8 else 0
+            events = [(ts, "SBMT")] if is_market else [(ts, "PNDG"), (ts + timedelta(seconds=rng.randrange(60, 86400)), "SBMT")]
+            finish = events[-1][0] + timedelta(seconds=rng.randrange(1, 3600 if is_market else 5 * 86400))
+            status = "CMPT" if is_market or rng.random() < 0.85 else "CNCL"
+            if finish < batch_start:
+                events.append((finish, status))
+            else:
+                status = events[-1][1]
+            completed = status == "CMPT"
+            charge, commission = rng.uniform(1, 10), quantity * price * rng.uniform(0.001, 0.01)
+            tax = quantity * price * rng.uniform(0, 0.02) if completed and is_sell else 0
+            trades.append("|".join([
+                str(t_id), events[-1][0].strftime("%Y-%m-%d %H:%M:%S"), status, tt_id, str(is_cash), symbol,
+                str(quantity), "%.2f" % price, str(ca_id), "%s %s" % (rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)),
+                "%.2f" % price if completed else "", "%.2f" % charge if completed else "",
+                "%.2f" % commission if completed else "", "%.2f" % tax if completed else ""]))
+            history.extend((event_ts, t_id, event_status) for event_ts, event_status in events)
+            if completed:
+                completions.append((finish, t_id, ca_id, symbol, -quantity if is_sell else quantity, is_cash,
+                                    quantity * price, charge + commission + tax, tt_id))
+
+        history.sort()
+        completions.sort()
+        holdings, holding_lines, cash = {}, [], []
+        names = dict((trade_type[0], trade_type[1]) for trade_type in TRADE_TYPES)
+        for finish, t_id, ca_id, symbol, quantity, is_cash, amount, fees, tt_id in completions:
+            # A holding is opened by the trade creating the position and referenced until the position is closed
+            h_t_id, before = holdings.get((ca_id, symbol), (t_id, 0))
+            after = before + quantity
+            if after:
+                holdings[ca_id, symbol] = (h_t_id, after)
+            else:
+                holdings.pop((ca_id, symbol), None)
+            holding_lines.append("%i|%i|%i|%i" % (h_t_id, t_id, before, after))
+            if is_cash:
+                cash.append((finish, ca_id, (amount if quantity < 0 else -amount) - fees,
+                             "%s %i shares of %s" % (names[tt_id], abs(quantity), symbol)))
+        for _ in range(self.rows("cash_transactions")):
+            ca_id = rng.choice(account_ids)
+            cash.append((self.timestamp(max(market_open, accounts[ca_id][1]), batch_start), ca_id,
+                         rng.uniform(-5000, 20000), rng.choice(["Cash deposit", "Cash withdrawal", "Dividend payment"])))
+        cash.sort()
+
+        self.write("Trade.txt", trades)
+        self.write("TradeHistory.txt", ["%i|%s|%s" % (t_id, ts.strftime("%Y-%m-%d %H:%M:%S"), status)
+                                        for ts, t_id, status in history])
+        self.write("HoldingHistory.txt", holding_lines)
+        self.write("CashTransaction.txt", ["%i|%s|%.2f|%s" % (ca_id, ts.strftime("%Y-%m-%d %H:%M:%S"), amount, name)
+                                           for ts, ca_id, amount, name in cash])
+
+    def generate_watches(self, customers, symbols):
+        """
+        Write WatchHistory.txt: customers start watching securities, and cancel a third of the watches later on.
+        """
+        rng = self.rng
+        customer_ids = sorted(customers)
+        market_open = datetime.combine(MARKET_START, datetime.min.time())
+        batch_start = datetime.combine(BATCH_DATE, datetime.min.time())
+        watched, events = set(), []
+        for _ in range(self.rows("watches")):
+            c_id, symbol = rng.choice(customer_ids), rng.choice(symbols)
+            if (c_id, symbol) in watched:
+                continue
+            watched.add((c_id, symbol))
+            placed = self.timestamp(max(market_open, customers[c_id][0]), batch_start)
+            events.append((placed, c_id, symbol, "ACTV"))
+            if rng.random() < 0.33:
+                events.append((self.timestamp(placed, batch_start), c_id, symbol, "CNCL"))
+        events.sort()
+        self.write("WatchHistory.txt", ["%i|%s|%s|%s" % (c_id, symbol, ts.strftime("%Y-%m-%d %H:%M:%S"), action)
+                                        for ts, c_id, symbol, action in events])
+
+    def generate_audit(self):
+        """
+        Write the audit files: the batch dates, and the number of records the generator wrote to every file.
+        """
+        header = "DataSet,BatchID,Date,Attribute,Value,DValue"
+        self.write("Generator_audit.csv", [header] + ["Generator,1,,%s,%i," % (file_name, count)
+                                                      for file_name, count in sorted(self.counts.items())])
+        self.write("Batch1_audit.csv", [header, "Batch,1,%s,FirstDay,," % CUSTOMER_START.isoformat(),
+                                        "Batch,1,%s,LastDay,," % BATCH_DATE.isoformat()])
+
+    def generate(self):
+        """
+        Write every file of the batch, in dependency order: the entities records refer to come first.
+        """
+        self.generate_reference()
+        brokers = self.generate_brokers()
+        customers, accounts = self.generate_customers(brokers)
+        self.generate_prospects(customers)
+        symbols = self.generate_finwire()
+        closes = self.generate_market(symbols)
+        self.generate_trades(accounts, symbols, closes)
+        self.generate_watches(customers, symbols)
+        self.generate_audit()
+        return self.counts
+
+
+if __name__ == "__main__":
+    # Parse user's option
+    parser = optparse.OptionParser()
+    parser.add_option("-s", "--scalefactor", help="Scale factor of the generated data, also its directory name")
+    parser.add_option("-f", "--fraction", default="1",
+                      help="Fraction of the scale factor volumes to generate, e.g. 0.01 for a quick run (default 1)")
+    parser.add_option("-o", "--output", default="staging", help="Directory receiving <scalefactor>/Batch1/ (default staging)")
+    parser.add_option("--seed", default="0", help="Seed of the random generator (default 0)")
+
+    (options, args) = parser.parse_args()
+
+    if not options.scalefactor:
+        parser.error("the scale factor (-s) is required")
+
+    batch_dir = os.path.join(options.output, options.scalefactor, "Batch1")
+    generator = TPCDI_Generator(batch_dir, float(options.scalefactor) * float(options.fraction), int(options.seed))
+    for file_name, count in sorted(generator.generate().items()):
+        print("+----- %s: %i records" % (file_name, count))
@@ -1,16 +1,64 @@
 import optparse
 import configparser
-from utils import sort_merge_join, CSV_Transformer
+from utils import sort_merge_join, CSV_Transformer, Stage_Scheduler, Stage_Metrics, batch_numbers
 import time
 
 from TPCDI_Loader import TPCDI_Loader
 
+def load(sf, db_name, config, batches, jobs=1, workers=1, resume=False, metrics=None, engine='mysql'):
+    """
+    Load the batches of a scale factor in order, batch 1 recreating the database unless resuming.
+    Args:
+        sf (str): Scale factor to be loaded.
+        db_name (str): Name of database schema to which the data will be loaded.
+        config (config list): Config object retrieved from calling ConfigParser().read().
+        batches (list): Batch numbers to load.
+        jobs (int): Maximum number of load steps running in parallel.
+        workers (int): Number of processes used to parse flat files.
+        resume (bool): Skip the stages the journal shows complete.
+        metrics (Stage_Metrics): Receives the measurements of every stage.
+        engine (str): Database engine the warehouse is loaded into, 'mysql' or 'sqlite'.
+    """
+    for batch_number in batches:
+        # For the historical load, all data are loaded, the incremental batches apply their changes to it
+        loader = TPCDI_Loader(sf, db_name, config, batch_number, overwrite=(batch_number == 1 and not resume),
+                              pool_size=max(4, jobs), workers=workers, resume=resume, metrics=metrics,
+                              engine=engine)
+
+        # When resuming, the stages verified complete are skipped and the unfinished ones reset
+        done = loader.resume() if resume else set()
+        for stage in done:
+            print("+----- %s already complete" % stage)
+
+        # Run every load step as soon as the tables it reads are loaded, independent steps run concurrently
+        scheduler = Stage_Scheduler(loader.stages(), max_workers=jobs)
+        scheduler.run(done=done, on_finished=lambda stage, elapsed: print(
+            "+----- %s finished with total time: %s" % (stage, elapsed)))
+        loader.executor.close()
+
 if __name__ == "__main__":
     # Parse user's option
     parser = optparse.OptionParser()
     parser.add_option("-s", "--scalefactor", help="Scale factor used")
     parser.add_option(
         "-d", "--dbname", help="Name of database schema to which the data will be loaded")
+    parser.add_option(
+        "-j", "--jobs", default="1", help="Maximum number of load steps running in parallel (default 1)")
+    parser.add_option(
+        "-w", "--workers", default="1", help="Number of processes used to parse flat files (default 1)")
+    parser.add_option(
+        "-b", "--batches", help="Comma separated batches to load, e.g. 2,3 to apply increments to a loaded database "
+                                "(default every BatchN directory)")
+    parser.add_option(
+        "-r", "--resume", action="store_true", default=False,
+        help="Resume an interrupted load, skipping the stages the journal shows complete")
+    parser.add_option(
+        "-m", "--metrics", default="results/metrics.jsonl",
+        help="JSON lines file the stage measurements are appended to (default results/metrics.jsonl)")
+    parser.add_option(
+        "-e", "--engine", default="mysql", choices=["mysql", "sqlite"],
+        help="Database engine, mysql for the server in db.conf or sqlite for an embedded database file "
+             "(default mysql)")
 
     (options, args) = parser.parse_args()
 
@@ -18,112 +66,24 @@ if __name__ == "__main__":
         parser.print_help()
         exit(1)
 
+    jobs = int(options.jobs)
+
     # Read and retrieve config from the configfile
     config = configparser.ConfigParser()
     config.read('db.conf')
 
 
-    # List all available batches in generated flat files
-    # batch_numbers = [int(name[5:]) for name in os.listdir('staging/5') if os.path.isdir(os.path.join('staging/5', name))]
-    # But le'ts first work on the first batch
-    batch_numbers = [1]
-    
-    start = time.time()
-    for batch_number in batch_numbers:
-        # For the historical load, all data are loaded
-        if batch_number == 1:
-            loader = TPCDI_Loader(options.scalefactor, options.dbname, config, batch_number, overwrite=True)
-
-            # Step 1: Load the batchDate table for this batch
-            print("+--------------Going to Load Batch Date--------------------+")
-            loader.load_current_batch_date()
-            print("+--------------Batch Loading Completed---------------------+")
-        
-            # Step 2: Load non-dependence tables
-            loader.load_dim_date()
-            print("+-------------------DimDate Loaded-------------------------+")
-            loader.load_dim_time()
-            print("+-------------------DimTime Loaded-------------------------+")
-            loader.load_industry()
-            print("+-------------------Industry Loaded------------------------+")
-            loader.load_status_type()
-            print("+-------------------StatusType Loaded----------------------+")
-            loader.load_tax_rate()
-            print("+-------------------TaxRate Loadedd------------------------+")
-            loader.load_trade_type()
-            print("+-------------------TradeType Loaded-----------------------+")
-            loader.load_audit()
-            print("+-------------------Audit Loaded---------------------------+")
-            loader.init_di_messages()
-            print("+---------------DImessage initialized----------------------+")
-
-            # Step 3: Load staging tables
-            print("+---------Loading Finware Data to Staging Table------------+")
-            loader.load_staging_finwire()
-            print("+---------Loading Porspect Data to Staging Table-----------+")
-            loader.load_staging_prospect()
-            print("+---------Loading Broker Data to Staging Table-------------+")
-            loader.load_staging_broker()
-            print("+---------Loading Customer Data to Staging Table-----------+")
-            loader.load_staging_customer()
-            print("+-------Loading CashBalance Data to Staging Table----------+")
-            loader.load_staging_cash_balances()
-            print("+---------Loading Watches Data to Staging Table------------+")
-            loader.load_staging_watches()
-            print("+-------Loading FactHolding Data to Staging Table----------+")
-            loader.load_staging_fact_holding()
-            print("+-------Loading FactMarketHistory Data to Staging Table----------+")
-            loader.load_staging_daily_market()
-
-            loader.load_staging_trade()
-            loader.load_staging_trade_history()
-            loader.load_staging_trade_joined()
+    # List all available batches in generated flat files, batch 1 is the historical load and the next ones increments
+    if options.batches:
+        batches = [int(batch) for batch in options.batches.split(",")]
+    else:
+        batches = batch_numbers('staging/' + options.scalefactor)
 
-            # Step 4: Load dependant table
-            loader.load_target_dim_company()
-            print("+-------------------DimCompany Loaded----------------------+")
-            loader.load_target_financial()
-            print("+-----------------Financial Table Loaded-------------------+")
-            loader.load_target_dim_security()
-            print("+-------------------DimSecurity Loaded---------------------+")
-            loader.load_prospect()
-            print("+------------------Prospect Table Loaded-------------------+")
-            loader.load_broker()
-            print("+-------------------DimBroker Loaded-----------------------+")
-
-            print("+-------------------DimCustomer loading ...---------------------+")
-            loader.load_target_dim_customer()
-            print("+-------------------DimCustomer Loaded---------------------+")
-
-            print("+-------------------DimAccount loading ... ----------------------+")
-            loader.load_target_dim_account()
-            print("+-------------------DimAccount Loaded----------------------+")
-
-            print("+-------------------DimTrade loading ...------------------------+")
-            loader.load_target_dim_trade()
-            print("+-------------------DimTrade Loaded------------------------+")
-
-            print("+-----------------FactCashBalance loading ...-------------------+")
-            # it has to be loaded after DimAccount
-            loader.load_target_fact_cash_balance()
-            print("+-----------------FactCashBalance Loaded-------------------+")
-
-            print("+-------------------FactHolding loading ...---------------------+")
-            # it has to be loaded after DimTrade
-            loader.load_target_fact_holding()
-            print("+-------------------FactHolding Loaded---------------------+")
-
-            # depends on DimCustomer, DimSecurity, DimDate
-            print("+-------------------FactWatches loading ...---------------------+")
-            loader.load_target_fact_watches()
-            print("+-------------------FactWatches Loaded---------------------+")
+    # One record per stage of this run, tagged with the scale factor and the git revision
+    metrics = Stage_Metrics(options.metrics, scale_factor=options.scalefactor, jobs=jobs, workers=int(options.workers))
 
+    start = time.time()
+    load(options.scalefactor, options.dbname, config, batches, jobs=jobs, workers=int(options.workers),
+         resume=options.resume, metrics=metrics, engine=options.engine)
     end = time.time()
     print(end-start)
-    
-
-
-    
-
-
-    
\ No newline at end of file
@@ -1,196 +1,1661 @@
+import csv
+import hashlib
+import json
 import tempfile
 import os
-from contextlib import ExitStack
+import sys
+import re
+import queue
+import sqlite3
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import ExitStack, contextmanager
+from functools import partial
 from heapq import merge
-from sqlalchemy import create_engine
-import mysql.connector as connection
+from datetime import datetime
+from itertools import chain, groupby, islice
+from xml.etree import ElementTree
 import numpy as np
+import pandas as pd
 
 
-class CSV_Transformer():
+class Column():
     """
-    TODO: Make an abstract class, and this should extend the abstract class
-    Transform a row in a csv flat file to a list
+    Field of a flat file record.
+    Attributes:
+        name (str): Column name.
+        type (str): One of 'str', 'int', 'float', 'date' or 'datetime'.
+        nullable (bool): Whether an empty field is allowed, it is read as a missing value.
+    """
+    def __init__(self, name, type='str', nullable=True):
+        self.name = name
+        self.type = type
+        self.nullable = nullable
+
+def to_typed_array(values, column):
+    """
+    Convert the raw text of a column into a NumPy array of the column type. Missing values become None for
+    strings, NaN for numbers (nullable integers are read as floats) and NaT for dates.
+    Args:
+        values (Series): Raw field values, empty strings being missing values.
+        column (Column): Schema of the column.
+    """
+    missing = (values == '').to_numpy(bool)
+    if missing.any() and not column.nullable:
+        raise ValueError("Column %s has missing values" % column.name)
+    if column.type == 'int':
+        if not missing.any():
+            return values.to_numpy().astype(np.int64)
+        return pd.to_numeric(values.where(~missing)).to_numpy(np.float64)
+    if column.type == 'float':
+        return pd.to_numeric(values.where(~missing)).to_numpy(np.float64)
+    if column.type == 'date':
+        return np.array(values.str[:10].where(~missing, 'NaT').tolist(), dtype='datetime64[D]')
+    if column.type == 'datetime':
+        return np.array(values.str[:19].str.replace(' ', 'T').where(~missing, 'NaT').tolist(), dtype='datetime64[s]')
+    values = values.to_numpy(object)
+    if missing.any():
+        values[missing] = None
+    return values
+
+class Record_Reader():
+    """
+    Base of the flat file readers: parse the records of a file described by a schema into typed column batches,
+    a batch being a dict mapping every column name to a NumPy array.
+    Attributes:
+        schema (list): Column of every field, in record order.
+    """
+    CONVERTERS = {'int': int, 'float': float}
+
+    def __init__(self, schema=None):
+        self.schema = schema or []
+
+    def read_batches(self, path, batch_size=1000000):
+        """
+        Yield the records of the file as typed column batches of at most batch_size records.
+        """
+        raise NotImplementedError
+
+    def read(self, path):
+        """
+        Read the whole file as one typed column batch.
+        """
+        batches = list(self.read_batches(path))
+        if not batches:
+            return {column.name: to_typed_array(pd.Series([], dtype=object), column) for column in self.schema}
+        return {column.name: np.concatenate([batch[column.name] for batch in batches]) for column in self.schema}
+
+    def typed_batch(self, raw):
+        return {column.name: to_typed_array(raw[column.name], column) for column in self.schema}
+
+    def key_type(self, col_idx):
+        """
+        Python type comparing the values of a column in their natural order, str when the column is unknown.
+        """
+        if col_idx < len(self.schema):
+            return self.CONVERTERS.get(self.schema[col_idx].type, str)
+        return str
+
+    def convert(self, fields):
+        """
+        Type the fields of one record, for consumers working a record at a time.
+        """
+        typed = list(fields)
+        for col_idx, column in enumerate(self.schema[:len(typed)]):
+            value = typed[col_idx]
+            if value == '':
+                typed[col_idx] = None
+            elif column.type in self.CONVERTERS:
+                typed[col_idx] = self.CONVERTERS[column.type](value)
+        return typed
+
+class Delimited_Reader(Record_Reader):
+    """
+    Reader of delimited flat files, batches are parsed by the pandas C parser.
     Attributes:
         delimiter (str): Character used to limit a field entries to other fields.
+        quotechar (str): Character quoting fields containing the delimiter, None when fields are never quoted.
     """
-    def __init__(self, delimiter):
+    def __init__(self, schema=None, delimiter='|', quotechar=None):
+        super().__init__(schema)
         self.delimiter = delimiter
+        self.quotechar = quotechar
+
+    def read_batches(self, path, batch_size=1000000):
+        quoting = {'quoting': csv.QUOTE_NONE} if self.quotechar is None else {'quotechar': self.quotechar}
+        # The schema may only describe the leading fields of the records
+        for raw in pd.read_csv(path, sep=self.delimiter, header=None, names=[column.name for column in self.schema],
+                               usecols=range(len(self.schema)), dtype=str, keep_default_na=False, na_filter=False,
+                               chunksize=batch_size, **quoting):
+            yield self.typed_batch(raw)
+
+class Fixed_Width_Reader(Record_Reader):
+    """
+    Reader of fixed width flat files, batches are decoded at once with decode_fixed_width.
+    Attributes:
+        widths (list): Width of every column of the schema.
+    """
+    def __init__(self, schema, widths):
+        super().__init__(schema)
+        self.widths = widths
+
+    def read_batches(self, path, batch_size=1000000):
+        layout = [(column.name, width) for column, width in zip(self.schema, self.widths)]
+        with open(path, 'rb') as in_file:
+            while True:
+                lines = [line.rstrip(b'\r\n') for line in islice(in_file, batch_size)]
+                if not lines:
+                    break
+                columns = decode_fixed_width(np.array(lines, dtype=bytes), layout)
+                yield self.typed_batch({name: pd.Series(np.char.decode(values, 'utf-8'), dtype=object)
+                                        for name, values in columns.items()})
+
+class CSV_Transformer(Delimited_Reader):
+    """
+    Transform a row in a csv flat file to a list, typed by the schema when there is one.
+    Attributes:
+        delimiter (str): Character used to limit a field entries to other fields.
+    """
+    def __init__(self, delimiter, schema=None):
+        super().__init__(schema, delimiter)
     def transofrm(self, line):
-        return line.split(self.delimiter)
+        fields = line.rstrip('\r\n').split(self.delimiter)
+        return self.convert(fields) if self.schema else fields
     def inverse_transform(self, transformed):
-        return self.delimiter.join(transformed)
-def get_marketing_nameplate(row):
-    net_worth = row["NetWorth"]
-    income = row["Income"]
-    num_children = row["NumberChildren"]
-    num_credit_cards = row["NumberCreditCards"]
-    age = row["Age"]
-    credit_rating = row["CreditRating"]
-    num_cars = row["NumberCars"]
+        return self.delimiter.join('' if field is None else str(field) for field in transformed)
+    def column(self, line, col_idx):
+        return line.split(self.delimiter, col_idx + 1)[col_idx].rstrip('\r\n')
+
+# Fixed width layout of each FINWIRE record type as (column, width) pairs, in staging table column order.
+# The last column of every record type has a variable length, its width is the longest value it can take.
+FINWIRE_LAYOUTS = {
+    "CMP": [("PTS", 15), ("REC_TYPE", 3), ("COMPANY_NAME", 60), ("CIK", 10), ("STATUS", 4), ("INDUSTRY_ID", 2),
+            ("SP_RATING", 4), ("FOUNDING_DATE", 8), ("ADDR_LINE_1", 80), ("ADDR_LINE_2", 80), ("POSTAL_CODE", 12),
+            ("CITY", 25), ("STATE_PROVINCE", 20), ("COUNTRY", 24), ("CEO_NAME", 46), ("DESCRIPTION", 150)],
+    "SEC": [("PTS", 15), ("REC_TYPE", 3), ("SYMBOL", 15), ("ISSUE_TYPE", 6), ("STATUS", 4), ("NAME", 70),
+            ("EX_ID", 6), ("SH_OUT", 13), ("FIRST_TRADE_DATE", 8), ("FIRST_TRADE_EXCHANGE", 8), ("DIVIDEN", 12),
+            ("COMPANY_NAME_OR_CIK", 60)],
+    "FIN": [("PTS", 15), ("REC_TYPE", 3), ("YEAR", 4), ("QUARTER", 1), ("QTR_START_DATE", 8), ("POSTING_DATE", 8),
+            ("REVENUE", 17), ("EARNINGS", 17), ("EPS", 12), ("DILUTED_EPS", 12), ("MARGIN", 12), ("INVENTORY", 17),
+            ("ASSETS", 17), ("LIABILITIES", 17), ("SH_OUT", 13), ("DILUTED_SH_OUT", 13), ("CO_NAME_OR_CIK", 60)],
+}
+
+def decode_fixed_width(records, layout):
+    """
+    Decode a block of fixed width records at once through a NumPy structured dtype.
+    Args:
+        records (np.array): Bytes array with one record per item.
+        layout (list): (column, width) pairs describing the record.
+    Returns a dict mapping every column to a bytes array with the padding trimmed.
+    """
+    dtype = np.dtype([(name, 'S%i' % width) for name, width in layout])
+    # Pad (or cut) every record to the layout size so the block can be reinterpreted field by field
+    table = np.ascontiguousarray(records.astype('S%i' % dtype.itemsize)).view(dtype)
+    return {name: np.char.strip(table[name]) for name in dtype.names}
 
-    result = []
+def parse_finwire(path, type_offset=15):
+    """
+    Split a FINWIRE quarter file by record type and decode every type as one block.
+    Args:
+        path (str): Path to the FINWIRE file.
+        type_offset (int): Position of the 3 characters REC_TYPE field in a record.
+    Returns a dict mapping each record type of FINWIRE_LAYOUTS to its decoded columns.
+    """
+    with open(path, 'rb') as finwire_file:
+        lines = np.array(finwire_file.read().splitlines(), dtype=bytes)
+    lines = lines.astype('S%i' % max(lines.dtype.itemsize, type_offset + 3))
+    chars = lines.view('S1').reshape(lines.size, lines.dtype.itemsize)
+    rec_types = np.ascontiguousarray(chars[:, type_offset:type_offset + 3]).view('S3').ravel()
+    return {rec_type: decode_fixed_width(lines[rec_types == rec_type.encode()], layout)
+            for rec_type, layout in FINWIRE_LAYOUTS.items()}
 
-    if net_worth and net_worth > 1000000 or income and income > 200000:
-        result.append('HighValue')
+def finwire_quarter(fname):
+    """
+    Sort key putting FINWIRE files in chronological order, e.g. FINWIRE1967Q3 -> (1967, 3).
+    """
+    match = re.search(r'(\d{4})Q(\d)', os.path.basename(fname))
+    return (int(match.group(1)), int(match.group(2))) if match else (0, 0)
 
-    if num_children and num_children > 3 or num_credit_cards and num_credit_cards > 5:
-        result.append('Expenses')
+def stage_finwire_file(path, out_dir):
+    """
+    Decode one FINWIRE quarter file into a flat file per record type, so quarters can be parsed in parallel processes.
+    Args:
+        path (str): Path to the FINWIRE file.
+        out_dir (str): Directory receiving the <file name>.<REC_TYPE> flat files.
+    Returns a dict mapping each record type to the flat file written for it.
+    """
+    outputs = {}
+    for rec_type, columns in parse_finwire(path).items():
+        outputs[rec_type] = os.path.join(out_dir, os.path.basename(path) + "." + rec_type)
+        with open(outputs[rec_type], 'wb') as out_file:
+            out_file.write(to_load_data_block(list(columns.values())))
+    return outputs
 
-    if age and age > 45:
-        result.append('Boomer')
+# Columns of S_Customer read from every TPCDI:Action as (column, path, default, numeric). Paths are relative to the
+# Action element and the part after '@' names an attribute. The default is used when the element is missing.
+CUSTOMER_MGMT_FIELDS = [
+    ("ActionType", "@ActionType", None, False),
+    ("ActionTS", "@ActionTS", None, False),
+    ("C_ID", "Customer@C_ID", None, True),
+    ("C_TAX_ID", "Customer@C_TAX_ID", '', False),
+    ("C_GNDR", "Customer@C_GNDR", '', False),
+    ("C_TIER", "Customer@C_TIER", -1, True),
+    ("C_DOB", "Customer@C_DOB", None, False),
+    ("C_L_NAME", "Customer/Name/C_L_NAME", '', False),
+    ("C_F_NAME", "Customer/Name/C_F_NAME", '', False),
+    ("C_M_NAME", "Customer/Name/C_M_NAME", '', False),
+    ("C_ADLINE1", "Customer/Address/C_ADLINE1", '', False),
+    ("C_ADLINE2", "Customer/Address/C_ADLINE2", '', False),
+    ("C_ZIPCODE", "Customer/Address/C_ZIPCODE", '', False),
+    ("C_CITY", "Customer/Address/C_CITY", '', False),
+    ("C_STATE_PROV", "Customer/Address/C_STATE_PROV", '', False),
+    ("C_CTRY", "Customer/Address/C_CTRY", '', False),
+    ("C_PRIM_EMAIL", "Customer/ContactInfo/C_PRIM_EMAIL", None, False),
+    ("C_ALT_EMAIL", "Customer/ContactInfo/C_ALT_EMAIL", None, False),
+] + [("C_PHONE_%i_%s" % (n, part), "Customer/ContactInfo/C_PHONE_%i/%s" % (n, part), None, False)
+     for n in (1, 2, 3) for part in ("C_CTRY_CODE", "C_AREA_CODE", "C_LOCAL", "C_EXT")] + [
+    ("C_LCL_TX_ID", "Customer/TaxInfo/C_LCL_TX_ID", None, False),
+    ("C_NAT_TX_ID", "Customer/TaxInfo/C_NAT_TX_ID", None, False),
+    ("CA_ID", "Customer/Account@CA_ID", 0, True),
+    ("CA_TAX_ST", "Customer/Account@CA_TAX_ST", None, True),
+    ("CA_B_ID", "Customer/Account/CA_B_ID", None, True),
+    ("CA_NAME", "Customer/Account/CA_NAME", None, False),
+]
 
-    if income and income < 50000 or credit_rating and credit_rating < 600 or net_worth and net_worth < 100000:
-        result.append('MoneyAlert')
+def to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
 
-    if num_cars and num_cars > 3 or num_credit_cards and num_credit_cards > 7:
-        result.append('Spender')
+def compile_xml_fields(fields):
+    """
+    Turn a (column, path, default, numeric) table into a function extracting a row from an element.
+    Args:
+        fields (list): Field table such as CUSTOMER_MGMT_FIELDS.
+    """
+    extractors = []
+    for _, path, default, numeric in fields:
+        element_path, _, attribute = path.partition('@')
+        extractors.append((element_path or None, attribute or None, default, to_int if numeric else None))
 
-    if age and age < 25 and net_worth and net_worth > 1000000:
-        result.append('Inherited')
+    def extract(element):
+        row = []
+        for element_path, attribute, default, convert in extractors:
+            node = element.find(element_path) if element_path else element
+            if node is None:
+                row.append(default)
+                continue
+            value = node.get(attribute) if attribute else (node.text or '')
+            if value is None:
+                row.append(default)
+            else:
+                row.append(convert(value) if convert else value)
+        return row
+    return extract
 
-    return '+'.join(result)
+def iter_customer_mgmt(path, fields=CUSTOMER_MGMT_FIELDS):
+    """
+    Stream the actions of CustomerMgmt.xml as S_Customer rows without holding the document in memory.
+    Every TPCDI:Action element is released as soon as its row has been extracted.
+    Args:
+        path (str): Path to CustomerMgmt.xml.
+        fields (list): Field table describing the row to extract.
+    """
+    extract = compile_xml_fields(fields)
+    context = ElementTree.iterparse(path, events=('start', 'end'))
+    _, root = next(context)
+    for event, element in context:
+        if event == 'end' and element.tag.rsplit('}', 1)[-1].rsplit(':', 1)[-1] == 'Action':
+            yield extract(element)
+            root.clear()
 
-def get_prospect(c, df_prospect):
-    if c["IsCurrent"] and c["ProspectKey"] in df_prospect.index:
-        row = df_prospect.loc[c["ProspectKey"]]
-        return [row["AgencyID"], row["CreditRating"], row["NetWorth"], get_marketing_nameplate(row)]
-    else:
-        return [np.nan, np.nan, np.nan, np.nan]
+# Tags of the marketing nameplate, in nameplate order, with the prospect columns deciding them
+MARKETING_NAMEPLATE_TAGS = ["HighValue", "Expenses", "Boomer", "MoneyAlert", "Spender", "Inherited"]
 
-def get_mysql_conn(db_name,config):
+def marketing_nameplates(net_worth, income, number_children, number_credit_cards, age, credit_rating, number_cars):
+    """
+    Vectorized MarketingNameplate of prospects, as in the TPC-DI specification. Every tag sets one bit of a mask per
+    prospect and the nameplates are looked up by mask among the 64 combinations, tags joined with '+'.
+    Missing values (None or NaN) match no condition, as NULL in SQL.
+    Args:
+        net_worth, income, number_children, number_credit_cards, age, credit_rating, number_cars (array like):
+            Columns of the prospects, all of the same length.
+    Returns a NumPy array of str, '' for the prospects without any tag.
+    """
+    def column(values):
+        return pd.to_numeric(pd.Series(np.asarray(values, dtype=object)), errors='coerce').to_numpy(dtype=float)
+
+    net_worth, income, number_children, number_credit_cards, age, credit_rating, number_cars = map(column, (
+        net_worth, income, number_children, number_credit_cards, age, credit_rating, number_cars))
+
+    # NaN compares false, so missing values leave the bits unset
+    with np.errstate(invalid='ignore'):
+        conditions = [(net_worth > 1000000) | (income > 200000),
+                      (number_children > 3) | (number_credit_cards > 5),
+                      age > 45,
+                      (income < 50000) | (credit_rating < 600) | (net_worth < 100000),
+                      (number_cars > 3) | (number_credit_cards > 7),
+                      (age < 25) & (net_worth > 1000000)]
+    masks = np.zeros(len(net_worth), dtype=np.uint8)
+    for bit, condition in enumerate(conditions):
+        masks |= condition.astype(np.uint8) << bit
+
+    nameplates = np.array(['+'.join(tag for bit, tag in enumerate(MARKETING_NAMEPLATE_TAGS) if mask >> bit & 1)
+                           for mask in range(1 << len(MARKETING_NAMEPLATE_TAGS))], dtype=object)
+    return nameplates[masks]
+
+def prospect_keys(frame, columns):
+    """
+    Upper case concatenation of the name and address columns matching customers with prospects, missing values
+    counting as ''.
+    """
+    keys = pd.Series('', index=frame.index)
+    for name in columns:
+        keys += frame[name].where(frame[name].notna(), '').astype(str).str.upper()
+    return keys
+
+def get_mysql_conn(db_name, config, **kwargs):
+    # Imported on first use, so the embedded engine runs without the MySQL driver installed
+    import mysql.connector as connection
     conn = connection.connect(host=config['MEMSQL_SERVER']['memsql_host'],
+                              port=int(config['MEMSQL_SERVER'].get('memsql_port', 3306)),
                               database=db_name,
                               user=config['MEMSQL_SERVER']['memsql_user'],
-                              password=config['MEMSQL_SERVER']['memsql_pswd'])
+                              password=config['MEMSQL_SERVER']['memsql_pswd'],
+                              **kwargs)
     return conn
 
-def get_mysql_engine(db_name,config):
-    conn = connection.connect(host=config['MEMSQL_SERVER']['memsql_host'],
-                              database=db_name,
-                              user=config['MEMSQL_SERVER']['memsql_user'],
-                              password=config['MEMSQL_SERVER']['memsql_pswd'])
-    engine_str = "mysql+pymysql://" + config['MEMSQL_SERVER']['memsql_user'] + ":"
-    engine_str = engine_str + config['MEMSQL_SERVER']['memsql_pswd'] + "@"
-    engine_str = engine_str + config['MEMSQL_SERVER']['memsql_host'] + "/" + db_name
-    engine = create_engine(engine_str)
-    con = engine.connect()
-    return con
-
-def get_cust_phone(n, row):
-    c_e = row["C_PHONE_" + str(n) + "_C_EXT"]
-    c_l = row["C_PHONE_" + str(n) + "_C_LOCAL"]
-    c_ac = row["C_PHONE_" + str(n) + "_C_AREA_CODE"]
-    c_cc = row["C_PHONE_" + str(n) + "_C_CTRY_CODE"]
-
-    if c_cc and c_ac and c_l:
-        phone = '+' + c_cc + ' (' + c_ac + ') ' + c_l
-    elif c_ac and c_l:
-        phone = '(' + c_ac + ') ' + c_l
-    elif c_l:
-        phone = c_l
-    else:
-        return ""
+def split_sql_statements(script):
+    """
+    Split a sql script into single statements the way the mysql client does.
+    Semicolons inside quoted strings are ignored and `DELIMITER` directives are honoured,
+    so stored routine definitions can be sent as they are written for the client.
+    Args:
+        script (str): One or more sql statements.
+    """
+    statements = []
+    delimiter = ';'
+    quote = None
+    start = 0
+    i = 0
+    while i < len(script):
+        char = script[i]
+        if quote:
+            if char == '\\':
+                i += 1
+            elif char == quote:
+                quote = None
+        elif char in ("'", '"', '`'):
+            quote = char
+        elif script.startswith(delimiter, i):
+            statement = script[start:i].strip()
+            if statement:
+                statements.append(statement)
+            start = i = i + len(delimiter)
+            continue
+        elif (char == 'D' or char == 'd') and not script[start:i].strip() \
+                and script[i:i + 10].upper() == 'DELIMITER ':
+            # Client side directive changing the statement terminator until the end of the line
+            end = script.find('\n', i)
+            end = len(script) if end == -1 else end
+            delimiter = script[i + 10:end].strip()
+            start = i = end
+            continue
+        i += 1
+    statement = script[start:].strip()
+    if statement:
+        statements.append(statement)
+    return statements
+
+class SQL_Error(Exception):
+    """
+    Raised by SQL_Executor when a statement of a script fails.
+    Attributes:
+        result (SQL_Result): Row counts of the statements that ran and the errors that stopped the script.
+    """
+    def __init__(self, result):
+        super().__init__('; '.join(result.errors))
+        self.result = result
+
+class SQL_Result():
+    """
+    Outcome of running a script through SQL_Executor.
+    Attributes:
+        rowcounts (list): Number of rows affected by each statement that was executed.
+        errors (list): Error messages, the script stops at the first failing statement.
+    """
+    def __init__(self):
+        self.rowcounts = []
+        self.errors = []
+    @property
+    def rowcount(self):
+        return sum(count for count in self.rowcounts if count > 0)
+    @property
+    def ok(self):
+        return not self.errors
+
+class SQL_Executor():
+    """
+    Run sql scripts in-process on a pool of reusable connections instead of spawning a mysql client per statement.
+    Connections are taken from the pool for the duration of one call, so the executor can be shared between threads.
+    Attributes:
+        db_name (str): Name of database schema the connections use, None to connect to the server only.
+        config (config list): Config object retrieved from calling ConfigParser().read().
+        pool_size (int): Maximum number of idle connections kept open.
+    """
+    def __init__(self, db_name, config, pool_size=4):
+        self.db_name = db_name
+        self.config = config
+        self.pool = queue.LifoQueue(maxsize=pool_size)
+
+    def connect(self):
+        return get_mysql_conn(self.db_name, self.config, allow_local_infile=True, autocommit=True)
+
+    def setup_database(self, create=False, overwrite=False, exists_ok=False):
+        """
+        Prepare the database of the executor through a server level connection.
+        Args:
+            create (bool): Create the database.
+            overwrite (bool): Drop the database first if it exists.
+            exists_ok (bool): Keep the database when it already exists instead of failing to create it.
+        """
+        server = SQL_Executor(None, self.config, pool_size=1)
+        if overwrite:
+            server.execute("DROP DATABASE IF EXISTS " + self.db_name + ";")
+        if create:
+            server.execute("CREATE DATABASE " + ("IF NOT EXISTS " if exists_ok else "") + self.db_name + ";")
+
+        # Enable infile load
+        server.execute("SET GLOBAL local_infile=1;", check=False)
+        server.execute("SET GLOBAL sql_mode = 'NO_ENGINE_SUBSTITUTION';", check=False)
+        server.close()
+
+    def drop_database(self):
+        self.close()
+        server = SQL_Executor(None, self.config, pool_size=1)
+        server.execute("DROP DATABASE IF EXISTS " + self.db_name + ";")
+        server.close()
+
+    def tables(self):
+        """
+        Names of the tables of the database.
+        """
+        tables = self.read_frame("SELECT TABLE_NAME FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE()")
+        return set(tables["TABLE_NAME"])
+
+    @contextmanager
+    def connection(self):
+        try:
+            conn = self.pool.get_nowait()
+        except queue.Empty:
+            conn = self.connect()
+        try:
+            yield conn
+        finally:
+            if conn.is_connected():
+                try:
+                    self.pool.put_nowait(conn)
+                    conn = None
+                except queue.Full:
+                    pass
+            if conn is not None:
+                conn.close()
+
+    def execute(self, script, check=True):
+        """
+        Execute every statement of the script in a single session.
+        Args:
+            script (str): One or more sql statements, `DELIMITER` directives are supported.
+            check (bool): Raise SQL_Error when a statement fails, otherwise the error is only reported in the result.
+        """
+        from mysql.connector import Error as MySQL_Error
+        result = SQL_Result()
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                for statement in split_sql_statements(script):
+                    try:
+                        cursor.execute(statement)
+                        if cursor.with_rows:
+                            cursor.fetchall()
+                    except MySQL_Error as err:
+                        result.errors.append(str(err))
+                        break
+                    result.rowcounts.append(cursor.rowcount)
+            finally:
+                cursor.close()
+        if result.errors:
+            if check:
+                raise SQL_Error(result)
+            print("ERROR: " + '; '.join(result.errors))
+        return result
+
+    def load_file(self, path, table, delimiter='|', ignore_lines=0, columns=None, check=True):
+        """
+        Bulk load a delimited flat file into table with LOAD DATA LOCAL INFILE.
+        Args:
+            path (str): Path to the flat file, relative paths are resolved from the working directory.
+            table (str): Name of the table receiving the rows.
+            delimiter (str): Character separating the fields of a row.
+            ignore_lines (int): Number of header lines to skip.
+            columns (list): Target columns in file order, all table columns when None.
+        """
+        query = "LOAD DATA LOCAL INFILE '%s' INTO TABLE %s COLUMNS TERMINATED BY '%s'" % (
+            path.replace('\\', '\\\\').replace("'", "\\'"), table, delimiter)
+        if ignore_lines:
+            query += " IGNORE %i LINES" % ignore_lines
+        if columns:
+            query += " (" + ", ".join(columns) + ")"
+        return self.execute(query + ";", check=check)
+
+    def load_stream(self, chunks, table, delimiter='|', columns=None, check=True):
+        """
+        Stream rows produced in Python into table: a producer thread writes the chunks into a named pipe while
+        LOAD DATA LOCAL INFILE reads the other end, so producing the rows overlaps with the server ingesting them
+        and nothing is written to disk. Platforms without named pipes go through a temporary file instead.
+        Args:
+            chunks (iterable): Flat file text (str or bytes) as written by to_load_data_row, consumed lazily.
+            table (str): Name of the table receiving the rows.
+            delimiter (str): Character separating the fields of a row.
+            columns (list): Target columns in row order, all table columns when None.
+        """
+        with tempfile.TemporaryDirectory() as pipe_dir:
+            path = os.path.join(pipe_dir, table)
+            if not hasattr(os, 'mkfifo'):
+                write_chunks(path, chunks)
+                return self.load_file(path, table, delimiter, columns=columns, check=check)
+
+            os.mkfifo(path)
+            failures = []
+            producer = threading.Thread(target=self._produce, args=(path, chunks, failures), daemon=True)
+            producer.start()
+            try:
+                result = self.load_file(path, table, delimiter, columns=columns, check=check)
+            finally:
+                # When the load stopped early, opening and closing the read end gives the producer a broken pipe
+                while producer.is_alive():
+                    os.close(os.open(path, os.O_RDONLY | os.O_NONBLOCK))
+                    producer.join(0.05)
+            if failures:
+                raise failures[0]
+            return result
+
+    @staticmethod
+    def _produce(path, chunks, failures):
+        try:
+            write_chunks(path, chunks)
+        except BrokenPipeError:
+            pass
+        except Exception as err:
+            failures.append(err)
+
+    def load_frame(self, frame, table, chunk_size=100000, check=True):
+        """
+        Bulk load a DataFrame into table, serialized with to_load_data_frame and streamed through load_stream
+        a slice of rows at a time. Columns are matched by name.
+        Args:
+            frame (DataFrame): Rows to load.
+            table (str): Name of the table receiving the rows.
+            chunk_size (int): Number of rows serialized at once.
+        """
+        chunks = (to_load_data_frame(frame.iloc[start:start + chunk_size])
+                  for start in range(0, len(frame), chunk_size))
+        return self.load_stream(chunks, table, columns=list(frame.columns), check=check)
+
+    def insert_rows(self, table, columns, rows, batch_size=1000):
+        """
+        Insert rows in batches of parameterized multi-row INSERT statements, on one pooled connection.
+        Args:
+            table (str): Name of the table receiving the rows.
+            columns (list): Target columns in row order.
+            rows (iterable): Rows as sequences, None is inserted as NULL. Rows are consumed lazily.
+            batch_size (int): Number of rows sent per statement.
+        """
+        query = "INSERT INTO %s (%s) VALUES (%s)" % (table, ", ".join(columns), ", ".join(["%s"] * len(columns)))
+        total = 0
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                batch = []
+                for row in rows:
+                    batch.append(row)
+                    if len(batch) >= batch_size:
+                        cursor.executemany(query, batch)
+                        total += len(batch)
+                        batch = []
+                if batch:
+                    cursor.executemany(query, batch)
+                    total += len(batch)
+            finally:
+                cursor.close()
+        return total
+
+    def read_frame(self, query):
+        with self.connection() as conn:
+            return pd.read_sql(query, conn)
+
+    def close(self):
+        while True:
+            try:
+                self.pool.get_nowait().close()
+            except queue.Empty:
+                break
+
+def top_level_matches(pattern, text):
+    """
+    Matches of a regular expression outside parentheses and quoted strings.
+    """
+    depths = []
+    depth, quote = 0, None
+    for char in text:
+        depths.append(depth if quote is None else -1)
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in ("'", '"'):
+            quote = char
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+    return [match for match in re.finditer(pattern, text, re.I) if depths[match.start()] == 0]
 
-    if c_e:
-        return phone + c_e
+def split_top_level(text, pattern=r','):
+    parts, start = [], 0
+    for match in top_level_matches(pattern, text):
+        parts.append(text[start:match.start()].strip())
+        start = match.end()
+    return parts + [text[start:].strip()]
 
-    return phone
+# MySQL functions and keywords of the loader statements with a direct SQLite equivalent
+SQLITE_REWRITES = [
+    (re.compile(r"\bAUTO_INCREMENT\b", re.I), "AUTOINCREMENT"),
+    (re.compile(r"\bLEFT\s*\(", re.I), "MYSQL_LEFT("),
+    (re.compile(r"\bIF\s*\(", re.I), "IIF("),
+    (re.compile(r"\bconvert\s*\(\s*([^,()]+?)\s*,\s*SIGNED\s*\)", re.I), r"CAST(\1 AS INTEGER)"),
+    (re.compile(r"<=>"), " IS "),
+    (re.compile(r"\b(?:current_timestamp|NOW)\s*\(\s*\)", re.I), "CURRENT_TIMESTAMP"),
+]
 
-def to_upper(value):
-    if value != np.nan:
-        return str(value).upper()
-    return ""
+def to_sqlite(statement):
+    """
+    Translate one MySQL statement of the loader into the SQLite statements doing the same.
+    Statements without a SQLite counterpart (USE, SET GLOBAL, stored functions registered natively) give none.
+    Multiple table updates become UPDATE ... FROM, and INSERT ... SELECT ... ON DUPLICATE KEY UPDATE becomes an
+    upsert: the SELECT has to end with its FROM item, whose alias in the assignments stands for the inserted row.
+    Args:
+        statement (str): MySQL statement, as split by split_sql_statements.
+    """
+    if re.match(r"(USE\s|SET\s+GLOBAL\s|(DROP|CREATE)\s+FUNCTION\s)", statement, re.I):
+        return []
+    for pattern, replacement in SQLITE_REWRITES:
+        statement = pattern.sub(replacement, statement)
 
-def prepare_char_insertion(field):
-    if field is None:
-        return "''"
-    if field == "''":
-        return field
-    field = field.replace("'", "''")
-    field = field.replace('"', '\\"')
-    return f"'{field}'"
+    drop = re.match(r"DROP\s+TABLE\s+(IF\s+EXISTS\s+)?(.*)$", statement, re.I | re.S)
+    if drop:
+        return ["DROP TABLE %s%s" % (drop.group(1) or "", table) for table in split_top_level(drop.group(2))]
 
-def prepare_numeric_insertion(numeric):
+    update = re.match(r"UPDATE\s+(\w+)\s+(?:AS\s+)?(\w+)\s+(JOIN\s.*)$", statement, re.I | re.S)
+    if update:
+        table, alias, rest = update.groups()
+        set_clause = top_level_matches(r"\bSET\b", rest)[0]
+        where = [match for match in top_level_matches(r"\bWHERE\b", rest) if match.start() > set_clause.start()]
+        joins = re.findall(r"JOIN\s+(\w+)\s+(?:AS\s+)?(\w+)\s+ON\s+(.*?)(?=\s+JOIN\s|$)", rest[:set_clause.start()].strip(),
+                           re.I | re.S)
+        assignments = rest[set_clause.end():where[0].start() if where else len(rest)]
+        conditions = [condition for _, _, condition in joins] + ([rest[where[0].end():]] if where else [])
+        # The columns assigned are those of the updated table, named without its alias
+        return ["UPDATE %s AS %s SET %s FROM %s WHERE %s" % (
+            table, alias, ", ".join(re.sub(r"^\w+\.", "", assignment) for assignment in split_top_level(assignments)),
+            ", ".join("%s AS %s" % (source, source_alias) for source, source_alias, _ in joins),
+            " AND ".join("(%s)" % condition.strip() for condition in conditions))]
+
+    upsert = top_level_matches(r"\bON\s+DUPLICATE\s+KEY\s+UPDATE\b", statement)
+    if upsert:
+        insert, assignments = statement[:upsert[0].start()].rstrip(), statement[upsert[0].end():]
+        alias = re.search(r"(\w+)$", insert).group(1)
+        return ["%s%s ON CONFLICT DO UPDATE SET %s" % (
+            insert, "" if top_level_matches(r"\bWHERE\b", insert) else " WHERE true",
+            re.sub(r"\b%s\." % alias, "excluded.", assignments))]
+    return [statement]
+
+def mysql_str_to_date(value, date_format):
+    """
+    STR_TO_DATE for SQLite: the date as 'YYYY-MM-DD' ('YYYY-MM-DD HH:MM:SS' for formats with a time), NULL when
+    the value does not match the format.
+    """
+    python_format = date_format.replace('%i', '%M').replace('%s', '%S')
     try:
-        int(numeric)
-        return numeric
-    except:
-        return "NULL"
+        parsed = datetime.strptime(str(value), python_format)
+    except (TypeError, ValueError):
+        return None
+    return parsed.strftime('%Y-%m-%d %H:%M:%S' if re.search('%[HhisST]', date_format) else '%Y-%m-%d')
 
-def external_sort(input_file, transformer, col_idx, max_chunk_size=50):
+def mysql_left(value, length):
+    return None if value is None or length is None else str(value)[:int(length)]
+
+def iter_lines(chunks):
+    """
+    Lines of flat file text given in chunks (str or bytes) that may split lines anywhere.
+    """
+    rest = ''
+    for chunk in chunks:
+        lines = (rest + (chunk.decode('utf-8') if isinstance(chunk, bytes) else chunk)).split('\n')
+        rest = lines.pop()
+        yield from lines
+    if rest:
+        yield rest
+
+def parse_load_data_line(line, delimiter='|'):
     """
-    Sort file based on col_idx outside main memory. 
+    Split one line of a flat file into fields the way LOAD DATA INFILE reads it: backslash escapes the delimiter,
+    line breaks and itself, and a \\N field is NULL.
+    """
+    line = line.rstrip('\r')
+    if '\\' not in line:
+        return line.split(delimiter)
+    escapes = {'n': '\n', 't': '\t', 'r': '\r', '0': '\0', 'Z': '\x1a'}
+    fields, field, i = [], [], 0
+    while i < len(line):
+        char = line[i]
+        if char == '\\' and i + 1 < len(line):
+            i += 1
+            if line[i] == 'N' and not field and (i + 1 == len(line) or line[i + 1] == delimiter):
+                field = None
+            else:
+                field.append(escapes.get(line[i], line[i]))
+        elif char == delimiter:
+            fields.append(field if field is None else ''.join(field))
+            field = []
+        else:
+            field.append(char)
+        i += 1
+    fields.append(field if field is None else ''.join(field))
+    return fields
+
+class SQLite_Executor():
+    """
+    Embedded counterpart of SQL_Executor, running the load in a SQLite database file without a server. Statements are
+    translated from MySQL by to_sqlite, the MySQL functions they call are registered as Python functions, and flat
+    files are parsed in Python the way LOAD DATA reads them. SQLite allowing one writer at a time, calls are
+    serialized on a single connection shared by the threads.
+    Attributes:
+        db_name (str): Name of the database, stored in <sqlite_dir>/<db_name>.sqlite.
+        config (config list): Config object retrieved from calling ConfigParser().read(), sqlite_dir is read from
+            its SQLITE section (default the working directory).
+        pool_size (int): Unused, kept for the SQL_Executor signature.
+    """
+    def __init__(self, db_name, config, pool_size=4):
+        self.db_name = db_name
+        self.config = config
+        directory = config['SQLITE'].get('sqlite_dir', '.') if config.has_section('SQLITE') else '.'
+        self.path = os.path.join(directory, db_name + '.sqlite')
+        self.conn = None
+        self.lock = threading.RLock()
+
+    def connection(self):
+        if self.conn is None:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self.conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            # The database is rebuilt from the flat files when lost, durability is traded for load speed
+            self.conn.execute("PRAGMA journal_mode = WAL")
+            self.conn.execute("PRAGMA synchronous = OFF")
+            self.conn.create_function("STR_TO_DATE", 2, mysql_str_to_date, deterministic=True)
+            self.conn.create_function("MYSQL_LEFT", 2, mysql_left, deterministic=True)
+        return self.conn
+
+    @contextmanager
+    def transaction(self, result=None):
+        """
+        Run a block in one transaction on the connection, to be used holding the lock. It is committed when the block
+        succeeds and rolled back when the block raises or records errors in result, so nothing is left half written.
+        """
+        conn = self.connection()
+        conn.execute("BEGIN")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("ROLLBACK" if result is not None and result.errors else "COMMIT")
+
+    def setup_database(self, create=False, overwrite=False, exists_ok=False):
+        """
+        Prepare the database file, see SQL_Executor.setup_database.
+        """
+        if overwrite:
+            self.drop_database()
+        exists = os.path.exists(self.path)
+        if create and exists and not exists_ok:
+            raise FileExistsError("Database %s already exists" % self.path)
+        if not create and not exists:
+            raise FileNotFoundError("Database %s does not exist" % self.path)
+        self.connection()
+
+    def drop_database(self):
+        self.close()
+        for path in (self.path, self.path + '-wal', self.path + '-shm'):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def translate(self, statement):
+        # CREATE TABLE ... LIKE copies the definition of the source table
+        like = re.match(r"CREATE\s+TABLE\s+(\w+)\s+LIKE\s+(\w+)$", statement, re.I)
+        if like:
+            (ddl,) = self.connection().execute(
+                "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ? COLLATE NOCASE", (like.group(2),)).fetchone()
+            return [re.sub(r"^CREATE\s+TABLE\s+(\"\w+\"|\w+)", "CREATE TABLE " + like.group(1), ddl, flags=re.I)]
+        return to_sqlite(statement)
+
+    def execute(self, script, check=True):
+        """
+        Execute every statement of the script in one transaction, see SQL_Executor.execute.
+        """
+        result = SQL_Result()
+        with self.lock, self.transaction(result) as conn:
+            for statement in split_sql_statements(script):
+                try:
+                    for translated in self.translate(statement):
+                        result.rowcounts.append(conn.execute(translated).rowcount)
+                except sqlite3.Error as err:
+                    result.errors.append("%s in: %s" % (err, statement))
+                    break
+        if result.errors:
+            if check:
+                raise SQL_Error(result)
+            print("ERROR: " + '; '.join(result.errors))
+        return result
+
+    def load_file(self, path, table, delimiter='|', ignore_lines=0, columns=None, check=True):
+        """
+        Bulk load a delimited flat file into table, see SQL_Executor.load_file.
+        """
+        with open(path, encoding='utf-8', newline='') as in_file:
+            lines = islice((line.rstrip('\n') for line in in_file), ignore_lines, None)
+            return self.load_lines(lines, table, delimiter, columns, check)
+
+    def load_stream(self, chunks, table, delimiter='|', columns=None, check=True):
+        """
+        Load rows produced in Python into table, see SQL_Executor.load_stream.
+        """
+        return self.load_lines(iter_lines(chunks), table, delimiter, columns, check)
+
+    def load_frame(self, frame, table, chunk_size=100000, check=True):
+        """
+        Bulk load a DataFrame into table, see SQL_Executor.load_frame.
+        """
+        chunks = (to_load_data_frame(frame.iloc[start:start + chunk_size])
+                  for start in range(0, len(frame), chunk_size))
+        return self.load_stream(chunks, table, columns=list(frame.columns), check=check)
+
+    def load_lines(self, lines, table, delimiter, columns, check, batch_size=10000):
+        """
+        Insert flat file lines into table. Like LOAD DATA, fields of '@' columns are skipped, missing fields are NULL
+        and extra fields ignored. Empty fields are NULL in the columns that are not text and, as outside strict mode,
+        NULL in a NOT NULL column is stored as the implicit default of its type ('' or 0).
+        """
+        result = SQL_Result()
+        with self.lock:
+            conn = self.connection()
+            table_columns = [(name, column_type.upper(), notnull) for _, name, column_type, notnull, _, _ in
+                             conn.execute("PRAGMA table_info(%s)" % table).fetchall()]
+            columns = columns or [name for name, _, _ in table_columns]
+            types = dict((name.lower(), (column_type, notnull)) for name, column_type, notnull in table_columns)
+            targets = [(position, name) for position, name in enumerate(columns) if not name.startswith('@')]
+            empty_values = []
+            for _, name in targets:
+                column_type, notnull = types.get(name.lower(), ("TEXT", 0))
+                text = bool(re.search("CHAR|TEXT|CLOB", column_type))
+                empty_values.append((text, ('' if text else 0) if notnull else None))
+            query = "INSERT INTO %s (%s) VALUES (%s)" % (
+                table, ", ".join(name for _, name in targets), ", ".join("?" * len(targets)))
+
+            def rows():
+                for line in lines:
+                    fields = parse_load_data_line(line, delimiter)
+                    fields += [None] * (len(columns) - len(fields))
+                    yield [default if fields[position] is None or (fields[position] == '' and not text)
+                           else fields[position] for (position, _), (text, default) in zip(targets, empty_values)]
+
+            with self.transaction(result):
+                try:
+                    batches = rows()
+                    while True:
+                        batch = list(islice(batches, batch_size))
+                        if not batch:
+                            break
+                        conn.executemany(query, batch)
+                        result.rowcounts.append(len(batch))
+                except sqlite3.Error as err:
+                    result.errors.append("%s in: %s" % (err, query))
+        if result.errors:
+            if check:
+                raise SQL_Error(result)
+            print("ERROR: " + '; '.join(result.errors))
+        return result
+
+    def insert_rows(self, table, columns, rows, batch_size=1000):
+        """
+        Insert rows in batches, see SQL_Executor.insert_rows.
+        """
+        query = "INSERT INTO %s (%s) VALUES (%s)" % (table, ", ".join(columns), ", ".join("?" * len(columns)))
+        rows, total = iter(rows), 0
+        with self.lock, self.transaction() as conn:
+            while True:
+                batch = list(islice(rows, batch_size))
+                if not batch:
+                    break
+                conn.executemany(query, batch)
+                total += len(batch)
+        return total
+
+    def read_frame(self, query):
+        with self.lock:
+            (statement,) = to_sqlite(query.strip().rstrip(';'))
+            return pd.read_sql(statement, self.connection())
+
+    def tables(self):
+        with self.lock:
+            return {name for (name,) in self.connection().execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+
+    def close(self):
+        with self.lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+
+# Executors of the supported database engines
+EXECUTORS = {'mysql': SQL_Executor, 'sqlite': SQLite_Executor}
+
+def get_executor(engine, db_name, config, pool_size=4):
+    """
+    Executor of the given engine on a database.
+    Args:
+        engine (str): One of EXECUTORS, 'mysql' for a MySQL or MemSQL server, 'sqlite' for an embedded database file.
+        db_name (str): Name of database schema the executor runs on.
+        config (config list): Config object retrieved from calling ConfigParser().read().
+        pool_size (int): Maximum number of idle connections kept open.
+    """
+    if engine not in EXECUTORS:
+        raise ValueError("Unknown engine %s, expected one of %s" % (engine, ", ".join(EXECUTORS)))
+    return EXECUTORS[engine](db_name, config, pool_size=pool_size)
+
+class Stage_Scheduler():
+    """
+    Run load stages as a dependency graph: a stage becomes ready once every stage writing one of its
+    input tables has finished, and ready stages run concurrently on a pool of worker threads.
+    Attributes:
+        stages (dict): Stage name -> (function, input tables, output tables), in preferred start order.
+        max_workers (int): Maximum number of stages running at the same time.
+    """
+    def __init__(self, stages, max_workers=1):
+        self.stages = stages
+        self.max_workers = max(1, int(max_workers))
+
+    def dependencies(self):
+        """
+        Map every stage to the stages producing its inputs. Inputs no stage produces are expected to exist already.
+        """
+        producers = {}
+        for name, (_, _, outputs) in self.stages.items():
+            for table in outputs:
+                if table in producers:
+                    raise ValueError("Table %s is written by both %s and %s" % (table, producers[table], name))
+                producers[table] = name
+        return {name: {producers[table] for table in inputs if table in producers and producers[table] != name}
+                for name, (_, inputs, _) in self.stages.items()}
+
+    def run(self, done=(), on_finished=None):
+        """
+        Execute all stages, returning the wall time of each one.
+        Args:
+            done (iterable): Names of stages that are already complete and must not run again.
+            on_finished (fun): Called with the stage name and its wall time whenever a stage finishes.
+        """
+        pending = self.dependencies()
+        finished = set(done)
+        for name in finished:
+            pending.pop(name, None)
+        elapsed = {}
+        running = {}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            while pending or running:
+                for name in list(pending):
+                    if len(running) >= self.max_workers:
+                        break
+                    if pending[name] <= finished:
+                        del pending[name]
+                        running[pool.submit(self._timed, self.stages[name][0])] = name
+                if not running:
+                    raise ValueError("Circular stage dependencies between " + ", ".join(sorted(pending)))
+
+                completed, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in completed:
+                    name = running.pop(future)
+                    try:
+                        elapsed[name] = future.result()
+                    except Exception:
+                        # Let the stages already running finish, then report the failure
+                        pending = {}
+                        wait(running)
+                        raise
+                    finished.add(name)
+                    if on_finished is not None:
+                        on_finished(name, elapsed[name])
+        return elapsed
+
+    @staticmethod
+    def _timed(function):
+        start = time.time()
+        function()
+        return time.time() - start
+
+def file_fingerprint(paths):
+    """
+    Fingerprint of a set of files from their names, sizes and modification times, so regenerated or edited
+    files are noticed without reading them.
+    Args:
+        paths (iterable): Paths of the files.
+    """
+    digest = hashlib.sha1()
+    for path in sorted(paths):
+        stat = os.stat(path)
+        digest.update(("%s|%i|%i\n" % (os.path.basename(path), stat.st_size, stat.st_mtime_ns)).encode())
+    return digest.hexdigest()
+
+class Stage_Journal():
+    """
+    Persistent journal of the completed load stages, kept in a table of the loaded database. Every stage is
+    recorded once finished with the fingerprint of the flat files it read and the row counts of the tables
+    it wrote, so an interrupted load can be resumed from the stages verified complete.
+    Attributes:
+        executor (SQL_Executor): Executor on the loaded database.
+        batch_number (int): Batch the recorded stages belong to.
+        table (str): Name of the journal table.
+    """
+    def __init__(self, executor, batch_number, table='stage_journal'):
+        self.executor = executor
+        self.batch_number = batch_number
+        self.table = table
+
+    def create(self):
+        self.executor.execute("""
+        CREATE TABLE IF NOT EXISTS %s (
+            BatchID NUMERIC(5) NOT NULL,
+            Stage VARCHAR(64) NOT NULL,
+            Fingerprint CHAR(40) NOT NULL,
+            RowCounts TEXT NOT NULL,
+            FinishedAt DATETIME NOT NULL,
+            PRIMARY KEY(BatchID, Stage)
+        );
+        """ % self.table)
+
+    def entries(self):
+        """
+        Map every stage recorded for the batch to its (fingerprint, row counts).
+        """
+        journal = self.executor.read_frame("SELECT Stage, Fingerprint, RowCounts FROM %s WHERE BatchID = %i" % (
+            self.table, self.batch_number))
+        return {stage: (fingerprint, json.loads(row_counts))
+                for stage, fingerprint, row_counts in zip(journal["Stage"], journal["Fingerprint"], journal["RowCounts"])}
+
+    def record(self, stage, fingerprint, row_counts):
+        self.executor.execute("REPLACE INTO %s VALUES (%i, '%s', '%s', '%s', NOW());" % (
+            self.table, self.batch_number, stage, fingerprint, json.dumps(row_counts, sort_keys=True)))
+
+    def forget(self, stages):
+        if stages:
+            self.executor.execute("DELETE FROM %s WHERE BatchID = %i AND Stage IN (%s);" % (
+                self.table, self.batch_number, ", ".join("'%s'" % stage for stage in stages)))
+
+    def existing_tables(self):
+        return self.executor.tables()
+
+    def later_batches(self):
+        """
+        Whether stages of a batch after this one are recorded, the batch was then complete when they started.
+        """
+        later = self.executor.read_frame("SELECT COUNT(*) AS Stages FROM %s WHERE BatchID > %i" % (
+            self.table, self.batch_number))
+        return int(later["Stages"][0]) > 0
+
+    def count_rows(self, tables, conditions=None):
+        """
+        Row count of every table, None for the tables that do not exist.
+        Args:
+            tables (list): Tables to count.
+            conditions (dict): WHERE condition of the rows counted in some of the tables, the others are counted whole.
+        """
+        conditions = conditions or {}
+        existing = {table.lower() for table in self.existing_tables()}
+        counts = {table: None for table in tables}
+        present = [table for table in tables if table.lower() in existing]
+        if present:
+            query = "SELECT " + ", ".join("(SELECT COUNT(*) FROM %s%s) AS %s" % (
+                table, " WHERE " + conditions[table] if table in conditions else "", table) for table in present)
+            row = self.executor.read_frame(query).iloc[0]
+            counts.update({table: int(row[table]) for table in present})
+        return counts
+
+def count_lines(paths):
+    """
+    Number of lines of the files, counted a block at a time.
+    Args:
+        paths (iterable): Paths of the files.
+    """
+    lines = 0
+    for path in paths:
+        with open(path, 'rb') as in_file:
+            for block in iter(partial(in_file.read, 1 << 20), b''):
+                lines += block.count(b'\n')
+    return lines
+
+def git_revision(path='.'):
+    """
+    Revision of the git checkout at path, marked '-dirty' when it has local changes. None outside a checkout.
+    """
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty', '--abbrev=12'], cwd=path,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+class Stage_Metrics():
+    """
+    Measurements of the stages of a load run, appended to a JSON lines file with one record per stage.
+    Every record is tagged with the run, the git revision of the loader and the given tags.
+    Attributes:
+        path (str): JSON lines file receiving the records.
+        tags (dict): Fields added to every record, e.g. the scale factor.
+    """
+    def __init__(self, path, **tags):
+        self.path = path
+        self.tags = dict(run=time.strftime('%Y-%m-%dT%H:%M:%S'),
+                         revision=git_revision(os.path.dirname(os.path.abspath(__file__))), **tags)
+        self.lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    def record(self, stage, **metrics):
+        line = json.dumps(dict(self.tags, stage=stage, **metrics), sort_keys=True)
+        # Stages finishing together append whole lines
+        with self.lock:
+            with open(self.path, 'a') as out_file:
+                out_file.write(line + '\n')
+
+def get_cust_phones(n, frame):
+    """
+    Format the phone number n of every customer row, e.g. '+1 (872) 523-8928' followed by the extension.
+    Args:
+        n (int): Phone number (1, 2 or 3).
+        frame (DataFrame): Rows with the C_PHONE_<n>_* columns of S_Customer.
+    """
+    c_e = frame["C_PHONE_" + str(n) + "_C_EXT"].fillna("").astype(str)
+    c_l = frame["C_PHONE_" + str(n) + "_C_LOCAL"].fillna("").astype(str)
+    c_ac = frame["C_PHONE_" + str(n) + "_C_AREA_CODE"].fillna("").astype(str)
+    c_cc = frame["C_PHONE_" + str(n) + "_C_CTRY_CODE"].fillna("").astype(str)
+
+    phone = pd.Series(np.where((c_cc != "") & (c_ac != "") & (c_l != ""), '+' + c_cc + ' (' + c_ac + ') ' + c_l,
+                      np.where((c_ac != "") & (c_l != ""), '(' + c_ac + ') ' + c_l, c_l)), index=frame.index)
+    return phone.where(c_l == "", phone + c_e)
+
+def to_day_numbers(values):
+    """
+    Convert dates, timestamps or 'YYYY-MM-DD...' strings into days since the epoch, missing values become NaT.
+    Args:
+        values (iterable): Values to convert.
+    """
+    values = pd.Series(values)
+    if values.dtype.kind == "M":
+        return values.values.astype("datetime64[D]")
+    days = [str(value)[:10] if pd.notna(value) else "NaT" for value in values.astype(object)]
+    return np.array(days, dtype="datetime64[D]")
+
+class AsOf_Lookup():
+    """
+    Point-in-time surrogate key lookup on a type 2 dimension: the versions of every natural key are kept
+    in one array sorted by (natural key, EffectiveDate), so a batch of (natural key, date) probes is
+    answered with a single vectorized binary search instead of a scan per probe.
+    Attributes:
+        keys (Index): Distinct natural keys, the position of a key is its code.
+        versions (ndarray): Sorted (key code, effective day) of every version, packed into one int64.
+        surrogate_keys (ndarray): Surrogate key of every version, in versions order.
+        end_days (ndarray): EndDate of every version, in versions order.
+    """
+    def __init__(self, natural_keys, surrogate_keys, effective_dates, end_dates=None):
+        """
+        Args:
+            natural_keys (iterable): Natural key of every version, e.g. CustomerID.
+            surrogate_keys (iterable): Surrogate key of every version, e.g. SK_CustomerID.
+            effective_dates (iterable): EffectiveDate of every version.
+            end_dates (iterable): EndDate of every version, versions are open ended when omitted.
+        """
+        codes, self.keys = pd.factorize(pd.Series(natural_keys), sort=True)
+        effective_days = to_day_numbers(effective_dates).astype(np.int64)
+        surrogate_keys = np.asarray(surrogate_keys)
+        if end_dates is None:
+            end_days = np.full(len(codes), np.iinfo(np.int64).max)
+        else:
+            end_days = to_day_numbers(end_dates)
+            end_days = np.where(np.isnat(end_days), np.iinfo(np.int64).max, end_days.astype(np.int64))
+
+        # Same day versions are ordered by surrogate key, the latest one wins a probe on that day
+        order = np.lexsort((surrogate_keys, effective_days, codes))
+        self.first_day = effective_days.min() if len(codes) else 0
+        self.width = (effective_days.max() - self.first_day + 2) if len(codes) else 1
+        self.codes = codes[order]
+        self.versions = self._pack(self.codes, effective_days[order])
+        self.surrogate_keys = surrogate_keys[order]
+        self.end_days = end_days[order]
+
+    def _pack(self, codes, days):
+        # Day offsets start at 1, a probe before the first version packs to offset 0 and finds nothing
+        return codes.astype(np.int64) * self.width + np.clip(days - self.first_day + 1, 0, self.width - 1)
+
+    def lookup(self, natural_keys, dates, default=-1):
+        """
+        Find the surrogate key of the version of every natural key in effect on the matching date.
+        Args:
+            natural_keys (iterable): Natural keys to probe.
+            dates (iterable): Date of every probe.
+            default (int): Surrogate key returned for probes with no version in effect.
+        """
+        codes = self.keys.get_indexer(pd.Series(natural_keys))
+        if not len(self.versions):
+            return np.full(len(codes), default)
+        days = to_day_numbers(dates)
+        missing = np.isnat(days)
+        days = np.where(missing, 0, days.astype(np.int64))
+
+        found = np.searchsorted(self.versions, self._pack(codes, days), side="right") - 1
+        valid = (codes >= 0) & ~missing & (found >= 0)
+        found = np.where(valid, found, 0)
+        valid &= (self.codes[found] == codes) & (self.end_days[found] > days)
+        return np.where(valid, self.surrogate_keys[found], default)
+
+class Column_Builder():
+    """
+    Accumulate rows into preallocated NumPy column arrays, doubling their capacity whenever they are full,
+    so rows can be appended and earlier rows patched in place at constant cost.
+    Attributes:
+        columns (dict): Column name -> array holding the values of that column.
+        size (int): Number of rows appended so far.
+    """
+    def __init__(self, dtypes, capacity=1024):
+        self.columns = {name: np.empty(max(1, capacity), dtype=dtype) for name, dtype in dtypes.items()}
+        self.size = 0
+
+    def append(self, row):
+        """
+        Append a row given as a dict over all the columns and return its position.
+        """
+        for name, values in self.columns.items():
+            if self.size == len(values):
+                values = self.columns[name] = np.concatenate([values, np.empty_like(values)])
+            values[self.size] = row[name]
+        self.size += 1
+        return self.size - 1
+
+    def row(self, position):
+        return {name: values[position] for name, values in self.columns.items()}
+
+    def frame(self):
+        return pd.DataFrame({name: values[:self.size] for name, values in self.columns.items()})
+
+def to_load_data_row(fields, delimiter='|'):
+    """
+    Serialize fields into one line of a flat file read by LOAD DATA INFILE.
+    The escape character, delimiter and line breaks are escaped and None is written as NULL.
+    Args:
+        fields (list): Values of the row in table column order.
+        delimiter (str): Character used to limit a field entries to other fields.
+    """
+    return delimiter.join('\\N' if field is None else str(field).replace('\\', '\\\\')
+                          .replace(delimiter, '\\' + delimiter).replace('\n', '\\n') for field in fields) + '\n'
+
+def to_load_data_block(columns, delimiter=b'|'):
+    """
+    Vectorized counterpart of to_load_data_row: serialize equally long bytes columns into flat file lines.
+    Args:
+        columns (list): NumPy bytes arrays in table column order.
+        delimiter (bytes): Character used to limit a field entries to other fields.
+    """
+    if not columns or len(columns[0]) == 0:
+        return b''
+    lines = None
+    for column in columns:
+        column = np.char.replace(column, b'\\', b'\\\\')
+        column = np.char.replace(column, delimiter, b'\\' + delimiter)
+        column = np.char.replace(column, b'\n', b'\\n')
+        lines = column if lines is None else np.char.add(np.char.add(lines, delimiter), column)
+    return b'\n'.join(lines.tolist()) + b'\n'
+
+def write_chunks(path, chunks):
+    with open(path, 'wb') as out_file:
+        for chunk in chunks:
+            out_file.write(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+
+def iter_file_chunks(paths, chunk_size=1 << 20):
+    """
+    Read files one after the other as a stream of bytes chunks.
+    """
+    for path in paths:
+        with open(path, 'rb') as in_file:
+            for chunk in iter(lambda: in_file.read(chunk_size), b''):
+                yield chunk
+
+def to_load_data_value(value):
+    if value is None or value is pd.NaT or (isinstance(value, float) and np.isnan(value)):
+        return None
+    if isinstance(value, (bool, np.bool_)):
+        return '1' if value else '0'
+    if isinstance(value, pd.Timestamp):
+        return value.strftime('%Y-%m-%d' if value == value.normalize() else '%Y-%m-%d %H:%M:%S')
+    return str(value)
+
+def to_load_data_frame(frame, delimiter='|'):
+    """
+    Vectorized counterpart of to_load_data_row for a DataFrame: serialize every row into a flat file line.
+    Booleans become 1/0, floats holding whole numbers are written as integers, dates as YYYY-MM-DD
+    and missing values (None, NaN, NaT) as NULL.
+    Args:
+        frame (DataFrame): Rows to serialize, columns in the order they are loaded.
+        delimiter (str): Character used to limit a field entries to other fields.
+    """
+    if frame.empty:
+        return ''
+    fields = []
+    for name in frame.columns:
+        column = frame[name]
+        missing = column.isna()
+        if pd.api.types.is_bool_dtype(column):
+            text = column.map({True: '1', False: '0'})
+        elif pd.api.types.is_integer_dtype(column):
+            text = column.astype(str)
+        elif pd.api.types.is_float_dtype(column):
+            present = column[~missing]
+            if (present == np.floor(present)).all() and (present.abs() < 2 ** 53).all():
+                text = column.fillna(0).astype(np.int64).astype(str)
+            else:
+                text = column.map(repr)
+        elif pd.api.types.is_datetime64_any_dtype(column):
+            whole_days = (column[~missing] == column[~missing].dt.normalize()).all()
+            text = column.dt.strftime('%Y-%m-%d' if whole_days else '%Y-%m-%d %H:%M:%S')
+        else:
+            text = column.astype(object).map(to_load_data_value)
+            missing = text.isna()
+        text = text.astype(object).where(~missing, '')
+        text = text.str.replace('\\', '\\\\', regex=False).str.replace(delimiter, '\\' + delimiter, regex=False) \
+            .str.replace('\n', '\\n', regex=False)
+        fields.append(text.where(~missing, '\\N'))
+    lines = fields[0].str.cat(fields[1:], sep=delimiter) if len(fields) > 1 else fields[0]
+    return '\n'.join(lines.tolist()) + '\n'
+
+# Schemas of the flat files read on the Python side
+TRADE_SCHEMA = [Column("T_ID", 'int', False), Column("T_DTS", 'str', False), Column("T_ST_ID", 'str', False),
+                Column("T_TT_ID", 'str', False), Column("T_IS_CASH", 'int'), Column("T_S_SYMB", 'str', False),
+                Column("T_QTY", 'int'), Column("T_BID_PRICE", 'float'), Column("T_CA_ID", 'int', False),
+                Column("T_EXEC_NAME", 'str', False), Column("T_TRADE_PRICE", 'float'), Column("T_CHRG", 'float'),
+                Column("T_COMM", 'float'), Column("T_TAX", 'float')]
+TRADE_HISTORY_SCHEMA = [Column("TH_T_ID", 'int', False), Column("TH_DTS", 'str', False), Column("TH_ST_ID", 'str', False)]
+CASH_TRANSACTION_SCHEMA = [Column("CT_CA_ID", 'int', False), Column("CT_DTS", 'date', False),
+                           Column("CT_AMT", 'float', False), Column("CT_NAME", 'str')]
+WATCH_HISTORY_SCHEMA = [Column("W_C_ID", 'int', False), Column("W_S_SYMB", 'str', False), Column("W_DTS", 'date', False),
+                        Column("W_ACTION", 'str', False)]
+
+# Files of the incremental batches start every record with its change data capture flag (I or U) and sequence number
+CDC_SCHEMA = [Column("CDC_FLAG", 'str', False), Column("CDC_DSN", 'int', False)]
+# Customer fields are named after their S_Customer columns, so the customer helpers apply to both
+CUSTOMER_CDC_SCHEMA = CDC_SCHEMA + [
+    Column("C_ID", 'int', False), Column("C_TAX_ID", 'str', False), Column("C_ST_ID", 'str', False),
+    Column("C_L_NAME", 'str', False), Column("C_F_NAME", 'str', False), Column("C_M_NAME", 'str'),
+    Column("C_GNDR", 'str'), Column("C_TIER", 'int'), Column("C_DOB", 'str', False), Column("C_ADLINE1", 'str', False),
+    Column("C_ADLINE2", 'str'), Column("C_ZIPCODE", 'str', False), Column("C_CITY", 'str', False),
+    Column("C_STATE_PROV", 'str', False), Column("C_CTRY", 'str')] + [
+    Column("C_PHONE_%i_%s" % (n, part), 'str') for n in (1, 2, 3)
+    for part in ("C_CTRY_CODE", "C_AREA_CODE", "C_LOCAL", "C_EXT")] + [
+    Column("C_PRIM_EMAIL", 'str'), Column("C_ALT_EMAIL", 'str'), Column("C_LCL_TX_ID", 'str'), Column("C_NAT_TX_ID", 'str')]
+ACCOUNT_CDC_SCHEMA = CDC_SCHEMA + [Column("CA_ID", 'int', False), Column("CA_B_ID", 'int', False),
+                                   Column("CA_C_ID", 'int', False), Column("CA_NAME", 'str'),
+                                   Column("CA_TAX_ST", 'int'), Column("CA_ST_ID", 'str', False)]
+TRADE_CDC_SCHEMA = CDC_SCHEMA + TRADE_SCHEMA
+CASH_TRANSACTION_CDC_SCHEMA = CDC_SCHEMA + CASH_TRANSACTION_SCHEMA
+WATCH_HISTORY_CDC_SCHEMA = CDC_SCHEMA + WATCH_HISTORY_SCHEMA
+
+def batch_numbers(base_dir):
+    """
+    Numbers of the BatchN directories generated in base_dir, in load order: the historical batch then the increments.
+    Args:
+        base_dir (str): Directory holding the generated flat files of one scale factor.
+    """
+    return sorted(int(name[5:]) for name in os.listdir(base_dir)
+                  if re.fullmatch(r"Batch\d+", name) and os.path.isdir(os.path.join(base_dir, name)))
+
+def iter_trade_lifecycles(joined):
+    """
+    Fold the history events of every trade into one finished trade, in a single pass over the trades joined
+    with their history and grouped by trade id. A trade is created when it becomes pending (or is submitted,
+    for market orders) and closed when it is completed or canceled.
+    Args:
+        joined (iterable): TRADE_SCHEMA fields followed by the TRADE_HISTORY_SCHEMA fields of one event.
+    Yields the TRADE_SCHEMA fields of every trade followed by its create and close timestamps (None when missing).
+    """
+    width = len(TRADE_SCHEMA)
+    trade, created, closed = None, None, None
+    for row in joined:
+        if trade is None or row[0] != trade[0]:
+            if trade is not None:
+                yield trade + [created, closed]
+            trade, created, closed = row[:width], None, None
+        event_ts, status = row[width + 1], row[width + 2]
+        if status == 'PNDG' or (status == 'SBMT' and trade[3] in ('TMB', 'TMS')):
+            created = event_ts
+        elif status in ('CMPT', 'CNCL'):
+            closed = event_ts
+    if trade is not None:
+        yield trade + [created, closed]
+
+# Join key of empty fields, sorting before every other key. It only orders the rows, merge_join never matches it
+NULL_KEY = (0,)
+
+def join_key(value, key_type):
+    """
+    Comparable key of a join column value. Empty fields, '' in a raw line or None once converted, map to
+    NULL_KEY sorting before the (1, key_type(value)) of every other value, so sorting raw lines and
+    merging converted rows order the keys alike.
+    """
+    if value is None or value == '':
+        return NULL_KEY
+    return (1, key_type(value))
+
+def line_key(transformer, col_idx, key_type, line):
+    """
+    Sort key of a line: the join_key of its col_idx column, extracted without transforming the rest of the line
+    when possible.
+    """
+    if hasattr(transformer, 'column'):
+        return join_key(transformer.column(line, col_idx), key_type)
+    return join_key(transformer.transofrm(line)[col_idx], key_type)
+
+def sort_run(lines, path, key):
+    """
+    Sort lines in memory, every key being computed once, and write them as a sorted run file.
+    """
+    lines.sort(key=key)
+    with open(path, 'w') as run_file:
+        run_file.writelines(lines)
+    return path
+
+def merge_runs(paths, output_file, key):
+    # Credit: https://stackoverflow.com/questions/23450145/sort-a-big-file-with-python-heapq-merge
+    with ExitStack() as stack, open(output_file, 'w') as sorted_file:
+        files = [stack.enter_context(open(path)) for path in paths]
+        sorted_file.writelines(merge(*files, key=key))
+
+def external_sort(input_file, transformer, col_idx, max_chunk_size=None, output_file=None,
+                  memory_budget=256 << 20, max_open_files=64, workers=1, key_type=None):
+    """
+    Sort file based on col_idx outside main memory. The input is cut into runs that fit the memory budget,
+    every run is sorted in memory and the runs are merged, several passes being used when there are more
+    runs than files allowed open at once.
     Args:
         input_file (str): Path to the input file.
         transformer (obj): Instance of a row-to-list transformer class.
         col_idx (int): Index of the list column used for sorting.
-        max_chunk_size (int): Maximum number of lines contained in a chunk file.
+        max_chunk_size (int): Maximum number of lines contained in a run, None to only limit runs by memory.
+        output_file (str): Path receiving the sorted file, None to sort the input file in place.
+        memory_budget (int): Approximate number of bytes of lines held in memory at once.
+        max_open_files (int): Maximum number of runs merged at once.
+        workers (int): Number of processes sorting runs, the budget is shared between the runs in flight.
+        key_type (type): Conversion applied to the sort column, e.g. int to sort numerically. Defaults to the
+            type of the column in the transformer schema.
         #on_finished (fun): Function to be executed with the outputfile as parameter when the sorting is finished.
 
-    WARNING: This will perform inplace operation, sorted version of the file will be written in the input file
-    """
-
-    chunk = []
-    chunk_names = []
-    counter = 0
-    with open(input_file) as f, tempfile.TemporaryDirectory() as tmpdirname:
-        # Split input to multiple files
-        for line in f:
-            chunk.append(transformer.transofrm(line))
-            if (len(chunk)==max_chunk_size or (not line.endswith('\n'))):
- 
-                chunk_name = 'chunk_{}.chk'.format(counter)
-                chunk = sorted(chunk, key=lambda row: row[col_idx], reverse=False)
-                chunk_names.append(os.path.join(tmpdirname, chunk_name))
-                with open(os.path.join(tmpdirname, chunk_name), 'w') as split_file:
-                    for chunk_line in chunk:
-                        original_line = transformer.inverse_transform(chunk_line)
-                        if not original_line.endswith('\n'):
-                            original_line=original_line+'\n'
-                        split_file.write(original_line)
-                chunk = []
-                counter +=1  
-        if len(chunk)>0:
-            chunk_name = 'chunk_{}.chk'.format(counter)
-            chunk = sorted(chunk, key=lambda row: row[col_idx], reverse=False)
-            chunk_names.append(os.path.join(tmpdirname, chunk_name))
-            with open(os.path.join(tmpdirname, chunk_name), 'w') as split_file:
-                for chunk_line in chunk:
-                    original_line = transformer.inverse_transform(chunk_line)
-                    if not original_line.endswith('\n'):
-                        original_line=original_line+'\n'
-                    split_file.write(original_line)              
-        # Merge        
-        # Credit: https://stackoverflow.com/questions/23450145/sort-a-big-file-with-python-heapq-merge
-        with ExitStack() as stack, open(input_file, 'w') as output_file:
-            files = [stack.enter_context(open(chunk)) for chunk in chunk_names]
-            output_file.writelines(merge(*files, key=lambda row: transformer.transofrm(row)[col_idx]))
-        return input_file
-
-def sort_merge_join(left, right, left_on, right_on, left_trf, right_trf):
-    sorted_left = external_sort(input_file=left,
-                                transformer = left_trf, 
-                                col_idx=left_on)
-
-    # Sort right, get iterator of sorted_right
-    sorted_right = external_sort(input_file=right,
-                                transformer = right_trf, 
-                                col_idx=right_on)
-
-    with open (sorted_left) as sorted_left_file, open(sorted_right) as sorted_right_file:  
-        curr_l_value = left_trf.transofrm(next(sorted_left_file))
-        curr_r_value = right_trf.transofrm(next(sorted_right_file))
-        try:
-            while(True):
-                if curr_l_value[left_on]<curr_r_value[right_on]:
-                    curr_l_value = left_trf.transofrm(next(sorted_left_file))
-                elif curr_l_value[left_on]>curr_r_value[right_on]:
-                    curr_r_value = right_trf.transofrm(next(sorted_right_file))
-                elif curr_l_value[left_on] == curr_r_value[right_on]:
-                    yield (curr_l_value + curr_l_value)
-                    curr_l_value = left_trf.transofrm(next(sorted_left_file))
-        except StopIteration:
-            pass
+    WARNING: Without output_file this will perform inplace operation, sorted version of the file will be written in the input file
+    """
+    output_file = output_file or input_file
+    key = partial(line_key, transformer, col_idx, key_type or transformer.key_type(col_idx))
+    max_open_files = max(2, max_open_files)
+    run_budget = memory_budget // (workers + 1 if workers > 1 else 1)
+    runs = []
+
+    with tempfile.TemporaryDirectory() as tmpdirname, ExitStack() as stack:
+        pool = stack.enter_context(ProcessPoolExecutor(max_workers=workers)) if workers > 1 else None
+        sorting = []
+
+        def flush(lines):
+            runs.append(os.path.join(tmpdirname, 'run_{}.srt'.format(len(runs))))
+            if pool is None:
+                sort_run(lines, runs[-1], key)
+                return
+            # Keep at most one run per worker in flight, so memory stays within the budget
+            sorting.append(pool.submit(sort_run, lines, runs[-1], key))
+            if len(sorting) >= workers:
+                sorting.pop(0).result()
+
+        # Split input to sorted runs
+        chunk = []
+        chunk_bytes = 0
+        with open(input_file) as f:
+            for line in f:
+                if not line.endswith('\n'):
+                    line += '\n'
+                chunk.append(line)
+                chunk_bytes += sys.getsizeof(line) + 64
+                if chunk_bytes >= run_budget or len(chunk) == max_chunk_size:
+                    flush(chunk)
+                    chunk = []
+                    chunk_bytes = 0
+        if chunk or not runs:
+            flush(chunk)
+        for future in sorting:
+            future.result()
+
+        # Merge at most max_open_files runs at a time until one pass can produce the output
+        merge_pass = 0
+        while len(runs) > max_open_files:
+            merged = []
+            for start in range(0, len(runs), max_open_files):
+                group = runs[start:start + max_open_files]
+                if len(group) == 1:
+                    merged.extend(group)
+                    continue
+                merged.append(os.path.join(tmpdirname, 'merge_{}_{}.srt'.format(merge_pass, len(merged))))
+                merge_runs(group, merged[-1], key)
+                for path in group:
+                    os.remove(path)
+            runs = merged
+            merge_pass += 1
+        merge_runs(runs, output_file, key)
+        return output_file
+
+def merge_join(left_rows, right_rows, left_key, right_key, how='inner', right_width=None):
+    """
+    Join two streams of rows sorted by their keys in one pass. Rows sharing a key are grouped, so one-to-many
+    and many-to-many keys are supported, only the right rows of the current key are held in memory. Like SQL NULLs,
+    rows keyed NULL_KEY match nothing.
+    Args:
+        left_rows (iterable), right_rows (iterable): Rows as lists, sorted by key.
+        left_key (fun), right_key (fun): Extract the comparable key of a row of each side.
+        how (str): 'inner' yields left + right rows of every match, 'left' also yields unmatched left rows
+            padded with None, 'semi' yields every left row having at least one match.
+        right_width (int): Number of right columns padded for unmatched left rows, the width of the first right
+            row by default. A left join of an empty right side requires it.
+    """
+    if how not in ('inner', 'left', 'semi'):
+        raise ValueError("Unsupported join type " + str(how))
+
+    right_rows = iter(right_rows)
+    first = next(right_rows, None)
+    if first is None:
+        if how == 'left' and right_width is None:
+            raise ValueError("Left join of an empty right side needs its right_width")
+        rights = iter(())
+    else:
+        right_width = len(first) if right_width is None else right_width
+        rights = groupby(chain([first], right_rows), key=right_key)
+
+    right = next(rights, None)
+    for key, left_group in groupby(left_rows, key=left_key):
+        while right is not None and right[0] < key:
+            right = next(rights, None)
+        if right is not None and right[0] == key and key != NULL_KEY:
+            matches = list(right[1])
+            right = next(rights, None)
+        else:
+            matches = []
+
+        for left_row in left_group:
+            if how == 'semi':
+                if matches:
+                    yield left_row
+            elif matches:
+                for right_row in matches:
+                    yield left_row + right_row
+            elif how == 'left':
+                yield left_row + [None] * right_width
+
+def sort_merge_join(left, right, left_on, right_on, left_trf, right_trf, how='inner', key_type=None,
+                    presorted=False, memory_budget=256 << 20, workers=1):
+    """
+    Join two flat files on one column each by sorting them outside main memory and merging them with merge_join,
+    yielding the joined rows (as lists) in key order.
+    Args:
+        left (str), right (str): Paths to the flat files, they are left untouched.
+        left_on (int), right_on (int): Index of the join column in the rows of each file.
+        left_trf (obj), right_trf (obj): Row-to-list transformers of each file.
+        how (str): 'inner', 'left' or 'semi', see merge_join.
+        key_type (type): Conversion applied to the join columns before comparing them, e.g. int. Defaults to the
+            type of the join column in the left transformer schema.
+        presorted (bool): The files are already sorted on their join column by key_type, skip sorting them.
+        memory_budget (int): Approximate number of bytes of lines each sort holds in memory.
+        workers (int): Number of processes sorting runs.
+    """
+    key_type = key_type or left_trf.key_type(left_on)
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        if not presorted:
+            left = external_sort(input_file=left,
+                                 transformer = left_trf,
+                                 col_idx=left_on,
+                                 output_file=os.path.join(tmpdirname, 'left.srt'),
+                                 memory_budget=memory_budget, workers=workers, key_type=key_type)
+
+            # Sort right, get iterator of sorted_right
+            right = external_sort(input_file=right,
+                                  transformer = right_trf,
+                                  col_idx=right_on,
+                                  output_file=os.path.join(tmpdirname, 'right.srt'),
+                                  memory_budget=memory_budget, workers=workers, key_type=key_type)
+
+        with open(left) as left_file, open(right) as right_file:
+            yield from merge_join((left_trf.transofrm(line) for line in left_file),
+                                  (right_trf.transofrm(line) for line in right_file),
+                                  lambda row: join_key(row[left_on], key_type), lambda row: join_key(row[right_on], key_type),
+                                  how=how, right_width=len(right_trf.schema) if right_trf.schema else None)
 
   
\ No newline at end of file